@@ -1,7 +1,12 @@
+import inspect
+
+import torch
 from torch import nn
 
 from alphapose.utils import Registry, build_from_cfg, retrieve_from_cfg
 
+from .onnx_backend import is_onnx_file
+
 
 SPPE = Registry('sppe')
 LOSS = Registry('loss')
@@ -18,13 +23,47 @@ def build(cfg, registry, default_args=None):
         return build_from_cfg(cfg, registry, default_args)
 
 
-def build_sppe(cfg, preset_cfg, **kwargs):
+def build_sppe(cfg, preset_cfg, checkpoint=None, device='cpu', **kwargs):
+    """Build a pose model.
+
+    With a checkpoint (path or state dict) the model is built for inference:
+    the ImageNet backbone init is skipped, parameters are allocated on the
+    meta device and the checkpoint tensors, loaded onto `device`, become the
+    parameters without an intermediate copy. Int8 checkpoints written by
+    scripts/quantize.py come back as the quantized cpu model, .onnx files
+    written by scripts/export_onnx.py as an ONNX Runtime cpu session.
+    """
     default_args = {
         'PRESET': preset_cfg,
     }
     for key, value in kwargs.items():
         default_args[key] = value
-    return build(cfg, SPPE, default_args=default_args)
+    if checkpoint is None:
+        return build(cfg, SPPE, default_args=default_args)
+
+    if is_onnx_file(checkpoint):
+        from .onnx_backend import OnnxModel
+        return OnnxModel(checkpoint)
+
+    default_args['IMAGENET_INIT'] = False
+    state = torch.load(checkpoint, map_location=device) if isinstance(checkpoint, str) else checkpoint
+    if isinstance(state, dict) and 'quantization' in state:
+        # int8 checkpoint of scripts/quantize.py, cpu only
+        from .quantize import load_quantized
+        return load_quantized(build(cfg, SPPE, default_args=default_args), state)
+    if 'assign' not in inspect.signature(nn.Module.load_state_dict).parameters:
+        # torch < 2.1, no meta device construction
+        model = build(cfg, SPPE, default_args=default_args)
+        model.load_state_dict(state)
+        return model.to(device)
+
+    with torch.device('meta'):
+        model = build(cfg, SPPE, default_args=default_args)
+    model.load_state_dict(state, assign=True)
+    missing = [name for name, t in list(model.named_parameters()) + list(model.named_buffers()) if t.is_meta]
+    if missing:
+        raise RuntimeError('Tensors not in the checkpoint: {}'.format(', '.join(missing)))
+    return model
 
 
 def build_loss(cfg):
@@ -31,13 +31,15 @@ class FastPose(nn.Module):
         # Imagenet pretrain model
         import torchvision.models as tm   # noqa: F401,F403
         assert cfg['NUM_LAYERS'] in [18, 34, 50, 101, 152]
-        x = eval(f"tm.resnet{cfg['NUM_LAYERS']}(pretrained=True)")
+        # skipped when the weights come from a checkpoint, see builder.build_sppe
+        if cfg.get('IMAGENET_INIT', True):
+            x = eval(f"tm.resnet{cfg['NUM_LAYERS']}(pretrained=True)")
 
-        model_state = self.preact.state_dict()
-        state = {k: v for k, v in x.state_dict().items()
-                 if k in self.preact.state_dict() and v.size() == self.preact.state_dict()[k].size()}
-        model_state.update(state)
-        self.preact.load_state_dict(model_state)
+            model_state = self.preact.state_dict()
+            state = {k: v for k, v in x.state_dict().items()
+                     if k in self.preact.state_dict() and v.size() == self.preact.state_dict()[k].size()}
+            model_state.update(state)
+            self.preact.load_state_dict(model_state)
 
         self.suffle1 = nn.PixelShuffle(2)
         self.duc1 = DUC(512, 1024, upscale_factor=2, norm_layer=norm_layer)
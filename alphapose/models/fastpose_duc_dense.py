@@ -47,25 +47,27 @@ class FastPose_DUC_Dense(nn.Module):
                 nn.init.uniform_(m.weight, 0, 1)
                 nn.init.constant_(m.bias, 0)
 
-        # Imagenet pretrain model
+        # Imagenet pretrain model, skipped when the weights come from a checkpoint
         import torchvision.models as tm
+        imagenet_init = cfg.get('IMAGENET_INIT', True)
         if cfg['NUM_LAYERS'] == 152:
             ''' Load pretrained model '''
-            x = tm.resnet152(pretrained=True)
+            x = tm.resnet152(pretrained=imagenet_init)
         elif cfg['NUM_LAYERS'] == 101:
             ''' Load pretrained model '''
-            x = tm.resnet101(pretrained=True)
+            x = tm.resnet101(pretrained=imagenet_init)
         elif cfg['NUM_LAYERS'] == 50:
-            x = tm.resnet50(pretrained=True)
+            x = tm.resnet50(pretrained=imagenet_init)
         elif cfg['NUM_LAYERS'] == 18:
-            x = tm.resnet18(pretrained=True)
+            x = tm.resnet18(pretrained=imagenet_init)
         else:
             raise NotImplementedError
-        model_state = self.preact.state_dict()
-        state = {k: v for k, v in x.state_dict().items()
-                 if k in self.preact.state_dict() and v.size() == self.preact.state_dict()[k].size()}
-        model_state.update(state)
-        self.preact.load_state_dict(model_state)
+        if imagenet_init:
+            model_state = self.preact.state_dict()
+            state = {k: v for k, v in x.state_dict().items()
+                     if k in self.preact.state_dict() and v.size() == self.preact.state_dict()[k].size()}
+            model_state.update(state)
+            self.preact.load_state_dict(model_state)
         self.norm_layer = norm_layer
 
         stage1_cfg = cfg['STAGE1']
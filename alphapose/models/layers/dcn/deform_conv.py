@@ -2,11 +2,86 @@ import math
 
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 from torch.autograd import Function
 from torch.autograd.function import once_differentiable
 from torch.nn.modules.utils import _pair
 
-from . import deform_conv_cuda
+try:
+    from . import deform_conv_cuda
+except ImportError:
+    # CPU-only builds, forward falls back to deform_conv2d_cpu
+    deform_conv_cuda = None
+
+
+def _deform_im2col(input, offset, mask, kernel_size, stride, padding, dilation,
+                   deformable_groups):
+    """Bilinear sampled columns (N, C * kh * kw, Ho * Wo) of a deformable conv.
+
+    grid_sample with zero padding samples like the cuda kernels: corners of
+    the bilinear patch that fall outside the image contribute zero.
+    """
+    n, c, height, width = input.shape
+    kh, kw = kernel_size
+    ho, wo = offset.shape[2:]
+    k = kh * kw
+    dg = deformable_groups
+    offset = offset.view(n, dg, k, 2, ho, wo)
+
+    ky = torch.arange(kh, dtype=input.dtype, device=input.device).repeat_interleave(kw)
+    kx = torch.arange(kw, dtype=input.dtype, device=input.device).repeat(kh)
+    oy = torch.arange(ho, dtype=input.dtype, device=input.device)
+    ox = torch.arange(wo, dtype=input.dtype, device=input.device)
+    # (N, dg, k, ho, wo) sampling positions in pixels per kernel tap
+    h = (oy * stride[0] - padding[0]).view(1, ho, 1) + (ky * dilation[0]).view(k, 1, 1) + offset[:, :, :, 0]
+    w = (ox * stride[1] - padding[1]).view(1, 1, wo) + (kx * dilation[1]).view(k, 1, 1) + offset[:, :, :, 1]
+    # pixel -> [-1, 1] for align_corners=False, valid for any map size
+    grid = torch.stack(((2 * w + 1) / width - 1, (2 * h + 1) / height - 1), dim=-1)
+
+    cols = F.grid_sample(input.reshape(n * dg, c // dg, height, width),
+                         grid.view(n * dg, k * ho, wo, 2), mode='bilinear',
+                         padding_mode='zeros', align_corners=False)
+    # (N * dg, C / dg, k * ho, wo) is already the (C, k, ho * wo) column order
+    cols = cols.view(n, dg, c // dg, k, ho * wo)
+    if mask is not None:
+        cols = cols * mask.reshape(n, dg, 1, k, ho * wo)
+    return cols.view(n, c * k, ho * wo)
+
+
+def deform_conv2d_cpu(input, offset, mask, weight, bias=None, stride=1, padding=0,
+                      dilation=1, groups=1, deformable_groups=1, im2col_step=64):
+    """(Modulated) deformable convolution with torch ops, bilinear im2col + batched GEMM.
+
+    mask=None gives the plain DeformConv. Works on any device, it is the
+    path taken for cpu tensors and for onnx export. im2col_step=None skips
+    the batch chunking.
+    """
+    stride, padding, dilation = _pair(stride), _pair(padding), _pair(dilation)
+    n = input.size(0)
+    out_channels, _, kh, kw = weight.shape
+    ho, wo = offset.shape[2:]
+    # (groups, O / groups, C / groups * kh * kw)
+    weight = weight.reshape(groups, out_channels // groups, -1)
+    if im2col_step is None:
+        # whole batch at once, keeps the batch size out of traced graphs
+        cols = _deform_im2col(input, offset, mask, (kh, kw), stride, padding, dilation, deformable_groups)
+        cols = cols.view(n, groups, -1, ho * wo)
+        output = torch.matmul(weight, cols).view(n, out_channels, ho, wo)
+        if bias is not None:
+            output = output + bias.view(1, -1, 1, 1)
+        return output
+    outputs = []
+    for start in range(0, n, im2col_step):
+        end = min(start + im2col_step, n)
+        cols = _deform_im2col(input[start:end], offset[start:end],
+                              None if mask is None else mask[start:end],
+                              (kh, kw), stride, padding, dilation, deformable_groups)
+        cols = cols.view(end - start, groups, -1, ho * wo)
+        outputs.append(torch.matmul(weight, cols).view(end - start, out_channels, ho, wo))
+    output = torch.cat(outputs) if len(outputs) > 1 else outputs[0]
+    if bias is not None:
+        output = output + bias.view(1, -1, 1, 1)
+    return output
 
 
 class DeformConvFunction(Function):
@@ -35,15 +110,18 @@ class DeformConvFunction(Function):
 
         ctx.save_for_backward(input, offset, weight)
 
-        output = input.new_empty(
-            DeformConvFunction._output_size(input, weight, ctx.padding,
-                                            ctx.dilation, ctx.stride))
-
-        ctx.bufs_ = [input.new_empty(0), input.new_empty(0)]  # columns, ones
-
         if not input.is_cuda:
-            raise NotImplementedError
+            output = deform_conv2d_cpu(
+                input, offset, None, weight, None, ctx.stride, ctx.padding,
+                ctx.dilation, ctx.groups, ctx.deformable_groups,
+                ctx.im2col_step)
         else:
+            output = input.new_empty(
+                DeformConvFunction._output_size(input, weight, ctx.padding,
+                                                ctx.dilation, ctx.stride))
+
+            ctx.bufs_ = [input.new_empty(0), input.new_empty(0)]  # columns, ones
+
             cur_im2col_step = min(ctx.im2col_step, input.shape[0])
             assert (input.shape[0] %
                     cur_im2col_step) == 0, 'im2col step must divide batchsize'
@@ -130,10 +208,12 @@ class ModulatedDeformConvFunction(Function):
         ctx.groups = groups
         ctx.deformable_groups = deformable_groups
         ctx.with_bias = bias is not None
+        if not input.is_cuda:
+            return deform_conv2d_cpu(
+                input, offset, mask, weight, bias, ctx.stride, ctx.padding,
+                ctx.dilation, ctx.groups, ctx.deformable_groups)
         if not ctx.with_bias:
             bias = input.new_empty(1)  # fake tensor
-        if not input.is_cuda:
-            raise NotImplementedError
         if weight.requires_grad or mask.requires_grad or offset.requires_grad \
                 or input.requires_grad:
             ctx.save_for_backward(input, offset, mask, weight, bias)
@@ -183,8 +263,23 @@ class ModulatedDeformConvFunction(Function):
         return n, channels_out, height_out, width_out
 
 
-deform_conv = DeformConvFunction.apply
-modulated_deform_conv = ModulatedDeformConvFunction.apply
+def deform_conv(input, offset, weight, stride=1, padding=0, dilation=1,
+                groups=1, deformable_groups=1, im2col_step=64):
+    if torch.onnx.is_in_onnx_export():
+        # exported as GridSample + MatMul, autograd Functions have no onnx symbolic
+        return deform_conv2d_cpu(input, offset, None, weight, None, stride, padding,
+                                 dilation, groups, deformable_groups, im2col_step=None)
+    return DeformConvFunction.apply(input, offset, weight, stride, padding, dilation,
+                                    groups, deformable_groups, im2col_step)
+
+
+def modulated_deform_conv(input, offset, mask, weight, bias=None, stride=1, padding=0,
+                          dilation=1, groups=1, deformable_groups=1):
+    if torch.onnx.is_in_onnx_export():
+        return deform_conv2d_cpu(input, offset, mask, weight, bias, stride, padding,
+                                 dilation, groups, deformable_groups, im2col_step=None)
+    return ModulatedDeformConvFunction.apply(input, offset, mask, weight, bias, stride,
+                                             padding, dilation, groups, deformable_groups)
 
 
 class DeformConv(nn.Module):
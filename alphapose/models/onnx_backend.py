@@ -0,0 +1,65 @@
+"""ONNX export and an ONNX Runtime backend for the pose and detector models.
+
+export_onnx writes a model with a dynamic batch axis, the spatial size is
+fixed to the one of the example input. OnnxModel runs the exported graph
+with the cpu execution provider behind the nn.Module call of the model it
+was exported from, so it drops in for the pose model (build_sppe with a
+.onnx checkpoint) and for the detector networks (ONNX entry of the
+detector cfg). Box decoding is part of the exported detector graphs; NMS
+stays in the detector API classes.
+"""
+import inspect
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+ONNX_OPSET = 16  # GridSample, for the deformable convs
+
+
+def is_onnx_file(path):
+    return isinstance(path, str) and path.lower().endswith('.onnx')
+
+
+def export_onnx(model, example_input, path, output_names=('output',), opset=ONNX_OPSET):
+    """Export model(example_input) to path, with a dynamic batch axis on every input and output."""
+    model.eval()
+    kwargs = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        # the torchscript exporter, the dynamo one needs onnxscript
+        kwargs['dynamo'] = False
+    dynamic_axes = {name: {0: 'batch'} for name in ('input',) + tuple(output_names)}
+    with torch.no_grad():
+        torch.onnx.export(model, (example_input,), path, input_names=['input'],
+                          output_names=list(output_names), dynamic_axes=dynamic_axes,
+                          opset_version=opset, do_constant_folding=True, **kwargs)
+
+
+class OnnxModel(nn.Module):
+    """ONNX Runtime session called like the torch model it replaces.
+
+    Extra call arguments of the torch model (e.g. the args of Darknet) are
+    ignored. Outputs come back as float tensors on the device of the input.
+    """
+
+    def __init__(self, path, num_threads=0, providers=None):
+        super(OnnxModel, self).__init__()
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        self.path = path
+        self.session = ort.InferenceSession(path, options, providers=providers or ['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.input_shape = self.session.get_inputs()[0].shape
+
+    def forward(self, x, *args, **kwargs):
+        inp = x.detach().cpu().float().numpy()
+        outputs = self.session.run(None, {self.input_name: np.ascontiguousarray(inp)})
+        outputs = [torch.from_numpy(out).to(x.device) for out in outputs]
+        return outputs[0] if len(outputs) == 1 else outputs
+
+    def extra_repr(self):
+        return f'path={self.path}, providers={self.session.get_providers()}'
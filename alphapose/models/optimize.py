@@ -0,0 +1,165 @@
+"""Inference-time graph optimization.
+
+optimize_for_inference runs, each step behind a parity check against the
+eager model on random input:
+
+1. BatchNorm folding into the preceding nn.Conv2d, for Sequential
+   containers and for the conv*/bn* attribute pairs of the resnet, hrnet
+   and DUC blocks.
+2. channels-last weights, so every conv after the first runs NHWC.
+3. scripting (or tracing when the model does not script), freezing and
+   torch.jit.optimize_for_inference, which fuses conv + relu/add and
+   constant-folds the graph.
+
+A step whose output drifts from the eager model is dropped with a message,
+and the model of the previous step is kept. Steps 2 and 3 are also dropped
+when they do not make the example forward faster, which depends on the
+model and the cpu.
+"""
+import copy
+import re
+import time
+
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+from .onnx_backend import OnnxModel
+
+_CONV_BN_NAMES = re.compile(r'^conv(\d*)$')
+
+
+def _fold_pair(module, conv_name, bn_name):
+    conv = getattr(module, conv_name)
+    bn = getattr(module, bn_name)
+    if type(conv) is not nn.Conv2d or not isinstance(bn, nn.BatchNorm2d) \
+            or not bn.track_running_stats or bn.num_features != conv.out_channels:
+        return False
+    setattr(module, conv_name, fuse_conv_bn_eval(conv, bn))
+    setattr(module, bn_name, nn.Identity())
+    return True
+
+
+def fold_conv_bn(model):
+    """Fold eval-mode BatchNorm2d into the conv in front of it, in place. Returns the number folded."""
+    folded = 0
+    for module in list(model.modules()):
+        if isinstance(module, nn.Sequential):
+            names = list(module._modules)
+            for conv_name, bn_name in zip(names[:-1], names[1:]):
+                folded += _fold_pair(module, conv_name, bn_name)
+        else:
+            # self.convK(x) is directly followed by self.bnK in these blocks
+            for name in list(module._modules):
+                match = _CONV_BN_NAMES.match(name)
+                bn_name = 'bn' + match.group(1) if match else None
+                if bn_name and bn_name in module._modules:
+                    folded += _fold_pair(module, name, bn_name)
+    return folded
+
+
+def _outputs(model, example_inputs):
+    with torch.no_grad():
+        out = model(*example_inputs)
+    if isinstance(out, (list, tuple)):
+        return [o for o in out if torch.is_tensor(o)]
+    return [out]
+
+
+def _latency(model, example_inputs, iters=3):
+    _outputs(model, example_inputs)
+    start = time.time()
+    for _ in range(iters):
+        _outputs(model, example_inputs)
+    return (time.time() - start) / iters
+
+
+def _matches(ref, out, rtol, atol):
+    if len(ref) != len(out):
+        return False, float('inf')
+    err = 0.
+    ok = True
+    for r, o in zip(ref, out):
+        if r.shape != o.shape:
+            return False, float('inf')
+        o = o.float().contiguous()
+        r = r.float().contiguous()
+        scale = max(r.abs().max().item(), 1.)
+        err = max(err, (o - r).abs().max().item() / scale)
+        ok = ok and torch.allclose(o, r, rtol=rtol, atol=atol * scale)
+    return ok, err
+
+
+def optimize_for_inference(model, example_inputs, fold_bn=True, channels_last=True, script=True,
+                           check=True, rtol=1e-3, atol=1e-4, name='model'):
+    """Optimized inference copy of model.
+
+    example_inputs: tuple of model inputs used for the parity checks and for
+        tracing, e.g. (torch.randn(1, 3, 256, 192),)
+    script: freeze the graph with torchscript, only for models with a fixed
+        input size and plain tensor inputs
+
+    Returns the best model that matched the eager output.
+    """
+    model.eval()
+    ref = _outputs(model, example_inputs) if check else None
+
+    def accept(candidate, step, timed=False):
+        if check:
+            ok, err = _matches(ref, _outputs(candidate, example_inputs), rtol, atol)
+            if not ok:
+                print(f'{name}: {step} changed the output (max rel err {err:.2e}), skipped')
+                return False
+        if timed:
+            before, after = _latency(best, example_inputs), _latency(candidate, example_inputs)
+            if after >= before:
+                print(f'{name}: {step} is not faster ({before * 1000:.1f} -> {after * 1000:.1f} ms), skipped')
+                return False
+            print(f'{name}: {step} {before * 1000:.1f} -> {after * 1000:.1f} ms')
+        return True
+
+    best = model
+    if fold_bn:
+        candidate = copy.deepcopy(best)
+        folded = fold_conv_bn(candidate)
+        if folded and accept(candidate, 'bn folding'):
+            best = candidate
+            print(f'{name}: folded {folded} batchnorm layers')
+    if channels_last:
+        candidate = copy.deepcopy(best).to(memory_format=torch.channels_last)
+        if accept(candidate, 'channels-last', timed=True):
+            best = candidate
+    if script:
+        try:
+            try:
+                scripted = torch.jit.script(best)
+            except Exception:
+                scripted = torch.jit.trace(best, example_inputs, check_trace=False)
+            candidate = torch.jit.optimize_for_inference(torch.jit.freeze(scripted.eval()))
+            # first calls run the profiling executor
+            for _ in range(2):
+                _outputs(candidate, example_inputs)
+            # a trace can bake in the batch size, e.g. in python loops over the batch
+            doubled = (torch.cat([example_inputs[0]] * 2),) + tuple(example_inputs[1:])
+            batch_ok = _matches(_outputs(best, doubled), _outputs(candidate, doubled), rtol, atol)[0]
+        except Exception as e:
+            print(f'{name}: torchscript failed, staying eager ({type(e).__name__}: {e})')
+        else:
+            if not batch_ok:
+                print(f'{name}: torchscript graph depends on the batch size, skipped')
+            elif accept(candidate, 'torchscript', timed=True):
+                best = candidate
+    return best
+
+
+def optimize_from_cfg(model, opt_cfg, example_inputs, name='model'):
+    """Apply optimize_for_inference per the OPTIMIZE config entry.
+
+    opt_cfg: False/None (off), True (all steps) or a dict of the upper case
+        optimize_for_inference options, e.g. {'SCRIPT': False}
+    """
+    if not opt_cfg or isinstance(model, OnnxModel):
+        # ONNX Runtime does its own graph optimization
+        return model
+    kwargs = {} if opt_cfg is True else {k.lower(): v for k, v in dict(opt_cfg).items()}
+    return optimize_for_inference(model, example_inputs, name=name, **kwargs)
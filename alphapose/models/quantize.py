@@ -0,0 +1,63 @@
+"""Post-training static int8 quantization of pose models for cpu inference.
+
+The model is traced with torch.fx, observers are inserted and fed with
+calibration crops, and convert_fx swaps in quantized conv/linear/add
+kernels. Deformable convs have no int8 kernel and stay float, with
+(de)quantization around them.
+
+A quantized checkpoint is {'quantization': info, 'state_dict': ...}. The
+int8 graph is rebuilt from the float architecture with the same qconfig
+before its state is loaded, so builder.build_sppe(checkpoint=...) and every
+--checkpoint entry point load it like a float checkpoint.
+"""
+import copy
+
+import torch
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.fx.custom_config import PrepareCustomConfig
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+from .layers.dcn import DeformConv, ModulatedDeformConv
+
+QUANT_KEY = 'quantization'
+
+
+def is_quantized_checkpoint(state):
+    return isinstance(state, dict) and QUANT_KEY in state
+
+
+def prepare_model(model, input_size, backend='x86'):
+    """fx prepared copy of a float model with observers, ready for calibration."""
+    torch.backends.quantized.engine = backend
+    model = copy.deepcopy(model).cpu().eval()
+    example_inputs = (torch.randn(1, 3, *input_size),)
+    custom_config = PrepareCustomConfig().set_non_traceable_module_classes([DeformConv, ModulatedDeformConv])
+    return prepare_fx(model, get_default_qconfig_mapping(backend), example_inputs,
+                      prepare_custom_config=custom_config)
+
+
+def quantize_model(model, calib_batches, input_size, backend='x86'):
+    """Calibrate on calib_batches (iterable of (B, 3, H, W) crops) and return the int8 model."""
+    prepared = prepare_model(model, input_size, backend)
+    count = 0
+    with torch.no_grad():
+        for inps in calib_batches:
+            prepared(inps.cpu())
+            count += inps.size(0)
+    if count == 0:
+        raise ValueError('No calibration crops')
+    print(f'Calibrated on {count} crops')
+    return convert_fx(prepared)
+
+
+def save_quantized(model, path, input_size, backend='x86'):
+    torch.save({QUANT_KEY: {'backend': backend, 'input_size': list(input_size)},
+                'state_dict': model.state_dict()}, path)
+
+
+def load_quantized(model, state):
+    """Int8 version of the float model architecture with the quantized checkpoint state loaded."""
+    info = state[QUANT_KEY]
+    quantized = convert_fx(prepare_model(model, info['input_size'], info['backend']))
+    quantized.load_state_dict(state['state_dict'])
+    return quantized.eval()
@@ -45,28 +45,30 @@ class Simple3DPoseBaseSMPLCam(nn.Module):
 
         self.preact = backbone(f"resnet{kwargs['NUM_LAYERS']}")
 
-        # Imagenet pretrain model
+        # Imagenet pretrain model, skipped when the weights come from a checkpoint
         import torchvision.models as tm
+        imagenet_init = kwargs.get('IMAGENET_INIT', True)
         if kwargs['NUM_LAYERS'] == 101:
             ''' Load pretrained model '''
-            x = tm.resnet101(pretrained=True)
+            x = tm.resnet101(pretrained=imagenet_init)
             self.feature_channel = 2048
         elif kwargs['NUM_LAYERS'] == 50:
-            x = tm.resnet50(pretrained=True)
+            x = tm.resnet50(pretrained=imagenet_init)
             self.feature_channel = 2048
         elif kwargs['NUM_LAYERS'] == 34:
-            x = tm.resnet34(pretrained=True)
+            x = tm.resnet34(pretrained=imagenet_init)
             self.feature_channel = 512
         elif kwargs['NUM_LAYERS'] == 18:
-            x = tm.resnet18(pretrained=True)
+            x = tm.resnet18(pretrained=imagenet_init)
             self.feature_channel = 512
         else:
             raise NotImplementedError
-        model_state = self.preact.state_dict()
-        state = {k: v for k, v in x.state_dict().items()
-                 if k in self.preact.state_dict() and v.size() == self.preact.state_dict()[k].size()}
-        model_state.update(state)
-        self.preact.load_state_dict(model_state)
+        if imagenet_init:
+            model_state = self.preact.state_dict()
+            state = {k: v for k, v in x.state_dict().items()
+                     if k in self.preact.state_dict() and v.size() == self.preact.state_dict()[k].size()}
+            model_state.update(state)
+            self.preact.load_state_dict(model_state)
 
         self.deconv_layers = self._make_deconv_layer()
         self.final_layer = nn.Conv2d(
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""Camera <-> robot extrinsic calibration.
+
+Two batch solvers are provided for a static camera looking at the robot:
+
+- point pairs: the same points (a marker held by the gripper, or the
+  operator's wrist) measured in the camera frame and in the robot base
+  frame, solved in closed form (Kabsch / Umeyama).
+- hand-eye AX = XB: robot base->gripper poses paired with camera->marker
+  poses, e.g. from solve_pnp on a checkerboard or ArUco corners, solved with
+  the Park & Martin rotation average and a stacked least squares translation.
+
+The result is kept as a 3x4 [R | t] matrix and persisted as json.
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+''' Legacy camera -> world transform of js(): camera x right, z forward, y down
+mapped to world x, y and -z, camera mounted 1.32 m above the world origin '''
+DEFAULT_CAM_TO_WORLD = np.array([[1., 0., 0., 0.],
+                                 [0., 0., 1., 0.],
+                                 [0., -1., 0., 1.32]])
+
+
+class Extrinsics():
+    """Precomputed rigid transform, applied as points @ R.T + t."""
+    def __init__(self, matrix=DEFAULT_CAM_TO_WORLD, info=None):
+        matrix = np.asarray(matrix, dtype=np.float64)
+        self.matrix = np.ascontiguousarray(matrix[:3, :4])
+        self.info = info or {}
+        self._rot_t = np.ascontiguousarray(self.matrix[:, :3].T)
+        self._trans = self.matrix[:, 3].copy()
+
+    @property
+    def rotation(self):
+        return self.matrix[:, :3]
+
+    @property
+    def translation(self):
+        return self.matrix[:, 3]
+
+    def as_4x4(self):
+        out = np.eye(4)
+        out[:3] = self.matrix
+        return out
+
+    def inverse(self):
+        rot_t = self.rotation.T
+        return Extrinsics(np.hstack((rot_t, -rot_t @ self.translation[:, None])), info=dict(self.info))
+
+    def apply(self, points, out=None):
+        """Transform (..., 3) points, e.g. (T, N, K, 3) keypoints, with one matmul.
+
+        Torch tensors are transformed on their own device.
+        """
+        if hasattr(points, 'new_tensor'):
+            rot_t = points.new_tensor(self._rot_t)
+            return points @ rot_t + points.new_tensor(self._trans)
+        points = np.asarray(points)
+        dtype = points.dtype if points.dtype in (np.float32, np.float64) else np.float64
+        flat = points.reshape(-1, 3).astype(dtype, copy=False)
+        if out is None:
+            out = np.empty(flat.shape, dtype=dtype)
+        else:
+            out = out.reshape(-1, 3)
+        np.matmul(flat, self._rot_t.astype(dtype, copy=False), out=out)
+        out += self._trans.astype(dtype, copy=False)
+        return out.reshape(points.shape)
+
+    __call__ = apply
+
+    def save(self, path):
+        """Save the matrix and solver info as json."""
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        with open(path, 'w') as f:
+            json.dump({'matrix': self.matrix.tolist(), 'info': self.info}, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        return cls(data['matrix'], info=data.get('info'))
+
+
+def load_extrinsics(path=None):
+    """Extrinsics from a calibration file, or the legacy default when no file is given."""
+    if path is None:
+        return Extrinsics(DEFAULT_CAM_TO_WORLD, info={'method': 'default'})
+    return Extrinsics.load(path)
+
+
+def _skew_log(R):
+    # rotation matrix -> axis-angle vector
+    cos = np.clip((np.trace(R, axis1=-2, axis2=-1) - 1) / 2, -1., 1.)
+    theta = np.arccos(cos)
+    w = np.stack((R[..., 2, 1] - R[..., 1, 2], R[..., 0, 2] - R[..., 2, 0], R[..., 1, 0] - R[..., 0, 1]), -1)
+    sin = np.sin(theta)
+    scale = np.where(sin > 1e-9, theta / (2 * np.where(sin > 1e-9, sin, 1.)), 0.5)
+    return w * scale[..., None]
+
+
+def _project_rotation(M):
+    # nearest rotation in the Frobenius sense
+    U, _, Vt = np.linalg.svd(M)
+    D = np.eye(3)
+    D[2, 2] = np.sign(np.linalg.det(U @ Vt))
+    return U @ D @ Vt
+
+
+def _residual(src, dst, matrix):
+    pred = src @ matrix[:, :3].T + matrix[:, 3]
+    return float(np.sqrt(((pred - dst) ** 2).sum(-1).mean()))
+
+
+def solve_point_pairs(src, dst, weights=None):
+    """Rigid transform mapping src (N, 3) onto dst (N, 3), e.g. camera -> robot base.
+
+    Rows with a nan in either set are ignored. Returns Extrinsics with the
+    rms residual in meters in info.
+    """
+    src = np.asarray(src, dtype=np.float64).reshape(-1, 3)
+    dst = np.asarray(dst, dtype=np.float64).reshape(-1, 3)
+    keep = np.isfinite(src).all(-1) & np.isfinite(dst).all(-1)
+    w = np.ones(len(src)) if weights is None else np.asarray(weights, dtype=np.float64).reshape(-1)
+    src, dst, w = src[keep], dst[keep], w[keep]
+    assert len(src) >= 3, 'at least 3 valid point pairs are needed, got {}'.format(len(src))
+    w = w / w.sum()
+
+    mu_src = w @ src
+    mu_dst = w @ dst
+    H = ((src - mu_src) * w[:, None]).T @ (dst - mu_dst)
+    R = _project_rotation(H.T)
+    t = mu_dst - R @ mu_src
+    matrix = np.hstack((R, t[:, None]))
+    info = {'method': 'point_pairs', 'num_pairs': int(len(src)),
+            'rmse': _residual(src, dst, matrix), 'time': time.time()}
+    return Extrinsics(matrix, info=info)
+
+
+def relative_motions(robot_poses, target_poses, eye_in_hand=False):
+    """AX = XB motion pairs between consecutive samples.
+
+    robot_poses: (M, 4, 4) base -> gripper
+    target_poses: (M, 4, 4) camera -> marker
+    With a static camera (eye_in_hand=False) X is base -> camera, with the
+    camera on the gripper X is gripper -> camera.
+    """
+    G = np.asarray(robot_poses, dtype=np.float64)
+    C = np.asarray(target_poses, dtype=np.float64)
+    i = np.arange(len(G) - 1)
+    j = i + 1
+    if eye_in_hand:
+        A = np.linalg.inv(G[j]) @ G[i]
+    else:
+        A = G[j] @ np.linalg.inv(G[i])
+    B = C[j] @ np.linalg.inv(C[i])
+    return A, B
+
+
+def solve_ax_xb(A, B):
+    """Solve AX = XB for (M, 4, 4) motion pairs (Park & Martin)."""
+    A = np.asarray(A, dtype=np.float64)
+    B = np.asarray(B, dtype=np.float64)
+    assert len(A) >= 2, 'at least 2 motions with non-parallel axes are needed'
+    alpha = _skew_log(A[:, :3, :3])
+    beta = _skew_log(B[:, :3, :3])
+    M = np.einsum('ni,nj->ij', beta, alpha)
+    # R = (M^T M)^(-1/2) M^T
+    w, V = np.linalg.eigh(M.T @ M)
+    R = V @ np.diag(1. / np.sqrt(np.maximum(w, 1e-12))) @ V.T @ M.T
+    R = _project_rotation(R)
+
+    # (R_A - I) t = R t_B - t_A, stacked over all motions
+    lhs = (A[:, :3, :3] - np.eye(3)).reshape(-1, 3)
+    rhs = (B[:, :3, 3] @ R.T - A[:, :3, 3]).reshape(-1)
+    t = np.linalg.lstsq(lhs, rhs, rcond=None)[0]
+    matrix = np.hstack((R, t[:, None]))
+
+    X = np.eye(4)
+    X[:3] = matrix
+    err = A @ X - X @ B
+    info = {'method': 'ax_xb', 'num_motions': int(len(A)),
+            'rot_err': float(np.abs(err[:, :3, :3]).mean()),
+            'trans_rmse': float(np.sqrt((err[:, :3, 3] ** 2).sum(-1).mean())), 'time': time.time()}
+    return Extrinsics(matrix, info=info)
+
+
+def solve_pnp(object_points, image_points, intrin, dist_coeffs=None):
+    """camera -> marker 4x4 pose from marker corners with cv2.solvePnP."""
+    import cv2
+    from alphapose.utils.depth_raymarch import intrinsics_to_tuple
+
+    fx, fy, cx, cy = intrinsics_to_tuple(intrin)
+    K = np.array([[fx, 0, cx], [0, fy, cy], [0, 0, 1]], dtype=np.float64)
+    if dist_coeffs is None:
+        dist_coeffs = np.asarray(getattr(intrin, 'coeffs', np.zeros(5)), dtype=np.float64)
+    ok, rvec, tvec = cv2.solvePnP(np.asarray(object_points, dtype=np.float64).reshape(-1, 1, 3),
+                                  np.asarray(image_points, dtype=np.float64).reshape(-1, 1, 2),
+                                  K, dist_coeffs)
+    if not ok:
+        return None
+    pose = np.eye(4)
+    pose[:3, :3] = cv2.Rodrigues(rvec)[0]
+    pose[:3, 3] = tvec.reshape(-1)
+    return pose
+
+
+def calibrate(samples, eye_in_hand=False):
+    """Solve from a recorded sample file or dict.
+
+    samples holds either camera_points and robot_points (N, 3) for the
+    point pair solver, or robot_poses and target_poses (M, 4, 4) for AX = XB.
+    """
+    if isinstance(samples, str):
+        with np.load(samples) as data:
+            samples = {k: data[k] for k in data.files}
+    if 'camera_points' in samples:
+        return solve_point_pairs(samples['camera_points'], samples['robot_points'], samples.get('weights'))
+    A, B = relative_motions(samples['robot_poses'], samples['target_poses'], eye_in_hand=eye_in_hand)
+    return solve_ax_xb(A, B)
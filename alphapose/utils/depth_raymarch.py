@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""Resolve what a pointing ray hits in an aligned depth frame.
+
+Rays are given in camera coordinates (meters, RealSense convention: x right,
+y down, z forward) and marched through a min/max depth pyramid: tiles the ray
+passes entirely in front of (or far behind) are skipped as a whole, and the
+traversal climbs one level after each skip, so a ray costs O(log(image size))
+steps in free space instead of one step per pixel.
+"""
+import math
+
+import numpy as np
+
+EPS = 1e-9
+
+
+def intrinsics_to_tuple(intrin):
+    """(fx, fy, ppx, ppy) from a pyrealsense2.intrinsics, dict or sequence."""
+    if hasattr(intrin, 'fx'):
+        return intrin.fx, intrin.fy, intrin.ppx, intrin.ppy
+    if isinstance(intrin, dict):
+        return intrin['fx'], intrin['fy'], intrin['ppx'], intrin['ppy']
+    fx, fy, ppx, ppy = intrin[:4]
+    return fx, fy, ppx, ppy
+
+
+class DepthPyramid():
+    """Min/max mip pyramid of a depth image.
+
+    Level l holds, for every 2^l x 2^l tile, the nearest and farthest valid
+    depth in meters. Missing depth (0) is +inf in the min levels and -inf in
+    the max levels, so empty tiles are always skipped.
+    """
+    def __init__(self, depth, depth_scale=0.001, levels=None):
+        depth = np.asarray(depth)
+        self.height, self.width = depth.shape
+        valid = depth > 0
+        depth = depth.astype(np.float32) * depth_scale
+        lo = np.where(valid, depth, np.inf).astype(np.float32)
+        hi = np.where(valid, depth, -np.inf).astype(np.float32)
+        if levels is None:
+            levels = int(math.ceil(math.log2(max(self.height, self.width)))) + 1
+        self.min_levels = [lo]
+        self.max_levels = [hi]
+        for _ in range(1, levels):
+            lo = self._reduce(lo, np.inf, np.minimum)
+            hi = self._reduce(hi, -np.inf, np.maximum)
+            self.min_levels.append(lo)
+            self.max_levels.append(hi)
+            if lo.shape == (1, 1):
+                break
+        self.levels = len(self.min_levels)
+
+    @staticmethod
+    def _reduce(x, fill, op):
+        h, w = x.shape
+        if h % 2 or w % 2:
+            x = np.pad(x, ((0, h % 2), (0, w % 2)), constant_values=fill)
+        return op.reduce(op.reduce(x.reshape(x.shape[0] // 2, 2, x.shape[1] // 2, 2), axis=3), axis=1)
+
+
+def _clip_to_frustum(o, d, fx, fy, cx, cy, width, height, near, t0, t1):
+    # u(t) in [0, W) and v(t) in [0, H) are linear in t once multiplied by Z(t)
+    constraints = [
+        (o[2] - near, d[2]),
+        (fx * o[0] + cx * o[2], fx * d[0] + cx * d[2]),
+        ((width - cx) * o[2] - fx * o[0], (width - cx) * d[2] - fx * d[0]),
+        (fy * o[1] + cy * o[2], fy * d[1] + cy * d[2]),
+        ((height - cy) * o[2] - fy * o[1], (height - cy) * d[2] - fy * d[1]),
+    ]
+    for a, b in constraints:
+        # a + b * t >= 0
+        if abs(b) < EPS:
+            if a < 0:
+                return None
+        elif b > 0:
+            t0 = max(t0, -a / b)
+        else:
+            t1 = min(t1, -a / b)
+    if t0 >= t1:
+        return None
+    return t0, t1
+
+
+def _first_after(t_exit, t_cand, t):
+    return t_cand if t < t_cand < t_exit else t_exit
+
+
+def march_ray(pyramid, intrin, origin, direction, t_min=0., t_max=10., thickness=0.05, near=0.1, max_iter=4096):
+    """March one ray through the depth pyramid.
+
+    Parameters
+    ----------
+    pyramid: DepthPyramid of the aligned depth frame
+    intrin: camera intrinsics, see intrinsics_to_tuple
+    origin, direction: ray in camera coordinates, direction need not be unit
+    t_min, t_max: ray parameter range to search, e.g. start past the fingertip
+    thickness: assumed surface thickness in meters, a ray passing further than
+        this behind a surface is treated as passing behind it, not hitting it
+
+    Returns
+    -------
+    t of the first surface hit and its pixel (u, v), or None
+    """
+    fx, fy, cx, cy = intrinsics_to_tuple(intrin)
+    o = [float(v) for v in origin]
+    d = [float(v) for v in direction]
+    span = _clip_to_frustum(o, d, fx, fy, cx, cy, pyramid.width, pyramid.height, near, t_min, t_max)
+    if span is None:
+        return None
+    t, t_end = span
+
+    # the projected ray moves monotonically in u and v
+    sx = d[0] * o[2] - o[0] * d[2]
+    sy = d[1] * o[2] - o[1] * d[2]
+
+    def t_at_u(u):
+        den = fx * d[0] - (u - cx) * d[2]
+        return (o[2] * (u - cx) - fx * o[0]) / den if abs(den) > EPS else math.inf
+
+    def t_at_v(v):
+        den = fy * d[1] - (v - cy) * d[2]
+        return (o[2] * (v - cy) - fy * o[1]) / den if abs(den) > EPS else math.inf
+
+    level = 0
+    top = pyramid.levels - 1
+    for _ in range(max_iter):
+        if t >= t_end:
+            return None
+        z = o[2] + t * d[2]
+        px = min(max(int((fx * (o[0] + t * d[0])) / z + cx), 0), pyramid.width - 1)
+        py = min(max(int((fy * (o[1] + t * d[1])) / z + cy), 0), pyramid.height - 1)
+        size = 1 << level
+        tx, ty = px >> level, py >> level
+
+        # boundaries the projection never reaches (past the vanishing point) solve to t <= current t
+        t_exit = t_end
+        if sx > EPS:
+            t_exit = _first_after(t_exit, t_at_u((tx + 1) * size), t)
+        elif sx < -EPS:
+            t_exit = _first_after(t_exit, t_at_u(tx * size), t)
+        if sy > EPS:
+            t_exit = _first_after(t_exit, t_at_v((ty + 1) * size), t)
+        elif sy < -EPS:
+            t_exit = _first_after(t_exit, t_at_v(ty * size), t)
+
+        z0, z1 = z, o[2] + t_exit * d[2]
+        z_lo, z_hi = min(z0, z1), max(z0, z1)
+        tile_min = pyramid.min_levels[level][ty, tx]
+        tile_max = pyramid.max_levels[level][ty, tx]
+        if z_hi < tile_min or z_lo > tile_max + thickness:
+            # in front of or far behind everything in this tile
+            t = t_exit + 1e-6 * max(1., t_exit)
+            level = min(level + 1, top)
+        elif level > 0:
+            level -= 1
+        else:
+            if abs(d[2]) > EPS:
+                t_hit = min(max((tile_min - o[2]) / d[2], t), t_exit)
+            else:
+                t_hit = t
+            return t_hit, (px, py)
+    return None
+
+
+def resolve_targets(depth, intrin, origins, directions, depth_scale=0.001, t_min=None, t_max=10.,
+                    thickness=0.05, cam_to_world=None, pyramid=None):
+    """First surface hit of every ray in a depth frame.
+
+    Parameters
+    ----------
+    depth: aligned z16 depth image (H, W), or None when pyramid is given
+    origins, directions: (N, 3) rays in camera coordinates
+    t_min: scalar or (N,) start parameter of each ray, e.g. the eye to
+        fingertip distance so the hand itself is not reported
+    cam_to_world: optional 4x4 or 3x4 transform applied to the hits
+
+    Returns
+    -------
+    dict with valid (N,), t (N,), pixels (N, 2), camera (N, 3) and, with
+    cam_to_world, world (N, 3). Invalid rows are nan.
+    """
+    if pyramid is None:
+        pyramid = DepthPyramid(depth, depth_scale=depth_scale)
+    origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+    directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+    n = len(origins)
+    t_min = np.broadcast_to(0. if t_min is None else t_min, (n,))
+
+    valid = np.zeros(n, dtype=bool)
+    t = np.full(n, np.nan)
+    pixels = np.full((n, 2), -1, dtype=np.int64)
+    for i in range(n):
+        res = march_ray(pyramid, intrin, origins[i], directions[i], t_min=float(t_min[i]),
+                        t_max=t_max, thickness=thickness)
+        if res is not None:
+            valid[i] = True
+            t[i], pixels[i] = res
+    camera = origins + t[:, None] * directions
+    out = {'valid': valid, 't': t, 'pixels': pixels, 'camera': camera}
+    if cam_to_world is not None:
+        cam_to_world = np.asarray(cam_to_world, dtype=np.float64)
+        out['world'] = camera @ cam_to_world[:3, :3].T + cam_to_world[:3, 3]
+    return out
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Depth-gated detection region.
+
+People only interact with the robot inside a known depth band in front of
+it. A coarse occupancy mask of the aligned z16 depth frame (subsampled by
+`stride`) gives the image region that holds anything in that band; only
+that crop of the color frame is sent through the person detector, at an
+input size that keeps the pixel density of the full-frame detector, and
+detection is skipped entirely when the band is empty. Detector cost then
+follows the occupied workspace instead of the whole field of view.
+"""
+import math
+
+import numpy as np
+import torch
+
+
+def occupancy_mask(depth, depth_range, depth_scale=0.001, stride=8):
+    """Boolean (H // stride, W // stride) mask of the depth samples within depth_range (meters)."""
+    coarse = depth[stride // 2::stride, stride // 2::stride]
+    near, far = depth_range
+    # 0 is invalid depth on RealSense, never inside the band for near > 0
+    return (coarse >= near / depth_scale) & (coarse <= far / depth_scale)
+
+
+class DepthROI():
+    """Detect people on the part of the frame occupied within depth_range only.
+
+    Parameters
+    ----------
+    depth_range: (near, far) band in front of the camera in meters
+    depth_scale: meters per depth unit of the z16 frame
+    stride: subsampling of the depth frame for the occupancy mask
+    min_cells: occupied mask cells needed to run detection at all
+    margin: fraction of the occupied box added on every side, people lean
+        out of the band with their head, hands and feet
+    min_dim: smallest detector input size
+    """
+    def __init__(self, depth_range=(0.3, 2.5), depth_scale=0.001, stride=8, min_cells=16,
+                 margin=0.15, min_dim=224):
+        self.depth_range = depth_range
+        self.depth_scale = depth_scale
+        self.stride = stride
+        self.min_cells = min_cells
+        self.margin = margin
+        self.min_dim = min_dim
+
+    def region(self, depth):
+        """Integer (x1, y1, x2, y2) pixel box around the occupied workspace, None if it is empty."""
+        mask = occupancy_mask(depth, self.depth_range, self.depth_scale, self.stride)
+        if mask.sum() < self.min_cells:
+            return None
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        h, w = depth.shape[:2]
+        x1, x2 = cols[0] * self.stride, (cols[-1] + 1) * self.stride
+        y1, y2 = rows[0] * self.stride, (rows[-1] + 1) * self.stride
+        mx, my = (x2 - x1) * self.margin, (y2 - y1) * self.margin
+        return (int(max(x1 - mx, 0)), int(max(y1 - my, 0)),
+                int(min(x2 + mx, w)), int(min(y2 + my, h)))
+
+    def input_dim(self, roi, frame_shape, inp_dim):
+        """Detector input size for roi with the pixel density inp_dim gives the full frame."""
+        x1, y1, x2, y2 = roi
+        scale = inp_dim / max(frame_shape[:2])
+        # darknet and yolox strides need multiples of 32
+        dim = int(math.ceil(max(x2 - x1, y2 - y1) * scale / 32.) * 32)
+        return int(min(max(dim, self.min_dim), inp_dim))
+
+    def detect(self, detector, image, depth):
+        """Detections of image in full-frame coordinates like images_detection, 0 when the band is empty."""
+        roi = self.region(depth)
+        if roi is None:
+            return 0
+        x1, y1, x2, y2 = roi
+        crop = np.ascontiguousarray(image[y1:y2, x1:x2])
+        # detectors without a resizable input (e.g. the JDE tracker) get the crop at their fixed size
+        resize = hasattr(detector, 'set_inp_dim')
+        if resize:
+            full_dim = detector.inp_dim
+            detector.set_inp_dim(self.input_dim(roi, image.shape, full_dim))
+        try:
+            img = detector.image_preprocess(crop)
+            if isinstance(img, np.ndarray):
+                img = torch.from_numpy(img)
+            if img.dim() == 3:
+                img = img.unsqueeze(0)
+            crop_dim = torch.FloatTensor([crop.shape[1], crop.shape[0]]).repeat(1, 2)
+            dets = detector.images_detection(img, crop_dim)
+        finally:
+            if resize:
+                detector.set_inp_dim(full_dim)
+        if isinstance(dets, int) or dets.shape[0] == 0:
+            return 0
+        if isinstance(dets, np.ndarray):
+            dets = torch.from_numpy(dets)
+        dets = dets.cpu()
+        dets[:, [1, 3]] += x1
+        dets[:, [2, 4]] += y1
+        return dets
+
+
+def build_depth_roi(opt):
+    """DepthROI from the --depth_roi near far option, None when it is off."""
+    depth_range = getattr(opt, 'depth_roi', None)
+    if not depth_range:
+        return None
+    return DepthROI(depth_range=tuple(depth_range), depth_scale=getattr(opt, 'depth_scale', 0.001))
@@ -1,5 +1,7 @@
 import os
 import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from threading import Thread
 from queue import Queue
 
@@ -11,13 +13,16 @@ import torch.multiprocessing as mp
 
 from alphapose.utils.presets import SimpleTransform, SimpleTransform3DSMPL
 from alphapose.models import builder
+from alphapose.utils.operator_gate import build_selector, gate_detections
 
 class DetectionLoader():
-    def __init__(self, input_source, detector, cfg, opt, mode='image', batchSize=1, queueSize=128):
+    def __init__(self, input_source, detector, cfg, opt, mode='image', batchSize=1, queueSize=128, numWorkers=None):
         self.cfg = cfg
         self.opt = opt
         self.mode = mode
         self.device = opt.device
+        # threads decoding images ahead of the detector in image mode
+        self.num_workers = numWorkers or os.cpu_count() or 1
 
         if mode == 'image':
             self.img_dir = opt.inputpath
@@ -28,6 +33,12 @@ class DetectionLoader():
             assert stream.isOpened(), 'Cannot capture source'
             self.path = input_source
             self.datalen = int(stream.get(cv2.CAP_PROP_FRAME_COUNT))
+            # segment of the video to process, frames keep their index in the video
+            video_range = getattr(opt, 'video_range', None)
+            self.start_frame = 0
+            if video_range:
+                self.start_frame = min(video_range[0], self.datalen)
+                self.datalen = min(video_range[1], self.datalen) - self.start_frame
             self.fourcc = int(stream.get(cv2.CAP_PROP_FOURCC))
             self.fps = stream.get(cv2.CAP_PROP_FPS)
             self.frameSize = (int(stream.get(cv2.CAP_PROP_FRAME_WIDTH)), int(stream.get(cv2.CAP_PROP_FRAME_HEIGHT)))
@@ -35,6 +46,7 @@ class DetectionLoader():
             stream.release()
 
         self.detector = detector
+        self.operator_selector = build_selector(opt)
         self.batchSize = batchSize
         leftover = 0
         if (self.datalen) % batchSize:
@@ -140,7 +152,26 @@ class DetectionLoader():
     def wait_and_get(self, queue):
         return queue.get()
 
+    def load_image(self, im_name_k):
+        # decode once, the detector input and the pose crops share the array
+        frame = cv2.imread(im_name_k)
+        # expected image shape like (1,3,h,w) or (3,h,w)
+        img_k = self.detector.image_preprocess(frame)
+        if isinstance(img_k, np.ndarray):
+            img_k = torch.from_numpy(img_k)
+        # add one dimension at the front for batch if image shape (3,h,w)
+        if img_k.dim() == 3:
+            img_k = img_k.unsqueeze(0)
+        orig_img_k = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        im_dim_list_k = orig_img_k.shape[1], orig_img_k.shape[0]
+        return img_k, orig_img_k, os.path.basename(im_name_k), im_dim_list_k
+
     def image_preprocess(self):
+        # decode with a thread pool, keeping a bounded number of images in flight
+        pool = ThreadPoolExecutor(max_workers=self.num_workers)
+        pending = deque()
+        im_names_iter = iter(self.imglist)
+        lookahead = self.batchSize + 2 * self.num_workers
         for i in range(self.num_batches):
             imgs = []
             orig_imgs = []
@@ -148,23 +179,19 @@ class DetectionLoader():
             im_dim_list = []
             for k in range(i * self.batchSize, min((i + 1) * self.batchSize, self.datalen)):
                 if self.stopped:
+                    pool.shutdown(wait=False, cancel_futures=True)
                     self.wait_and_put(self.image_queue, (None, None, None, None))
                     return
-                im_name_k = self.imglist[k]
-
-                # expected image shape like (1,3,h,w) or (3,h,w)
-                img_k = self.detector.image_preprocess(im_name_k)
-                if isinstance(img_k, np.ndarray):
-                    img_k = torch.from_numpy(img_k)
-                # add one dimension at the front for batch if image shape (3,h,w)
-                if img_k.dim() == 3:
-                    img_k = img_k.unsqueeze(0)
-                orig_img_k = cv2.cvtColor(cv2.imread(im_name_k), cv2.COLOR_BGR2RGB) # scipy.misc.imread(im_name_k, mode='RGB') is depreciated
-                im_dim_list_k = orig_img_k.shape[1], orig_img_k.shape[0]
+                while len(pending) < lookahead:
+                    im_name_k = next(im_names_iter, None)
+                    if im_name_k is None:
+                        break
+                    pending.append(pool.submit(self.load_image, im_name_k))
+                img_k, orig_img_k, im_name_k, im_dim_list_k = pending.popleft().result()
 
                 imgs.append(img_k)
                 orig_imgs.append(orig_img_k)
-                im_names.append(os.path.basename(im_name_k))
+                im_names.append(im_name_k)
                 im_dim_list.append(im_dim_list_k)
 
             with torch.no_grad():
@@ -174,10 +201,13 @@ class DetectionLoader():
                 # im_dim_list_ = im_dim_list
 
             self.wait_and_put(self.image_queue, (imgs, orig_imgs, im_names, im_dim_list))
+        pool.shutdown()
 
     def frame_preprocess(self):
         stream = cv2.VideoCapture(self.path)
         assert stream.isOpened(), 'Cannot capture source'
+        if self.start_frame:
+            stream.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
 
         for i in range(self.num_batches):
             imgs = []
@@ -215,7 +245,7 @@ class DetectionLoader():
 
                 imgs.append(img_k)
                 orig_imgs.append(frame[:, :, ::-1])
-                im_names.append(str(k) + '.jpg')
+                im_names.append(str(self.start_frame + k) + '.jpg')
                 im_dim_list.append(im_dim_list_k)
 
             with torch.no_grad():
@@ -236,9 +266,9 @@ class DetectionLoader():
 
             with torch.no_grad():
                 # pad useless images to fill a batch, else there will be a bug
-                for pad_i in range(self.batchSize - len(imgs)):
-                    imgs = torch.cat((imgs, torch.unsqueeze(imgs[0], dim=0)), 0)
-                    im_dim_list = torch.cat((im_dim_list, torch.unsqueeze(im_dim_list[0], dim=0)), 0)
+                if len(imgs) < self.batchSize:
+                    imgs = self.pad_batch(imgs)
+                    im_dim_list = self.pad_batch(im_dim_list)
 
                 dets = self.detector.images_detection(imgs, im_dim_list)
                 if isinstance(dets, int) or dets.shape[0] == 0:
@@ -257,13 +287,24 @@ class DetectionLoader():
 
             for k in range(len(orig_imgs)):
                 boxes_k = boxes[dets[:, 0] == k]
+                scores_k, ids_k = scores[dets[:, 0] == k], ids[dets[:, 0] == k]
+                if self.operator_selector is not None and boxes_k.shape[0] > 0:
+                    # bystanders are dropped before cropping and pose estimation
+                    boxes_k, scores_k, ids_k = gate_detections(
+                        self.operator_selector, boxes_k, scores_k, ids_k, keep_ids=self.opt.tracking)
                 if isinstance(boxes_k, int) or boxes_k.shape[0] == 0:
                     self.wait_and_put(self.det_queue, (orig_imgs[k], im_names[k], None, None, None, None, None))
                     continue
                 inps = torch.zeros(boxes_k.size(0), 3, *self._input_size)
                 cropped_boxes = torch.zeros(boxes_k.size(0), 4)
 
-                self.wait_and_put(self.det_queue, (orig_imgs[k], im_names[k], boxes_k, scores[dets[:, 0] == k], ids[dets[:, 0] == k], inps, cropped_boxes))
+                self.wait_and_put(self.det_queue, (orig_imgs[k], im_names[k], boxes_k, scores_k, ids_k, inps, cropped_boxes))
+
+    def pad_batch(self, x):
+        padded = x.new_empty((self.batchSize, *x.shape[1:]))
+        padded[:len(x)] = x
+        padded[len(x):] = x[0]
+        return padded
 
     def image_postprocess(self):
         for i in range(self.datalen):
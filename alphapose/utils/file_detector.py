@@ -2,6 +2,7 @@ from itertools import count
 from threading import Thread
 from queue import Queue
 import json
+import os
 
 import cv2
 import numpy as np
@@ -51,37 +52,9 @@ class FileDetectionLoader():
                 train=False, add_dpg=False, gpu_device=self.device,
                 loss_type=cfg.LOSS['TYPE'])
 
-        # initialize the det file list        
-        boxes = None
-        if isinstance(self.bbox_file,list):
-            boxes = self.bbox_file
-        else:
-            with open(self.bbox_file, 'r') as f:
-                boxes = json.load(f)
-            assert boxes is not None, 'Load %s fail!' % self.bbox_file
-
-        self.all_imgs = []
-        self.all_boxes = {}
-        self.all_scores = {}
-        self.all_ids = {}
-        num_boxes = 0
-        for k_img in range(0, len(boxes)):
-            det_res = boxes[k_img]
-            img_name = det_res['image_id']
-            if img_name not in self.all_imgs:
-                self.all_imgs.append(img_name)
-                self.all_boxes[img_name] = []
-                self.all_scores[img_name] = []
-                self.all_ids[img_name] = []
-            x1, y1, w, h = det_res['bbox']
-            bbox = [x1, y1, x1 + w, y1 + h]
-            score = det_res['score']
-            self.all_boxes[img_name].append(bbox)
-            self.all_scores[img_name].append(score)
-            if 'idx' in det_res.keys():
-                self.all_ids[img_name].append(int(det_res['idx']))
-            else:
-                self.all_ids[img_name].append(0)
+        # initialize the det file index
+        self.all_imgs, self.img_offsets, self.all_boxes, self.all_scores, self.all_ids = \
+            load_detections(self.bbox_file)
 
         # initialize the queue used to store data
         """
@@ -136,10 +109,11 @@ class FileDetectionLoader():
 
     def get_detection(self):
         
-        for im_name_k in self.all_imgs:
-            boxes = torch.from_numpy(np.array(self.all_boxes[im_name_k]))
-            scores = torch.from_numpy(np.array(self.all_scores[im_name_k]))
-            ids = torch.from_numpy(np.array(self.all_ids[im_name_k]))
+        for k, im_name_k in enumerate(self.all_imgs):
+            start, end = self.img_offsets[k], self.img_offsets[k + 1]
+            boxes = torch.from_numpy(self.all_boxes[start:end].copy())
+            scores = torch.from_numpy(self.all_scores[start:end].copy())
+            ids = torch.from_numpy(self.all_ids[start:end].copy())
             orig_img_k = cv2.cvtColor(cv2.imread(im_name_k), cv2.COLOR_BGR2RGB) #scipy.misc.imread(im_name_k, mode='RGB') is depreciated
 
 
@@ -174,3 +148,77 @@ class FileDetectionLoader():
         when the image is flipped horizontally."""
         return [[1, 2], [3, 4], [5, 6], [7, 8],
                 [9, 10], [11, 12], [13, 14], [15, 16]]
+
+
+def iter_detections(bbox_file):
+    """Yield detection dicts from a json list or a JSON Lines file."""
+    if isinstance(bbox_file, list):
+        yield from bbox_file
+    elif bbox_file.endswith('.jsonl'):
+        with open(bbox_file, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+    else:
+        with open(bbox_file, 'r') as f:
+            boxes = json.load(f)
+        assert boxes is not None, 'Load %s fail!' % bbox_file
+        yield from boxes
+
+
+def load_detections(bbox_file, use_cache=True):
+    """Build an image -> row range index over all detections in one pass.
+
+    Returns the image names in order of first appearance, the row offsets of
+    each image (len + 1), and the contiguous xyxy boxes, scores and ids.
+    For det files on disk the index is cached next to the file as
+    ``<bbox_file>.index.npz`` and reused while the file is unchanged.
+    """
+    cache_file = None
+    if not isinstance(bbox_file, list):
+        stat = os.stat(bbox_file)
+        signature = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+        cache_file = bbox_file + '.index.npz'
+        if use_cache and os.path.exists(cache_file):
+            try:
+                with np.load(cache_file) as cache:
+                    if np.array_equal(cache['signature'], signature):
+                        return (cache['imgs'].tolist(), cache['offsets'], cache['boxes'],
+                                cache['scores'], cache['ids'])
+            except Exception:
+                # a broken cache is rebuilt like a stale one
+                pass
+
+    img_index = {}
+    rows, boxes, scores, ids = [], [], [], []
+    for det_res in iter_detections(bbox_file):
+        img_name = det_res['image_id']
+        rows.append(img_index.setdefault(img_name, len(img_index)))
+        boxes.append(det_res['bbox'])
+        scores.append(det_res['score'])
+        ids.append(int(det_res.get('idx', 0)))
+
+    rows = np.asarray(rows, dtype=np.int64)
+    # stable sort keeps the file order of boxes within each image
+    order = np.argsort(rows, kind='stable')
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)[order]
+    boxes[:, 2:] += boxes[:, :2]
+    scores = np.asarray(scores, dtype=np.float32)[order]
+    ids = np.asarray(ids, dtype=np.int64)[order]
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=len(img_index))))).astype(np.int64)
+    imgs = [str(img_name) for img_name in img_index]
+
+    if cache_file is not None and use_cache:
+        tmp_file = '%s.%d.tmp' % (cache_file, os.getpid())
+        try:
+            # write through a file object so numpy does not append another .npz,
+            # and move it in place so an interrupted write leaves no partial cache
+            with open(tmp_file, 'wb') as f:
+                np.savez(f, signature=signature, imgs=np.array(imgs, dtype=str), offsets=offsets,
+                         boxes=boxes, scores=scores, ids=ids)
+            os.replace(tmp_file, cache_file)
+        except OSError:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+    return imgs, offsets, boxes, scores, ids
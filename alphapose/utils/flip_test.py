@@ -0,0 +1,50 @@
+"""Flip test of the pose model.
+
+The flipped heatmaps are mapped back with a precomputed joint index and
+averaged in place, instead of the per-pair python loop of flip_heatmap.
+With a threshold, only the people whose mean keypoint score (mean heatmap
+peak) is below it are run again flipped, so confident poses cost a single
+forward.
+"""
+import torch
+
+from .transforms import flip, flip_heatmap_average, flip_index
+
+
+class FlipTest():
+    """Pose forward with flip testing, called like the pose model.
+
+    thresh: 0 flips every person in the same forward (the batch is doubled),
+        above 0 flips only the people with a mean keypoint score below it
+    """
+
+    def __init__(self, pose_model, joint_pairs, thresh=0):
+        self.pose_model = pose_model
+        self.joint_pairs = joint_pairs
+        self.thresh = thresh
+        self._idx = {}
+
+    @property
+    def batch_factor(self):
+        """Forward batch size per input crop, for the caller's batch sizing."""
+        return 1 if self.thresh > 0 else 2
+
+    def _index(self, hm):
+        key = (hm.size(1), hm.device)
+        if key not in self._idx:
+            self._idx[key] = flip_index(hm.size(1), self.joint_pairs).to(hm.device)
+        return self._idx[key]
+
+    def __call__(self, inps):
+        if self.thresh <= 0:
+            hm = self.pose_model(torch.cat((inps, flip(inps))))
+            n = len(inps)
+            return flip_heatmap_average(hm[:n], hm[n:], self._index(hm))
+
+        hm = self.pose_model(inps)
+        score = hm.flatten(2).amax(dim=2).mean(dim=1)
+        low = (score < self.thresh).nonzero().view(-1)
+        if len(low):
+            hm_flip = self.pose_model(flip(inps.index_select(0, low)))
+            hm = hm.index_copy(0, low, flip_heatmap_average(hm.index_select(0, low), hm_flip, self._index(hm)))
+        return hm
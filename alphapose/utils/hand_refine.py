@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""Second-stage fingertip refinement with the single_hand model.
+
+The whole-body model sees a hand as a few heatmap pixels. For every hand
+that is raised or pointing, a tight box is built from the body model's wrist
+and hand keypoints, all such crops of a frame are run through the 21 joint
+single_hand model in one batch at its native input size, and the refined
+joints replace the hand joints of the 136 keypoint result.
+"""
+import numpy as np
+import torch
+from easydict import EasyDict as edict
+
+from alphapose.models import builder
+from alphapose.utils.presets import SimpleTransform
+from alphapose.utils.stream_writer import to_numpy
+from alphapose.utils.transforms import get_func_heatmap_to_coord
+
+''' Halpe-136 / coco-wholebody-136 joint indices '''
+L_SHOULDER, R_SHOULDER = 5, 6
+L_ELBOW, R_ELBOW = 7, 8
+L_WRIST, R_WRIST = 9, 10
+L_HAND = list(range(94, 115))
+R_HAND = list(range(115, 136))
+
+''' (shoulder, elbow, wrist, hand joints) of the left and right arm '''
+ARMS = ((L_SHOULDER, L_ELBOW, L_WRIST, L_HAND), (R_SHOULDER, R_ELBOW, R_WRIST, R_HAND))
+
+
+def active_hands(kpts, scores, score_thres=0.3, straight_cos=0.85):
+    """Which hands are raised or pointing.
+
+    Parameters
+    ----------
+    kpts: array (N, 136, 2) image coordinates
+    scores: array (N, 136) or (N, 136, 1)
+
+    Returns
+    -------
+    bool array (N, 2) for the left and right hand. A hand is raised when the
+    wrist is above the elbow, and pointing when the arm is nearly straight
+    and the forearm is closer to horizontal than hanging down.
+    """
+    kpts = np.asarray(kpts, dtype=np.float32)
+    scores = np.asarray(scores, dtype=np.float32).reshape(kpts.shape[:2])
+    out = np.zeros((len(kpts), 2), dtype=bool)
+    for a, (shoulder, elbow, wrist, _) in enumerate(ARMS):
+        seen = (scores[:, [shoulder, elbow, wrist]] > score_thres).all(axis=1)
+        upper = kpts[:, elbow] - kpts[:, shoulder]
+        fore = kpts[:, wrist] - kpts[:, elbow]
+        cos = (upper * fore).sum(-1) / np.maximum(
+            np.linalg.norm(upper, axis=-1) * np.linalg.norm(fore, axis=-1), 1e-6)
+        # image y grows downwards
+        raised = kpts[:, wrist, 1] < kpts[:, elbow, 1]
+        pointing = (cos > straight_cos) & (fore[:, 1] < np.abs(fore[:, 0]))
+        out[:, a] = seen & (raised | pointing)
+    return out
+
+
+def hand_boxes(kpts, scores, arm, score_thres=0.05, min_forearm=0.6):
+    """xyxy hand boxes (N, 4) of one arm from the wrist and the body model's hand joints.
+
+    The box is at least min_forearm times the forearm length, so a hand with
+    few confident joints still gets a crop that contains the fingers.
+    """
+    _, elbow, wrist, hand = ARMS[arm]
+    kpts = np.asarray(kpts, dtype=np.float32)
+    scores = np.asarray(scores, dtype=np.float32).reshape(kpts.shape[:2])
+    pts = kpts[:, [wrist] + hand]
+    ok = scores[:, [wrist] + hand] > score_thres
+    ok[:, 0] = True
+    lo = np.where(ok[..., None], pts, np.inf).min(axis=1)
+    hi = np.where(ok[..., None], pts, -np.inf).max(axis=1)
+    center = (lo + hi) / 2
+    forearm = np.linalg.norm(kpts[:, wrist] - kpts[:, elbow], axis=-1)
+    size = np.maximum((hi - lo).max(axis=1), min_forearm * forearm)
+    return np.concatenate((center - size[:, None] / 2, center + size[:, None] / 2), axis=1)
+
+
+class HandRefiner():
+    """Refine the hand joints of whole-body results with the single_hand model.
+
+    cfg: single_hand config, e.g. configs/single_hand/resnet/256x192_res50_lr1e-3_2x-dcn-regression.yaml
+    checkpoint: single_hand weights
+    """
+    def __init__(self, cfg, checkpoint, device, batchSize=16, score_thres=0.3, merge_thres=0.05):
+        self.cfg = cfg
+        self.device = device
+        self.batchSize = batchSize
+        self.score_thres = score_thres
+        self.merge_thres = merge_thres
+
+        print(f'Loading hand model from {checkpoint}...')
+        self.model = builder.build_sppe(cfg.MODEL, preset_cfg=cfg.DATA_PRESET, checkpoint=checkpoint, device=device)
+        self.model.to(device)
+        self.model.eval()
+
+        self._input_size = cfg.DATA_PRESET.IMAGE_SIZE
+        self._hm_size = cfg.DATA_PRESET.HEATMAP_SIZE
+        self.norm_type = cfg.LOSS.get('NORM_TYPE', None)
+        self.heatmap_to_coord = get_func_heatmap_to_coord(cfg)
+        self.transformation = SimpleTransform(
+            edict({'joint_pairs': []}), scale_factor=0,
+            input_size=self._input_size,
+            output_size=self._hm_size,
+            rot=0, sigma=cfg.DATA_PRESET.SIGMA,
+            train=False, add_dpg=False)
+
+    def refine(self, image, pose):
+        """Refine the raised or pointing hands of a pose result in place.
+
+        image: the RGB frame the pose result was computed on
+        pose: dict with 'result', as returned by the DataWriter
+        """
+        if pose is None or len(pose['result']) == 0:
+            return pose
+        humans = pose['result']
+        kpts = np.stack([to_numpy(h['keypoints']) for h in humans])
+        if kpts.shape[1] != 136:
+            return pose
+        scores = np.stack([to_numpy(h['kp_score']).reshape(-1) for h in humans])
+
+        active = active_hands(kpts, scores, score_thres=self.score_thres)
+        person_idx, arm_idx = np.nonzero(active)
+        if len(person_idx) == 0:
+            return pose
+        boxes = np.stack([hand_boxes(kpts, scores, a) for a in range(2)])[arm_idx, person_idx]
+
+        inps = torch.zeros(len(boxes), 3, *self._input_size)
+        cropped_boxes = []
+        for i, box in enumerate(boxes):
+            inps[i], cropped_box = self.transformation.test_transform(image, box)
+            cropped_boxes.append(cropped_box)
+
+        with torch.no_grad():
+            hm = []
+            for j in range(0, len(inps), self.batchSize):
+                hm.append(self.model(inps[j:j + self.batchSize].to(self.device)).cpu())
+            hm = torch.cat(hm)
+
+        for i in range(len(hm)):
+            coord, score = self.heatmap_to_coord(hm[i], cropped_boxes[i], hm_shape=self._hm_size,
+                                                 norm_type=self.norm_type)
+            self._merge(humans[person_idx[i]], ARMS[arm_idx[i]][3], coord, score.reshape(-1))
+        return pose
+
+    def _merge(self, human, joints, coord, score):
+        # only joints the hand model is confident about replace the body model's
+        keep = score > self.merge_thres
+        idx = torch.from_numpy(np.asarray(joints)[keep])
+        keypoints = human['keypoints'].clone()
+        kp_score = human['kp_score'].clone()
+        keypoints[idx] = torch.from_numpy(coord[keep]).to(keypoints.dtype)
+        kp_score[idx] = torch.from_numpy(score[keep]).to(kp_score.dtype).reshape(-1, *kp_score.shape[1:])
+        human['keypoints'] = keypoints
+        human['kp_score'] = kp_score
+
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from alphapose.utils.stream_writer import to_numpy, to_float
+
+''' Constant Configuration '''
+META_FILE = 'meta.json'
+COLUMNS = ['ids', 'boxes', 'keypoints', 'kp_scores', 'scores']
+
+
+class ArchiveWriter():
+    '''
+    Write results to a columnar keypoint archive.
+    The archive is a directory of chunks, each holding `frame_offsets`
+    (F + 1,) and the person columns `ids` (N,), `boxes` (N, 4) in xywh,
+    `keypoints` (N, K, 2), `kp_scores` (N, K) and `scores` (N,).
+    Uncompressed chunks are plain .npy files that can be memory-mapped,
+    compressed chunks are one .npz each.
+    '''
+    def __init__(self, path, chunk_size=1024, compress=True):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.compress = compress
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.imgnames = []
+        self.chunks = []
+        self.num_joints = None
+        self._reset()
+
+    def _reset(self):
+        self._counts = []
+        self._columns = {k: [] for k in COLUMNS}
+
+    def write(self, im_res):
+        humans = im_res['result']
+        self.imgnames.append(im_res['imgname'])
+        self._counts.append(len(humans))
+        if len(humans) > 0:
+            kpts = np.stack([to_numpy(h['keypoints']).reshape(-1, 2) for h in humans]).astype(np.float32)
+            self.num_joints = kpts.shape[1]
+            self._columns['keypoints'].append(kpts)
+            self._columns['kp_scores'].append(
+                np.stack([to_numpy(h['kp_score']).reshape(-1) for h in humans]).astype(np.float32))
+            self._columns['scores'].append(
+                np.array([to_float(h['proposal_score']) for h in humans], dtype=np.float32))
+            self._columns['ids'].append(
+                np.array([to_float(h.get('idx', 0)) for h in humans], dtype=np.int64))
+            self._columns['boxes'].append(
+                np.array([[to_float(v) for v in h['box']] if 'box' in h else [0] * 4 for h in humans],
+                         dtype=np.float32).reshape(-1, 4))
+        if len(self._counts) == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if len(self._counts) == 0:
+            return
+        K = self.num_joints or 0
+        empty = {
+            'ids': np.zeros((0,), np.int64), 'boxes': np.zeros((0, 4), np.float32),
+            'keypoints': np.zeros((0, K, 2), np.float32), 'kp_scores': np.zeros((0, K), np.float32),
+            'scores': np.zeros((0,), np.float32)
+        }
+        arrays = {k: np.concatenate(v) if len(v) else empty[k] for k, v in self._columns.items()}
+        arrays['frame_offsets'] = np.concatenate(([0], np.cumsum(self._counts))).astype(np.int64)
+
+        name = 'chunk_%05d' % len(self.chunks)
+        if self.compress:
+            np.savez_compressed(os.path.join(self.path, name + '.npz'), **arrays)
+        else:
+            os.makedirs(os.path.join(self.path, name), exist_ok=True)
+            for k, v in arrays.items():
+                np.save(os.path.join(self.path, name, k + '.npy'), v)
+        start = self.chunks[-1]['end'] if len(self.chunks) else 0
+        self.chunks.append({'name': name, 'start': start, 'end': start + len(self._counts)})
+        self._reset()
+
+    def close(self):
+        self.flush()
+        meta = {
+            'num_joints': self.num_joints,
+            'compress': self.compress,
+            'imgnames': self.imgnames,
+            'chunks': self.chunks
+        }
+        with open(os.path.join(self.path, META_FILE), 'w') as meta_file:
+            json.dump(meta, meta_file)
+
+
+class KeypointArchive():
+    '''
+    Random access by frame into an archive written by ArchiveWriter
+    '''
+    def __init__(self, path, mmap=True):
+        self.path = path
+        self.mmap_mode = 'r' if mmap else None
+        with open(os.path.join(path, META_FILE), 'r') as meta_file:
+            meta = json.load(meta_file)
+        self.num_joints = meta['num_joints']
+        self.compress = meta['compress']
+        self.imgnames = meta['imgnames']
+        self.chunks = meta['chunks']
+        self._starts = np.array([c['start'] for c in self.chunks], dtype=np.int64)
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.imgnames)
+
+    def chunk(self, c):
+        if c not in self._cache:
+            name = self.chunks[c]['name']
+            if self.compress:
+                with np.load(os.path.join(self.path, name + '.npz')) as data:
+                    arrays = {k: data[k] for k in data.files}
+                # keep only the most recent compressed chunk in memory
+                self._cache.clear()
+            else:
+                arrays = {k: np.load(os.path.join(self.path, name, k + '.npy'), mmap_mode=self.mmap_mode)
+                          for k in COLUMNS + ['frame_offsets']}
+            self._cache[c] = arrays
+        return self._cache[c]
+
+    def __getitem__(self, i):
+        '''
+        return: dict with imgname and the person columns of frame i
+        '''
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('frame index {} out of range'.format(i))
+        c = int(np.searchsorted(self._starts, i, side='right')) - 1
+        arrays = self.chunk(c)
+        j = i - self.chunks[c]['start']
+        lo, hi = arrays['frame_offsets'][j], arrays['frame_offsets'][j + 1]
+        frame = {k: arrays[k][lo:hi] for k in COLUMNS}
+        frame['imgname'] = self.imgnames[i]
+        return frame
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def archive_to_json(archive_path, outputpath, for_eval=False, outputfile='alphapose-results.json'):
+    '''
+    Convert an archive to the coco result json written by write_json
+    '''
+    archive = KeypointArchive(archive_path)
+    with open(os.path.join(outputpath, outputfile), 'w') as json_file:
+        json_file.write('[')
+        first = True
+        for frame in archive:
+            if len(frame['ids']) == 0:
+                continue
+            im_name = frame['imgname']
+            if for_eval:
+                image_id = int(os.path.basename(im_name).split('.')[0].split('_')[-1])
+            else:
+                image_id = os.path.basename(im_name)
+            kpts = np.concatenate((frame['keypoints'], frame['kp_scores'][:, :, None]), axis=2)
+            kpts = kpts.astype(np.float64).reshape(len(kpts), -1).tolist()
+            boxes = frame['boxes'].astype(np.float64).tolist()
+            scores = frame['scores'].astype(np.float64).tolist()
+            ids = frame['ids'].tolist()
+            for n in range(len(kpts)):
+                result = {
+                    'image_id': image_id,
+                    'category_id': 1,
+                    'keypoints': kpts[n],
+                    'score': scores[n],
+                    'box': boxes[n],
+                    'idx': ids[n]
+                }
+                if not first:
+                    json_file.write(', ')
+                json_file.write(json.dumps(result))
+                first = False
+        json_file.write(']')
+
+
+def json_to_archive(json_path, archive_path, chunk_size=1024, compress=True):
+    '''
+    Convert a coco result json (list of person records) to an archive
+    '''
+    with open(json_path, 'r') as json_file:
+        records = json.load(json_file)
+    images = OrderedDict()
+    for record in records:
+        images.setdefault(record['image_id'], []).append(record)
+
+    writer = ArchiveWriter(archive_path, chunk_size=chunk_size, compress=compress)
+    for image_id, persons in images.items():
+        result = []
+        for pose in persons:
+            kpts = np.array(pose['keypoints'], dtype=np.float32).reshape((-1, 3))
+            result.append({
+                'keypoints': kpts[:, 0:2],
+                'kp_score': kpts[:, 2],
+                'proposal_score': pose['score'],
+                'idx': pose.get('idx', 0),
+                'box': pose.get('box', pose.get('bbox', [0, 0, 0, 0]))
+            })
+        writer.write({'imgname': str(image_id), 'result': result})
+    writer.close()
+    return writer
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""Multi-camera RGB-D keypoint fusion.
+
+Every view has intrinsics and a camera -> world Extrinsics from
+alphapose.utils.calibration. 2D results of all views (one batched forward,
+see PoseService.process) are associated across views with epipolar and depth
+consistency, and each person's joints are fused into world coordinates by
+confidence-weighted DLT triangulation, falling back to the confidence
+weighted average of the depth deprojections where fewer than two views see a
+joint. Capture and replay share one interface, so the fusion runs the same
+on recordings as on live cameras.
+"""
+import glob
+import json
+import os
+import time
+import warnings
+
+import numpy as np
+
+from alphapose.utils.calibration import Extrinsics
+from alphapose.utils.depth_raymarch import intrinsics_to_tuple
+
+EPS = 1e-9
+
+
+class CameraModel():
+    """Pinhole camera with its camera -> world transform."""
+    def __init__(self, intrin, cam_to_world=None, depth_scale=0.001):
+        self.fx, self.fy, self.cx, self.cy = [float(v) for v in intrinsics_to_tuple(intrin)]
+        if not isinstance(cam_to_world, Extrinsics):
+            cam_to_world = Extrinsics(np.eye(4) if cam_to_world is None else cam_to_world)
+        self.cam_to_world = cam_to_world
+        self.world_to_cam = cam_to_world.inverse()
+        self.depth_scale = depth_scale
+        self.K = np.array([[self.fx, 0, self.cx], [0, self.fy, self.cy], [0, 0, 1]])
+        self.P = self.K @ self.world_to_cam.matrix
+
+    @property
+    def center(self):
+        return self.cam_to_world.translation
+
+    def to_dict(self):
+        return {'intrin': [self.fx, self.fy, self.cx, self.cy],
+                'cam_to_world': self.cam_to_world.matrix.tolist(), 'depth_scale': self.depth_scale}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['intrin'], d['cam_to_world'], d.get('depth_scale', 0.001))
+
+    def project(self, points):
+        """World points (..., 3) to pixels (..., 2) and camera depth (...)."""
+        cam = self.world_to_cam.apply(points)
+        z = cam[..., 2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            uv = np.stack((self.fx * cam[..., 0] / z + self.cx, self.fy * cam[..., 1] / z + self.cy), -1)
+        return uv, z
+
+    def deproject(self, kpts, depth, window=2):
+        """Keypoints (..., 2) to world points (..., 3) using the median valid depth
+        of a (2 * window + 1)^2 patch. Missing depth gives nan."""
+        kpts = np.asarray(kpts, dtype=np.float64)
+        h, w = depth.shape
+        u = np.clip(np.round(kpts[..., 0]).astype(np.int64), 0, w - 1)
+        v = np.clip(np.round(kpts[..., 1]).astype(np.int64), 0, h - 1)
+        offs = np.arange(-window, window + 1)
+        uu = np.clip(u[..., None, None] + offs[None, :], 0, w - 1)
+        vv = np.clip(v[..., None, None] + offs[:, None], 0, h - 1)
+        patch = depth[vv, uu].reshape(kpts.shape[:-1] + (-1,)).astype(np.float64)
+        patch[patch == 0] = np.nan
+        with warnings.catch_warnings():
+            # all-nan patches are expected where depth is missing
+            warnings.simplefilter('ignore', RuntimeWarning)
+            z = np.nanmedian(patch, axis=-1) * self.depth_scale
+        cam = np.stack(((kpts[..., 0] - self.cx) / self.fx * z, (kpts[..., 1] - self.cy) / self.fy * z, z), -1)
+        return self.cam_to_world.apply(cam)
+
+
+def fundamental(cam_a, cam_b):
+    """Fundamental matrix F with x_b^T F x_a = 0."""
+    C = np.append(cam_a.center, 1.)
+    e = cam_b.P @ C
+    ex = np.array([[0, -e[2], e[1]], [e[2], 0, -e[0]], [-e[1], e[0], 0]])
+    return ex @ cam_b.P @ np.linalg.pinv(cam_a.P)
+
+
+def epipolar_distance(F, xa, xb):
+    """Symmetric point to epipolar line distance in pixels, (..., K) for (..., K, 2) inputs."""
+    ha = np.concatenate((xa, np.ones(xa.shape[:-1] + (1,))), -1)
+    hb = np.concatenate((xb, np.ones(xb.shape[:-1] + (1,))), -1)
+    la = ha @ F.T       # lines in b
+    lb = hb @ F         # lines in a
+    num = np.abs((hb * la).sum(-1))
+    return 0.5 * (num / np.maximum(np.linalg.norm(la[..., :2], axis=-1), EPS) +
+                  num / np.maximum(np.linalg.norm(lb[..., :2], axis=-1), EPS))
+
+
+def triangulate(projections, points, weights):
+    """Confidence-weighted DLT for many joints at once.
+
+    projections: (V, 3, 4)
+    points: (V, J, 2) pixels
+    weights: (V, J), 0 for views that do not see the joint
+
+    Returns world points (J, 3), nan where fewer than two views have weight.
+    """
+    P = np.asarray(projections, dtype=np.float64)
+    x = np.asarray(points, dtype=np.float64)
+    w = np.nan_to_num(np.asarray(weights, dtype=np.float64))
+    x = np.nan_to_num(x)
+    # rows u * P3 - P1 and v * P3 - P2 of every view, per joint: (J, 2V, 4)
+    rows_u = x[..., 0:1] * P[:, None, 2] - P[:, None, 0]
+    rows_v = x[..., 1:2] * P[:, None, 2] - P[:, None, 1]
+    A = np.concatenate((rows_u * w[..., None], rows_v * w[..., None]), 0).transpose(1, 0, 2)
+    _, _, Vt = np.linalg.svd(A)
+    X = Vt[:, -1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = X[:, :3] / X[:, 3:]
+    out[(w > 0).sum(0) < 2] = np.nan
+    return out
+
+
+def associate(cameras, views, depths=None, score_thres=0.3, max_epipolar=20., max_depth_gap=0.3):
+    """Group the people of all views into cross-view identities.
+
+    views: per view a (kpts (N, K, 2), scores (N, K)) pair
+    depths: optional per view depth image for the depth consistency term
+
+    Returns a list of clusters, each a dict {view index: person index}.
+    Pairs are merged greedily from the most consistent one, a cluster holds
+    at most one person per view.
+    """
+    V = len(cameras)
+    world = []
+    for v in range(V):
+        if depths is not None and depths[v] is not None and len(views[v][0]):
+            world.append(cameras[v].deproject(views[v][0], depths[v]))
+        else:
+            world.append(None)
+
+    edges = []
+    for a in range(V):
+        for b in range(a + 1, V):
+            ka, sa = views[a]
+            kb, sb = views[b]
+            if len(ka) == 0 or len(kb) == 0:
+                continue
+            F = fundamental(cameras[a], cameras[b])
+            # (Na, Nb, K) pairwise joint distances
+            dist = epipolar_distance(F, ka[:, None], kb[None, :])
+            both = (sa[:, None] > score_thres) & (sb[None, :] > score_thres)
+            cost = _masked_mean(dist, both) / max_epipolar
+            if world[a] is not None and world[b] is not None:
+                gap = np.linalg.norm(world[a][:, None] - world[b][None, :], axis=-1)
+                ok = both & np.isfinite(gap)
+                depth_cost = _masked_mean(np.nan_to_num(gap), ok) / max_depth_gap
+                cost = np.where(np.isfinite(depth_cost), (cost + depth_cost) / 2, cost)
+            for i, j in zip(*np.nonzero(cost < 1.)):
+                edges.append((cost[i, j], (a, int(i)), (b, int(j))))
+
+    cluster_of = {}
+    clusters = []
+    for _, na, nb in sorted(edges, key=lambda e: e[0]):
+        ca, cb = cluster_of.get(na), cluster_of.get(nb)
+        if ca is None and cb is None:
+            clusters.append({na[0]: na[1], nb[0]: nb[1]})
+            cluster_of[na] = cluster_of[nb] = len(clusters) - 1
+        elif ca is None or cb is None:
+            c, (view, person) = (cb, na) if ca is None else (ca, nb)
+            if view not in clusters[c]:
+                clusters[c][view] = person
+                cluster_of[(view, person)] = c
+        elif ca != cb and not set(clusters[ca]) & set(clusters[cb]):
+            for view, person in clusters[cb].items():
+                clusters[ca][view] = person
+                cluster_of[(view, person)] = ca
+            clusters[cb] = {}
+    clusters = [c for c in clusters if c]
+    # people seen by a single view are their own identity
+    for v in range(V):
+        for n in range(len(views[v][0])):
+            if (v, n) not in cluster_of:
+                clusters.append({v: n})
+    return clusters
+
+
+def _masked_mean(x, mask):
+    cnt = mask.sum(-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(cnt > 0, (x * mask).sum(-1) / cnt, np.inf)
+
+
+def fuse(cameras, views, clusters, depths=None, score_thres=0.3, method='triangulate'):
+    """World keypoints (P, K, 3) and confidences (P, K) of every cluster.
+
+    method: 'triangulate' uses DLT where two or more views see the joint and
+    the depth average elsewhere, 'depth' always averages the deprojections.
+    """
+    K = next(k.shape[1] for k, _ in views if len(k))
+    out = np.full((len(clusters), K, 3), np.nan)
+    conf = np.zeros((len(clusters), K))
+    for c, cluster in enumerate(clusters):
+        vs = sorted(cluster)
+        kp = np.stack([views[v][0][cluster[v]] for v in vs])
+        sc = np.stack([views[v][1][cluster[v]] for v in vs]).reshape(len(vs), K)
+        w = np.where(sc > score_thres, sc, 0.)
+        conf[c] = w.max(0)
+
+        if depths is not None:
+            pts = np.stack([cameras[v].deproject(kp[i], depths[v]) if depths[v] is not None
+                            else np.full((K, 3), np.nan) for i, v in enumerate(vs)])
+            wd = np.where(np.isfinite(pts).all(-1), w, 0.)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                out[c] = (np.nan_to_num(pts) * wd[..., None]).sum(0) / wd.sum(0)[:, None]
+        if method == 'triangulate' and len(vs) > 1:
+            tri = triangulate(np.stack([cameras[v].P for v in vs]), kp, w)
+            good = np.isfinite(tri).all(-1)
+            out[c][good] = tri[good]
+    return out, conf
+
+
+class MultiCameraCapture():
+    """Timestamp-matched aligned color + depth from several RealSense cameras.
+
+    read() returns a list of (color, depth, timestamp in ms) per view, or
+    None when no matched set arrived within timeout.
+    """
+    def __init__(self, serials, width=640, height=480, fps=30, max_skew=20., timeout=1.):
+        import pyrealsense2 as rs
+        self.rs = rs
+        self.max_skew = max_skew
+        self.timeout = timeout
+        self.pipelines = []
+        self.intrinsics = []
+        self.depth_scales = []
+        self.align = rs.align(rs.stream.color)
+        for serial in serials:
+            pipeline = rs.pipeline()
+            config = rs.config()
+            config.enable_device(serial)
+            config.enable_stream(rs.stream.color, width, height, rs.format.rgb8, fps)
+            config.enable_stream(rs.stream.depth, width, height, rs.format.z16, fps)
+            profile = pipeline.start(config)
+            self.pipelines.append(pipeline)
+            self.depth_scales.append(profile.get_device().first_depth_sensor().get_depth_scale())
+            color = profile.get_stream(rs.stream.color).as_video_stream_profile()
+            self.intrinsics.append(color.get_intrinsics())
+        self._latest = [None] * len(self.pipelines)
+
+    def read(self):
+        deadline = time.time() + self.timeout
+        while time.time() < deadline:
+            for i, pipeline in enumerate(self.pipelines):
+                frames = pipeline.poll_for_frames()
+                if frames:
+                    frames = self.align.process(frames)
+                    color, depth = frames.get_color_frame(), frames.get_depth_frame()
+                    if color and depth:
+                        self._latest[i] = (np.asanyarray(color.get_data()).copy(),
+                                           np.asanyarray(depth.get_data()).copy(), frames.get_timestamp())
+            if all(f is not None for f in self._latest):
+                stamps = [f[2] for f in self._latest]
+                if max(stamps) - min(stamps) <= self.max_skew:
+                    views, self._latest = self._latest, [None] * len(self.pipelines)
+                    return views
+                # drop the oldest view and wait for its next frame
+                self._latest[int(np.argmin(stamps))] = None
+            time.sleep(0.001)
+        return None
+
+    def release(self):
+        for pipeline in self.pipelines:
+            pipeline.stop()
+
+
+class Recorder():
+    """Record matched view sets to a directory that ReplayCapture reads back."""
+    def __init__(self, path, cameras):
+        self.path = path
+        if not os.path.exists(path):
+            os.makedirs(path)
+        with open(os.path.join(path, 'cameras.json'), 'w') as f:
+            json.dump([cam.to_dict() for cam in cameras], f)
+        self.count = 0
+
+    def write(self, views):
+        arrays = {}
+        for v, (color, depth, stamp) in enumerate(views):
+            arrays['color_%d' % v] = color
+            arrays['depth_%d' % v] = depth
+            arrays['stamp_%d' % v] = np.float64(stamp)
+        np.savez_compressed(os.path.join(self.path, 'frame_%06d.npz' % self.count), **arrays)
+        self.count += 1
+
+
+class ReplayCapture():
+    """Replay a Recorder directory with the MultiCameraCapture interface."""
+    def __init__(self, path):
+        with open(os.path.join(path, 'cameras.json'), 'r') as f:
+            self.cameras = [CameraModel.from_dict(d) for d in json.load(f)]
+        self.files = sorted(glob.glob(os.path.join(path, 'frame_*.npz')))
+        self.index = 0
+
+    def __len__(self):
+        return len(self.files)
+
+    def read(self):
+        if self.index >= len(self.files):
+            return None
+        with np.load(self.files[self.index]) as data:
+            views = [(data['color_%d' % v], data['depth_%d' % v], float(data['stamp_%d' % v]))
+                     for v in range(len(self.cameras))]
+        self.index += 1
+        return views
+
+    def release(self):
+        pass
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""Operator-of-interest gating between detection and pose estimation.
+
+Every detected person is scored by detection confidence, distance to the
+robot (from the aligned depth frame), overlap with a workspace zone in the
+image, how long they have been the operator, and whether they had an arm
+raised in the previous frame. Only the top-k candidates are cropped and
+passed to the pose model; their ids are stable operator ids, so downstream
+consumers can follow the same person across frames.
+
+The distance term needs the depth frames of demo_api (RealSense), it is the
+distance to --robot_position when given, else the camera depth of the
+person. demo_inference has no depth and ranks without it.
+"""
+import numpy as np
+import torch
+
+from alphapose.utils.depth_raymarch import intrinsics_to_tuple
+from alphapose.utils.stream_writer import to_float, to_numpy
+
+''' Halpe / COCO body joint indices used by the raised-arm heuristic '''
+L_SHOULDER, R_SHOULDER = 5, 6
+L_WRIST, R_WRIST = 9, 10
+
+DEFAULT_WEIGHTS = {
+    'det': 1.0,         # detection score
+    'zone': 1.0,        # fraction of the box inside the workspace zone
+    'distance': 1.0,    # 1 at the robot, 0 at max_distance
+    'track': 0.5,       # persistence, saturates after track_frames frames
+    'raised': 1.0       # an arm was raised in the previous frame
+}
+
+
+def _iou(a, b):
+    # a (N, 4), b (M, 4) xyxy -> (N, M)
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), axis=-1)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=-1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=-1)
+    return inter / np.maximum(area_a[:, None] + area_b[None] - inter, 1e-6)
+
+
+class OperatorSelector():
+    """Keep the top_k most likely operators of every frame.
+
+    Parameters
+    ----------
+    top_k: number of people forwarded to pose estimation
+    zone: optional workspace zone (x1, y1, x2, y2) in pixels
+    intrin: camera intrinsics, needed to measure the distance to robot_position
+    robot_position: robot base in camera coordinates (meters); without it the
+        camera depth of the person is used as the distance
+    max_distance: people further away than this (meters) are never operators
+    match_iou: IoU needed to continue an operator track from the last frame
+    """
+    def __init__(self, top_k=1, zone=None, intrin=None, robot_position=None, max_distance=3.0,
+                 weights=None, track_frames=15, match_iou=0.3, depth_scale=0.001):
+        self.top_k = top_k
+        self.zone = None if zone is None else np.asarray(zone, dtype=np.float64)
+        self.intrin = None if intrin is None else intrinsics_to_tuple(intrin)
+        self.robot_position = None if robot_position is None else np.asarray(robot_position, dtype=np.float64)
+        self.max_distance = max_distance
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.track_frames = track_frames
+        self.match_iou = match_iou
+        self.depth_scale = depth_scale
+
+        self._next_id = 1
+        # operator id -> {'box', 'age', 'raised'}
+        self.tracks = {}
+
+    def set_intrinsics(self, intrin):
+        """Camera intrinsics of the depth frames, known once the camera streams."""
+        self.intrin = intrinsics_to_tuple(intrin)
+
+    def distances(self, boxes, depth):
+        """Distance of every box (N, 4) to the robot in meters, inf without depth."""
+        out = np.full(len(boxes), np.inf)
+        if depth is None:
+            return out
+        h, w = depth.shape
+        for i, (x1, y1, x2, y2) in enumerate(boxes):
+            # central part of the box, away from background at the edges
+            cx, cy, bw, bh = (x1 + x2) / 2, (y1 + y2) / 2, (x2 - x1) / 4, (y2 - y1) / 4
+            patch = depth[int(np.clip(cy - bh, 0, h - 1)):int(np.clip(cy + bh, 1, h)),
+                          int(np.clip(cx - bw, 0, w - 1)):int(np.clip(cx + bw, 1, w))]
+            patch = patch[patch > 0]
+            if len(patch) == 0:
+                continue
+            z = float(np.median(patch)) * self.depth_scale
+            if self.robot_position is None or self.intrin is None:
+                out[i] = z
+            else:
+                fx, fy, ppx, ppy = self.intrin
+                point = np.array([(cx - ppx) / fx * z, (cy - ppy) / fy * z, z])
+                out[i] = np.linalg.norm(point - self.robot_position)
+        return out
+
+    def score(self, boxes, scores, depth=None):
+        """Operator score of every box and the track each box continues (-1 for none)."""
+        w = self.weights
+        total = w['det'] * scores
+        if self.zone is not None:
+            x1 = np.maximum(boxes[:, 0], self.zone[0])
+            y1 = np.maximum(boxes[:, 1], self.zone[1])
+            x2 = np.minimum(boxes[:, 2], self.zone[2])
+            y2 = np.minimum(boxes[:, 3], self.zone[3])
+            inside = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+            area = np.maximum(np.prod(boxes[:, 2:] - boxes[:, :2], axis=1), 1e-6)
+            total = total + w['zone'] * inside / area
+        if depth is not None:
+            dist = self.distances(boxes, depth)
+            total = total + w['distance'] * np.clip(1 - dist / self.max_distance, 0, 1)
+            total = np.where(dist > self.max_distance, -np.inf, total)
+
+        matched = np.full(len(boxes), -1, dtype=np.int64)
+        if self.tracks:
+            track_ids = list(self.tracks)
+            iou = _iou(boxes, np.stack([self.tracks[t]['box'] for t in track_ids]))
+            # greedy one-to-one matching by IoU
+            for flat in np.argsort(-iou, axis=None):
+                i, j = np.unravel_index(flat, iou.shape)
+                if iou[i, j] < self.match_iou:
+                    break
+                if matched[i] >= 0 or track_ids[j] in matched:
+                    continue
+                matched[i] = track_ids[j]
+            for i in np.flatnonzero(matched >= 0):
+                track = self.tracks[int(matched[i])]
+                total[i] += w['track'] * min(track['age'] / self.track_frames, 1.)
+                total[i] += w['raised'] * float(track['raised'])
+        return total, matched
+
+    def select(self, boxes, scores, depth=None):
+        """Pick the operators of a frame.
+
+        boxes: (N, 4) xyxy tensor or array, scores: (N,) or (N, 1)
+
+        Returns the kept indices into boxes, best first, and their operator
+        ids as an (k, 1) float tensor like the detector ids.
+        """
+        boxes_np = to_numpy(boxes).astype(np.float64).reshape(-1, 4)
+        total, matched = self.score(boxes_np, to_numpy(scores).astype(np.float64).reshape(-1), depth)
+
+        order = [i for i in np.argsort(-total, kind='stable') if np.isfinite(total[i])][:self.top_k]
+        tracks = {}
+        op_ids = []
+        for i in order:
+            op_id = int(matched[i])
+            if op_id < 0:
+                op_id = self._next_id
+                self._next_id += 1
+                tracks[op_id] = {'age': 0, 'raised': False}
+            else:
+                tracks[op_id] = self.tracks[op_id]
+            tracks[op_id]['box'] = boxes_np[i]
+            tracks[op_id]['age'] += 1
+            op_ids.append(op_id)
+        # operators that left or lost their place start over
+        self.tracks = tracks
+        return torch.as_tensor(np.asarray(order, dtype=np.int64)), \
+            torch.tensor(op_ids, dtype=torch.float32).reshape(-1, 1)
+
+    def update_pose(self, result):
+        """Feed the pose result of the frame back for the raised-arm term of the next one."""
+        if result is None:
+            return
+        for human in result['result']:
+            op_id = int(to_float(human['idx']))
+            if op_id not in self.tracks:
+                continue
+            kp = to_numpy(human['keypoints'])
+            # image y grows downwards
+            self.tracks[op_id]['raised'] = bool(kp[L_WRIST, 1] < kp[L_SHOULDER, 1] or kp[R_WRIST, 1] < kp[R_SHOULDER, 1])
+
+
+def pick_operator(humans, operator_id=None):
+    """The result entry to publish: the one with operator_id if present, else the best scored.
+
+    Returns (human, its id), or (None, operator_id) for an empty frame.
+    """
+    if len(humans) == 0:
+        return None, operator_id
+    ids = [int(to_float(h['idx'])) for h in humans]
+    if operator_id in ids:
+        k = ids.index(operator_id)
+    else:
+        k = int(np.argmax([to_float(h['proposal_score']) for h in humans]))
+    return humans[k], ids[k]
+
+
+def build_selector(opt, intrin=None):
+    """OperatorSelector from the --operators/--zone/--robot_position options, None when gating is off."""
+    top_k = getattr(opt, 'operators', 0)
+    if not top_k:
+        return None
+    return OperatorSelector(top_k=top_k, zone=getattr(opt, 'zone', None), intrin=intrin,
+                            robot_position=getattr(opt, 'robot_position', None))
+
+
+def gate_detections(selector, boxes, scores, ids, depth=None, keep_ids=False):
+    """Keep the operators among one frame's detections.
+
+    The detector ids are replaced by operator ids unless keep_ids is set,
+    e.g. when a tracker already assigns stable ids.
+    """
+    keep, op_ids = selector.select(boxes, scores, depth)
+    boxes, scores = boxes[keep], scores[keep]
+    ids = ids[keep] if keep_ids else op_ids.to(ids.dtype).reshape(-1, *ids.shape[1:])
+    return boxes, scores, ids
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""Vectorized pointing rays from whole-body keypoints.
+
+All functions broadcast over leading axes, so the same call handles one
+person, all people of a frame (N, K, D) or a recorded session (T, N, K, D).
+Keypoints may be 2D image coordinates or 3D camera/world coordinates.
+"""
+import numpy as np
+
+''' Halpe-136 / coco-wholebody-136 joint indices '''
+L_EYE, R_EYE = 1, 2
+L_SHOULDER, R_SHOULDER = 5, 6
+L_ELBOW, R_ELBOW = 7, 8
+L_WRIST, R_WRIST = 9, 10
+L_INDEX_TIP, R_INDEX_TIP = 102, 123
+
+''' Ray definitions: name -> ((left origin, left target), (right origin, right target)) '''
+POINTING_RAYS = {
+    'eye_fingertip': (([L_EYE, R_EYE], [L_INDEX_TIP]), ([L_EYE, R_EYE], [R_INDEX_TIP])),
+    'elbow_wrist': (([L_ELBOW], [L_WRIST]), ([R_ELBOW], [R_WRIST])),
+    'shoulder_wrist': (([L_SHOULDER], [L_WRIST]), ([R_SHOULDER], [R_WRIST])),
+}
+
+EPS = 1e-9
+
+
+def _ray_indices(ray):
+    if isinstance(ray, str):
+        ray = POINTING_RAYS[ray]
+    origin_idx = np.array([arm[0] for arm in ray])
+    target_idx = np.array([arm[1] for arm in ray])
+    return origin_idx, target_idx
+
+
+def build_rays(kpts, scores=None, ray='eye_fingertip'):
+    """Build one pointing ray per arm.
+
+    Parameters
+    ----------
+    kpts: array (..., K, D)
+    scores: array (..., K) or (..., K, 1), optional
+    ray: name in POINTING_RAYS or ((origin joints, target joints), ...) per arm.
+        Origin and target are the mean of their joints.
+
+    Returns
+    -------
+    origins (..., A, D), unit directions (..., A, D) and confidence (..., A),
+    where A is the number of arms (left, right). The confidence is the lowest
+    score of the joints used, and 0 for degenerate rays.
+    """
+    kpts = np.asarray(kpts, dtype=np.float64)
+    origin_idx, target_idx = _ray_indices(ray)
+    origins = kpts[..., origin_idx, :].mean(axis=-2)
+    targets = kpts[..., target_idx, :].mean(axis=-2)
+    directions = targets - origins
+    length = np.linalg.norm(directions, axis=-1)
+    directions = directions / np.maximum(length, EPS)[..., None]
+
+    if scores is None:
+        conf = np.ones(length.shape)
+    else:
+        scores = np.asarray(scores, dtype=np.float64)
+        if scores.shape[-1] == 1 and scores.ndim == kpts.ndim:
+            scores = scores[..., 0]
+        conf = np.minimum(scores[..., origin_idx].min(axis=-1), scores[..., target_idx].min(axis=-1))
+    conf = np.where(length > EPS, conf, 0.)
+    return origins, directions, conf
+
+
+def intersect_plane(origins, directions, plane_point, plane_normal):
+    """Intersect rays with planes.
+
+    plane_point and plane_normal are (D,) for one plane or (P, D) for P
+    planes, in which case the outputs get an extra trailing axis of size P.
+
+    Returns hit points (..., [P,] D), ray parameters t (..., [P]) and a valid
+    mask that is False for rays parallel to the plane or hitting it behind
+    the origin.
+    """
+    plane_point = np.asarray(plane_point, dtype=np.float64)
+    plane_normal = np.asarray(plane_normal, dtype=np.float64)
+    if plane_point.ndim == 2:
+        origins = origins[..., None, :]
+        directions = directions[..., None, :]
+    denom = (directions * plane_normal).sum(axis=-1)
+    dist = ((plane_point - origins) * plane_normal).sum(axis=-1)
+    parallel = np.abs(denom) < EPS
+    t = dist / np.where(parallel, 1., denom)
+    valid = ~parallel & (t > 0)
+    hits = origins + t[..., None] * directions
+    return hits, t, valid
+
+
+def intersect_box(origins, directions, box_min, box_max):
+    """Intersect rays with axis-aligned boxes using the slab method.
+
+    box_min and box_max are (D,) for one box or (B, D) for B boxes, in which
+    case the outputs get an extra trailing axis of size B.
+
+    Returns entry points (..., [B,] D), entry and exit parameters t_near,
+    t_far (..., [B]) and a hit mask. Rays starting inside a box enter at t=0.
+    """
+    box_min = np.asarray(box_min, dtype=np.float64)
+    box_max = np.asarray(box_max, dtype=np.float64)
+    if box_min.ndim == 2:
+        origins = origins[..., None, :]
+        directions = directions[..., None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv = 1. / directions
+        t1 = (box_min - origins) * inv
+        t2 = (box_max - origins) * inv
+    # a ray parallel to a slab is inside it for all t, or never
+    inside = (origins >= box_min) & (origins <= box_max)
+    parallel = directions == 0
+    t_lo = np.where(parallel, np.where(inside, -np.inf, np.inf), np.minimum(t1, t2))
+    t_hi = np.where(parallel, np.where(inside, np.inf, -np.inf), np.maximum(t1, t2))
+    t_near = np.maximum(t_lo.max(axis=-1), 0.)
+    t_far = t_hi.min(axis=-1)
+    hit = t_far >= t_near
+    points = origins + t_near[..., None] * directions
+    return points, t_near, t_far, hit
+
+
+def ray_angles(directions):
+    """Azimuth in the x-y plane and elevation above it, in radians."""
+    azimuth = np.arctan2(directions[..., 1], directions[..., 0])
+    elevation = np.arctan2(directions[..., 2], np.linalg.norm(directions[..., :2], axis=-1))
+    return azimuth, elevation
+
+
+def _expand(x, batch):
+    return x[..., None] if np.ndim(batch) == 2 else x
+
+
+def estimate_pointing(kpts, scores=None, ray='eye_fingertip', plane=None, box=None):
+    """Pointing rays of every person and arm, with their plane or workspace hits.
+
+    Parameters
+    ----------
+    kpts: array (..., K, 3) in a metric frame
+    scores: array (..., K), optional
+    plane: (point, normal), optional, e.g. ((0, 0, 0), (0, 0, 1)) for the table
+    box: (min corner, max corner), optional workspace box
+
+    Returns
+    -------
+    dict with origins, directions, confidence, azimuth and elevation per arm,
+    plus plane_hits/plane_valid and box_hits/box_valid when requested.
+    """
+    origins, directions, conf = build_rays(kpts, scores, ray=ray)
+    azimuth, elevation = ray_angles(directions)
+    res = {
+        'origins': origins,
+        'directions': directions,
+        'confidence': conf,
+        'azimuth': azimuth,
+        'elevation': elevation
+    }
+    if plane is not None:
+        hits, _, valid = intersect_plane(origins, directions, *plane)
+        res['plane_hits'] = hits
+        res['plane_valid'] = valid & _expand(conf > 0, plane[0])
+    if box is not None:
+        hits, _, _, valid = intersect_box(origins, directions, *box)
+        res['box_hits'] = hits
+        res['box_valid'] = valid & _expand(conf > 0, box[0])
+    return res
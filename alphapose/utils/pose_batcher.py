@@ -0,0 +1,84 @@
+"""Pose estimation batched across consecutive frames.
+
+With one or two people per frame a per-frame forward runs at batch 1-2.
+PoseBatcher holds the frames read from the detection loader until their
+crops fill a pose batch, or until the oldest held frame is older than the
+deadline, runs the pose model on all of them and hands the frames back in
+order with their heatmaps.
+"""
+import time
+
+import torch
+
+
+class PoseBatcher():
+    """Accumulate the crops of consecutive frames into full pose batches.
+
+    pose_model: pose model or PoseCascade
+    batchSize: crops per forward, divided by FlipTest.batch_factor by the caller
+    deadline: seconds the oldest frame may wait for the batch to fill,
+        None waits for a full batch, 0 runs every frame on its own
+    flip_test: FlipTest of the pose model, None to run it without flip test
+    """
+
+    def __init__(self, pose_model, batchSize, device, deadline=None, flip_test=None):
+        self.pose_model = pose_model
+        self.batchSize = batchSize
+        self.device = device
+        self.deadline = deadline
+        self.flip_test = flip_test
+        self._frames = []
+        self._num_crops = 0
+        self._since = None
+
+    def __len__(self):
+        return len(self._frames)
+
+    def add(self, frame):
+        """Hold a frame (inps, orig_img, im_name, boxes, scores, ids, cropped_boxes) of the detection loader.
+
+        Returns the (frame, hm) list of the frames whose pose is done,
+        empty while the batch is filling. hm is None for frames without people.
+        """
+        inps = frame[0]
+        if not self._frames:
+            self._since = time.time()
+        self._frames.append(frame)
+        if inps is not None and frame[3] is not None and frame[3].nelement() > 0:
+            self._num_crops += inps.size(0)
+        if self._num_crops >= self.batchSize or \
+                (self.deadline is not None and time.time() - self._since >= self.deadline):
+            return self.flush()
+        return []
+
+    def flush(self):
+        """Run the pose model on every held frame."""
+        frames, self._frames, self._num_crops = self._frames, [], 0
+        counts = [f[0].size(0) if f[3] is not None and f[3].nelement() > 0 else 0 for f in frames]
+        if sum(counts) == 0:
+            return [(f, None) for f in frames]
+
+        inps = torch.cat([f[0] for f, c in zip(frames, counts) if c]).to(self.device)
+        datalen = inps.size(0)
+        hm = []
+        for j in range(0, datalen, self.batchSize):
+            inps_j = inps[j:j + self.batchSize]
+            if self.flip_test is not None:
+                hm.append(self.flip_test(inps_j))
+            else:
+                hm.append(self.pose_model(inps_j))
+        sizes = [c for c in counts if c]
+        if isinstance(hm[0], torch.Tensor):
+            hm = torch.cat(hm).split(sizes)
+        else:
+            # CascadeHeatmaps of a PoseCascade
+            hm = type(hm[0]).cat(hm).split(sizes)
+
+        done, k = [], 0
+        for f, c in zip(frames, counts):
+            if c:
+                done.append((f, hm[k]))
+                k += 1
+            else:
+                done.append((f, None))
+        return done
@@ -0,0 +1,117 @@
+"""Light/heavy pose model cascade.
+
+A fast model (e.g. HarDNet-68 or FastPose res50) runs on every crop; the
+crops whose mean keypoint score on the required joints is below a
+threshold are run again through the heavy model of --cfg/--checkpoint.
+Both models share the crops, so they need the same input size. The
+writer decodes each model's heatmaps with its own decoder and outputs the
+joint layout of the heavy model, light results fill its first joints (the
+coco 17 body joints lead every halpe and coco-wholebody layout).
+"""
+import torch
+
+# shoulders, elbows and wrists, the joints the pointing gesture needs
+DEFAULT_JOINTS = [5, 6, 7, 8, 9, 10]
+
+
+class CascadeHeatmaps():
+    """Heatmaps of a cascade forward.
+
+    light: (N, K1, h1, w1) light model output for every person
+    heavy: (R, K2, h2, w2) heavy model output for the refined people
+    refined: (N,) bool, the people with heavy heatmaps, in order
+    """
+
+    def __init__(self, light, heavy, refined):
+        self.light = light
+        self.heavy = heavy
+        self.refined = refined
+
+    def __len__(self):
+        return len(self.light)
+
+    def cpu(self):
+        return CascadeHeatmaps(self.light.cpu(), self.heavy.cpu(), self.refined.cpu())
+
+    @classmethod
+    def cat(cls, items):
+        heavy = [h.heavy for h in items if len(h.heavy)]
+        return cls(torch.cat([h.light for h in items]), torch.cat(heavy) if heavy else items[0].heavy,
+                   torch.cat([h.refined for h in items]))
+
+    def split(self, sizes):
+        """Per-frame parts, like torch.split along the people."""
+        parts = []
+        start, heavy_start = 0, 0
+        for size in sizes:
+            refined = self.refined[start:start + size]
+            num_heavy = int(refined.sum())
+            parts.append(CascadeHeatmaps(self.light[start:start + size],
+                                         self.heavy[heavy_start:heavy_start + num_heavy], refined))
+            start += size
+            heavy_start += num_heavy
+        return parts
+
+
+class PoseCascade():
+    """Run the light model on all crops and the heavy one on the uncertain ones.
+
+    light_model, heavy_model: pose models or FlipTest of them
+    thresh: mean heatmap peak of the light model on `joints` below which a
+        crop goes through the heavy model
+    """
+
+    def __init__(self, light_model, heavy_model, thresh=0.5, joints=None):
+        self.light_model = light_model
+        self.heavy_model = heavy_model
+        self.thresh = thresh
+        self.joints = torch.LongTensor(joints if joints else DEFAULT_JOINTS)
+        self.num_light = 0
+        self.num_heavy = 0
+
+    def __call__(self, inps):
+        light = self.light_model(inps)
+        score = light.index_select(1, self.joints.to(light.device)).flatten(2).amax(dim=2).mean(dim=1)
+        refined = score < self.thresh
+        idx = refined.nonzero().view(-1)
+        if len(idx):
+            heavy = self.heavy_model(inps.index_select(0, idx))
+        else:
+            heavy = light.new_zeros(0, 0, 0, 0)
+        self.num_light += len(inps)
+        self.num_heavy += len(idx)
+        return CascadeHeatmaps(light, heavy, refined)
+
+
+def build_cascade(cfg, opt, heavy_model):
+    """PoseCascade from opt.cascade_cfg/opt.cascade_checkpoint in front of the heavy model.
+
+    With opt.flip both models are flip tested. Returns None when no cascade
+    is configured.
+    """
+    from alphapose.models import builder
+    from alphapose.utils.config import update_config
+    from alphapose.utils.flip_test import FlipTest
+
+    if not getattr(opt, 'cascade_cfg', ''):
+        return None
+    light_cfg = update_config(opt.cascade_cfg)
+    if list(light_cfg.DATA_PRESET.IMAGE_SIZE) != list(cfg.DATA_PRESET.IMAGE_SIZE):
+        raise ValueError('The cascade models must share the input size, got {} and {}'.format(
+            light_cfg.DATA_PRESET.IMAGE_SIZE, cfg.DATA_PRESET.IMAGE_SIZE))
+    if light_cfg.LOSS.TYPE != 'MSELoss':
+        raise ValueError('The light cascade model is gated on heatmap peaks, it must be a MSELoss model')
+    if light_cfg.DATA_PRESET.NUM_JOINTS > cfg.DATA_PRESET.NUM_JOINTS:
+        raise ValueError('The light cascade model has more joints than the heavy one')
+
+    print(f'Loading light pose model from {opt.cascade_checkpoint}...')
+    light_model = builder.build_sppe(light_cfg.MODEL, preset_cfg=light_cfg.DATA_PRESET,
+                                     checkpoint=opt.cascade_checkpoint, device=opt.device)
+    light_model.to(opt.device)
+    light_model.eval()
+    if opt.flip:
+        light_model = FlipTest(light_model, builder.retrieve_dataset(light_cfg.DATASET.TRAIN).joint_pairs,
+                               opt.flip_thresh)
+        heavy_model = FlipTest(heavy_model, builder.retrieve_dataset(cfg.DATASET.TRAIN).joint_pairs,
+                               opt.flip_thresh)
+    return PoseCascade(light_model, heavy_model, opt.cascade_thresh, opt.cascade_joints)
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""Local pose inference server with dynamic micro-batching.
+
+The detector and pose model are loaded once. Clients connect over a Unix
+socket (or TCP on localhost) and send frames; frames that arrive within
+`max_delay` seconds of each other are run as one detector forward and one
+pose forward of up to `max_batch` frames, and every client gets back only
+the result of its own frame.
+
+Wire format, both directions: a 4 byte big-endian header length, a json
+header, then `header['nbytes']` payload bytes. Requests carry a raw uint8
+RGB image as payload with its `shape` in the header, replies carry the coco
+records of frame_to_records as the json header and no payload.
+"""
+import asyncio
+import json
+import socket
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+from alphapose.models import builder
+from alphapose.utils.pPose_nms import pose_nms
+from alphapose.utils.presets import SimpleTransform
+from alphapose.utils.stream_writer import frame_to_records
+from alphapose.utils.flip_test import FlipTest
+from alphapose.utils.transforms import get_func_heatmap_to_coord, heatmap_to_pose
+
+_HEADER = struct.Struct('>I')
+
+
+class PoseService():
+    """Detector + pose model that processes a list of frames per call."""
+    def __init__(self, cfg, opt, detector):
+        self.cfg = cfg
+        self.opt = opt
+        self.device = opt.device
+        self.detector = detector
+
+        print(f'Loading pose model from {opt.checkpoint}...')
+        self.pose_model = builder.build_sppe(cfg.MODEL, preset_cfg=cfg.DATA_PRESET,
+                                             checkpoint=opt.checkpoint, device=self.device)
+        self.pose_model.to(self.device)
+        self.pose_model.eval()
+        self.pose_dataset = builder.retrieve_dataset(cfg.DATASET.TRAIN)
+        self.flip_test = FlipTest(self.pose_model, self.pose_dataset.joint_pairs, opt.flip_thresh) if opt.flip else None
+
+        self._input_size = cfg.DATA_PRESET.IMAGE_SIZE
+        self._hm_size = cfg.DATA_PRESET.HEATMAP_SIZE
+        self.transformation = SimpleTransform(
+            self.pose_dataset, scale_factor=0,
+            input_size=self._input_size,
+            output_size=self._hm_size,
+            rot=0, sigma=cfg.DATA_PRESET.SIGMA,
+            train=False, add_dpg=False, gpu_device=self.device)
+
+        self.heatmap_to_coord = get_func_heatmap_to_coord(cfg)
+        self.norm_type = cfg.LOSS.get('NORM_TYPE', None)
+        self.use_heatmap_loss = (cfg.DATA_PRESET.get('LOSS_TYPE', 'MSELoss') == 'MSELoss')
+
+    def process(self, images, im_names):
+        """Detect and estimate poses of a batch of RGB frames, one result dict per frame."""
+        with torch.no_grad():
+            imgs = []
+            for image in images:
+                img = self.detector.image_preprocess(image)
+                if isinstance(img, np.ndarray):
+                    img = torch.from_numpy(img)
+                if img.dim() == 3:
+                    img = img.unsqueeze(0)
+                imgs.append(img)
+            imgs = torch.cat(imgs)
+            im_dim_list = torch.FloatTensor([[im.shape[1], im.shape[0]] for im in images]).repeat(1, 2)
+            dets = self.detector.images_detection(imgs, im_dim_list)
+
+            results = [{'imgname': name, 'result': []} for name in im_names]
+            if isinstance(dets, int) or dets.shape[0] == 0:
+                return results
+            if isinstance(dets, np.ndarray):
+                dets = torch.from_numpy(dets)
+            dets = dets.cpu()
+
+            # crop every box of every frame into one pose batch
+            frame_idx = dets[:, 0].long()
+            inps = torch.zeros(len(dets), 3, *self._input_size)
+            cropped_boxes = torch.zeros(len(dets), 4)
+            for i in range(len(dets)):
+                inps[i], cropped_box = self.transformation.test_transform(images[int(frame_idx[i])], dets[i, 1:5])
+                cropped_boxes[i] = torch.FloatTensor(cropped_box)
+
+            hm = []
+            for j in range(0, len(inps), self.opt.posebatch):
+                inps_j = inps[j:j + self.opt.posebatch].to(self.device)
+                if self.flip_test is not None:
+                    hm.append(self.flip_test(inps_j))
+                else:
+                    hm.append(self.pose_model(inps_j))
+            hm = torch.cat(hm).cpu()
+
+            for k in range(len(images)):
+                sel = frame_idx == k
+                if sel.any():
+                    results[k]['result'] = self.postprocess(
+                        dets[sel, 1:5], dets[sel, 5:6], torch.zeros(int(sel.sum()), 1), hm[sel], cropped_boxes[sel])
+        return results
+
+    def postprocess(self, boxes, scores, ids, hm_data, cropped_boxes):
+        preds_img, preds_scores = heatmap_to_pose(hm_data, cropped_boxes, self.heatmap_to_coord,
+                                                  self._hm_size, self.norm_type)
+
+        boxes, scores, ids, preds_img, preds_scores, pick_ids = \
+            pose_nms(boxes, scores, ids, preds_img, preds_scores, self.opt.min_box_area,
+                     use_heatmap_loss=self.use_heatmap_loss)
+
+        _result = []
+        for k in range(len(scores)):
+            _result.append(
+                {
+                    'keypoints': preds_img[k],
+                    'kp_score': preds_scores[k],
+                    'proposal_score': torch.mean(preds_scores[k]) + scores[k] + 1.25 * max(preds_scores[k]),
+                    'idx': ids[k],
+                    'box': [boxes[k][0], boxes[k][1], boxes[k][2] - boxes[k][0], boxes[k][3] - boxes[k][1]]
+                }
+            )
+        return _result
+
+
+class MicroBatcher():
+    """Collect requests into batches of at most max_batch, waiting at most max_delay seconds.
+
+    process_fn(items) runs in a single worker thread, so the event loop keeps
+    accepting frames while a batch is in flight.
+    """
+    def __init__(self, process_fn, max_batch=8, max_delay=0.005, max_queue=256):
+        self.process_fn = process_fn
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.stats = {'batches': 0, 'frames': 0}
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            items = [item for item, _ in batch]
+            try:
+                outputs = await loop.run_in_executor(self.executor, self.process_fn, items)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.stats['batches'] += 1
+            self.stats['frames'] += len(batch)
+            for (_, future), output in zip(batch, outputs):
+                if not future.done():
+                    future.set_result(output)
+
+
+async def read_message(reader):
+    size = _HEADER.unpack(await reader.readexactly(_HEADER.size))[0]
+    header = json.loads(await reader.readexactly(size))
+    payload = await reader.readexactly(header.get('nbytes', 0)) if header.get('nbytes', 0) else b''
+    return header, payload
+
+
+def pack_message(header, payload=b''):
+    header = dict(header, nbytes=len(payload))
+    data = json.dumps(header).encode()
+    return _HEADER.pack(len(data)) + data + payload
+
+
+class PoseServer():
+    """asyncio front end of a PoseService."""
+    def __init__(self, service, max_batch=8, max_delay=0.005, form=None):
+        self.service = service
+        self.form = form
+        self.batcher = MicroBatcher(self._process, max_batch=max_batch, max_delay=max_delay)
+
+    def _process(self, items):
+        images = [image for image, _ in items]
+        names = [name for _, name in items]
+        results = self.service.process(images, names)
+        return [frame_to_records(res, form=self.form) for res in results]
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    header, payload = await read_message(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                start = time.time()
+                image = np.frombuffer(payload, dtype=np.uint8).reshape(header['shape'])
+                records = await self.batcher.submit((image, header.get('name', 'frame')))
+                writer.write(pack_message({'id': header.get('id'), 'result': records,
+                                           'latency': time.time() - start}))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, path=None, host='127.0.0.1', port=None):
+        asyncio.ensure_future(self.batcher.run())
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle, path=path)
+        else:
+            server = await asyncio.start_server(self.handle, host=host, port=port)
+        async with server:
+            await server.serve_forever()
+
+
+class PoseClient():
+    """Blocking client, one outstanding frame per connection."""
+    def __init__(self, path=None, host='127.0.0.1', port=None):
+        if path is not None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(path)
+        else:
+            self.sock = socket.create_connection((host, port))
+        self._count = 0
+
+    def _recv(self, n):
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = self.sock.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError('pose server closed the connection')
+            buf.extend(chunk)
+        return bytes(buf)
+
+    def process(self, image, name='frame'):
+        """Send an RGB uint8 image, return its coco result records."""
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        self._count += 1
+        self.sock.sendall(pack_message({'id': self._count, 'name': name, 'shape': list(image.shape)},
+                                       image.tobytes()))
+        size = _HEADER.unpack(self._recv(_HEADER.size))[0]
+        header = json.loads(self._recv(size))
+        return header['result']
+
+    def close(self):
+        self.sock.close()
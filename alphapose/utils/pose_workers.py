@@ -0,0 +1,158 @@
+"""Pose model replicas in worker processes for cpu throughput.
+
+One process with the default intra-op threading scales poorly past a few
+cores next to the loader and writer processes. PoseWorkerPool starts K
+replicas of the pose model, each pinned to its own set of cores with a
+fixed torch.set_num_threads, and is called like the pose model: the crops
+are split into chunks, each chunk goes to the replica with the fewest
+chunks in flight, and the heatmaps come back in the order of the crops.
+submit/result dispatch a batch without waiting for it. A replica that fails
+or dies raises in the caller instead of leaving it waiting.
+"""
+import os
+import queue
+
+import torch
+import torch.multiprocessing as mp
+
+
+def _pose_worker(rank, cfg, checkpoint, cores, num_threads, in_queue, out_queue):
+    from alphapose.models import builder
+    from alphapose.models.optimize import optimize_from_cfg
+
+    if cores and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(num_threads)
+    try:
+        if checkpoint:
+            pose_model = builder.build_sppe(cfg.MODEL, preset_cfg=cfg.DATA_PRESET, checkpoint=checkpoint)
+        else:
+            # random weights, for benchmarks
+            pose_model = builder.build_sppe(cfg.MODEL, preset_cfg=cfg.DATA_PRESET, IMAGENET_INIT=False)
+        pose_model.eval()
+        pose_model = optimize_from_cfg(pose_model, cfg.MODEL.get('OPTIMIZE', False),
+                                       (torch.randn(1, 3, *cfg.DATA_PRESET.IMAGE_SIZE),), name=f'pose worker {rank}')
+    except Exception as e:
+        out_queue.put((rank, repr(e)))
+        return
+    out_queue.put((rank, None))
+
+    with torch.no_grad():
+        while True:
+            item = in_queue.get()
+            if item is None:
+                return
+            seq, inps = item
+            try:
+                out_queue.put((seq, pose_model(inps)))
+            except Exception as e:
+                out_queue.put((seq, repr(e)))
+
+
+def partition_cores(num_workers, num_threads, cores=None):
+    """Disjoint core sets of num_threads cores, one per worker; they wrap around when the host has fewer."""
+    if cores is None:
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+    if num_workers * num_threads > len(cores):
+        print(f'{num_workers} workers x {num_threads} threads oversubscribe the {len(cores)} cores')
+    return [[cores[(k * num_threads + t) % len(cores)] for t in range(num_threads)] for k in range(num_workers)]
+
+
+class PoseWorkerPool():
+    """Pose model replicas on disjoint cores, called like the pose model.
+
+    cfg: experiment config of the pose model
+    checkpoint: pose checkpoint, empty for random weights
+    num_threads: intra-op threads per replica, 0 splits the cores of the
+        process evenly
+    chunk: min crops per dispatched chunk
+    timeout: seconds between liveness checks of the replicas while waiting
+    """
+
+    def __init__(self, cfg, checkpoint, num_workers, num_threads=0, chunk=1, timeout=5.):
+        self.cfg = cfg
+        self.checkpoint = checkpoint
+        self.num_workers = num_workers
+        if num_threads <= 0:
+            num_cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+            num_threads = max(num_cores // num_workers, 1)
+        self.num_threads = num_threads
+        self.chunk = chunk
+        self.timeout = timeout
+        self.cores = partition_cores(num_workers, num_threads)
+        self._workers = []
+        self._in_queues = []
+        self._out_queue = None
+        self._seq = 0
+        self._in_flight = [0] * num_workers
+        self._owner = {}
+        self._results = {}
+
+    def start(self):
+        ctx = mp.get_context('spawn')
+        self._out_queue = ctx.Queue()
+        for rank in range(self.num_workers):
+            in_queue = ctx.Queue()
+            p = ctx.Process(target=_pose_worker, args=(
+                rank, self.cfg, self.checkpoint, self.cores[rank], self.num_threads, in_queue, self._out_queue))
+            p.daemon = True
+            p.start()
+            self._workers.append(p)
+            self._in_queues.append(in_queue)
+        # wait for every replica to load
+        for _ in range(self.num_workers):
+            rank, error = self._get()
+            if error is not None:
+                self.stop()
+                raise RuntimeError(f'Pose worker {rank} failed to load the model: {error}')
+        print(f'Started {self.num_workers} pose workers with {self.num_threads} threads, cores {self.cores}')
+        return self
+
+    def submit(self, inps):
+        """Dispatch the crops without waiting, returns the ticket for result()."""
+        inps = inps.cpu()
+        size = max(-(-len(inps) // self.num_workers), self.chunk)
+        ticket = []
+        for start in range(0, len(inps), size):
+            # the replica with the fewest chunks in flight
+            rank = self._in_flight.index(min(self._in_flight))
+            self._in_queues[rank].put((self._seq, inps[start:start + size]))
+            self._owner[self._seq] = rank
+            self._in_flight[rank] += 1
+            ticket.append(self._seq)
+            self._seq += 1
+        return ticket
+
+    def _get(self):
+        while True:
+            try:
+                return self._out_queue.get(timeout=self.timeout)
+            except queue.Empty:
+                dead = [rank for rank, p in enumerate(self._workers) if not p.is_alive()]
+                if dead:
+                    self.stop()
+                    raise RuntimeError(f'Pose workers {dead} died')
+
+    def result(self, ticket):
+        """Heatmaps of submitted crops, in the order of the crops."""
+        while any(seq not in self._results for seq in ticket):
+            seq, hm = self._get()
+            rank = self._owner.pop(seq)
+            self._in_flight[rank] -= 1
+            if isinstance(hm, str):
+                self.stop()
+                raise RuntimeError(f'Pose worker {rank} failed: {hm}')
+            self._results[seq] = hm
+        return torch.cat([self._results.pop(seq) for seq in ticket])
+
+    def __call__(self, inps):
+        return self.result(self.submit(inps))
+
+    def stop(self):
+        for in_queue in self._in_queues:
+            in_queue.put(None)
+        for p in self._workers:
+            p.join(timeout=10)
+            if p.is_alive():
+                p.terminate()
+        self._workers, self._in_queues = [], []
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""NumPy-native builders for PointCloud2 and Marker messages.
+
+Clouds are deprojected from the whole depth image at once and packed into a
+single contiguous buffer that is handed to PointCloud2.data as is, so no
+per-point Python object is created. The ROS message modules are imported on
+first use, the deprojection and packing helpers work without ROS.
+"""
+import numpy as np
+
+from alphapose.utils.depth_raymarch import intrinsics_to_tuple
+
+''' sensor_msgs/PointField datatypes '''
+FLOAT32 = 7
+
+XYZ_DTYPE = np.dtype([('x', '<f4'), ('y', '<f4'), ('z', '<f4')])
+XYZRGB_DTYPE = np.dtype([('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('rgb', '<u4')])
+
+_grids = {}
+
+
+def _pixel_rays(shape, intrin, decimate):
+    # normalized (x/z, y/z) of every decimated pixel, cached per resolution
+    fx, fy, cx, cy = intrinsics_to_tuple(intrin)
+    key = (shape, fx, fy, cx, cy, decimate)
+    if key not in _grids:
+        h, w = shape
+        u = (np.arange(0, w, decimate, dtype=np.float32) - cx) / fx
+        v = (np.arange(0, h, decimate, dtype=np.float32) - cy) / fy
+        _grids[key] = (u[None, :], v[:, None])
+    return _grids[key]
+
+
+def deproject_depth(depth, intrin, depth_scale=0.001, decimate=1, z_range=None, organized=False):
+    """Deproject a depth image to camera coordinates.
+
+    Parameters
+    ----------
+    depth: z16 depth image (H, W)
+    intrin: camera intrinsics, see intrinsics_to_tuple
+    decimate: keep every n-th pixel in both directions
+    z_range: optional (near, far) in meters, other depths count as missing
+    organized: keep the (H', W') image layout with nan for missing depth
+
+    Returns
+    -------
+    points (H', W', 3) or (N, 3) float32, and the (H', W') mask of valid pixels
+    """
+    depth = np.asarray(depth)
+    u, v = _pixel_rays(depth.shape, intrin, decimate)
+    depth = depth[::decimate, ::decimate]
+    z = depth.astype(np.float32) * np.float32(depth_scale)
+    valid = depth > 0
+    if z_range is not None:
+        valid &= (z >= z_range[0]) & (z <= z_range[1])
+    if organized:
+        z = np.where(valid, z, np.float32(np.nan))
+        points = np.empty(depth.shape + (3,), dtype=np.float32)
+        np.multiply(u, z, out=points[..., 0])
+        np.multiply(v, z, out=points[..., 1])
+        points[..., 2] = z
+        return points, valid
+    rows, cols = np.nonzero(valid)
+    zv = z[rows, cols]
+    points = np.empty((len(zv), 3), dtype=np.float32)
+    points[:, 0] = u[0, cols] * zv
+    points[:, 1] = v[rows, 0] * zv
+    points[:, 2] = zv
+    return points, valid
+
+
+def pack_rgb(colors, bgr=False):
+    """(..., 3) uint8 colors to the uint32 0x00RRGGBB layout rviz reads from the rgb field."""
+    colors = np.asarray(colors, dtype=np.uint32)
+    if bgr:
+        colors = colors[..., ::-1]
+    return (colors[..., 0] << 16) | (colors[..., 1] << 8) | colors[..., 2]
+
+
+def pack_points(points, colors=None, bgr=False):
+    """Pack (..., 3) points and optional (..., 3) colors into one structured array."""
+    points = np.asarray(points, dtype=np.float32)
+    dtype = XYZ_DTYPE if colors is None else XYZRGB_DTYPE
+    buf = np.empty(points.shape[:-1], dtype=dtype)
+    buf['x'] = points[..., 0]
+    buf['y'] = points[..., 1]
+    buf['z'] = points[..., 2]
+    if colors is not None:
+        buf['rgb'] = pack_rgb(colors, bgr=bgr)
+    return buf
+
+
+def create_cloud(header, points, colors=None, bgr=False):
+    """PointCloud2 from (N, 3) or organized (H, W, 3) points, one memcpy for the payload."""
+    from sensor_msgs.msg import PointCloud2, PointField
+
+    buf = pack_points(points, colors, bgr=bgr)
+    if buf.ndim == 1:
+        height, width = 1, buf.shape[0]
+    else:
+        height, width = buf.shape
+    fields = [PointField(name=name, offset=buf.dtype.fields[name][1], datatype=FLOAT32, count=1)
+              for name in ('x', 'y', 'z')]
+    if colors is not None:
+        fields.append(PointField(name='rgb', offset=buf.dtype.fields['rgb'][1], datatype=FLOAT32, count=1))
+
+    cloud = PointCloud2()
+    cloud.header = header
+    cloud.height = height
+    cloud.width = width
+    cloud.fields = fields
+    cloud.is_bigendian = False
+    cloud.point_step = buf.dtype.itemsize
+    cloud.row_step = buf.dtype.itemsize * width
+    # organized clouds carry nan for missing depth
+    cloud.is_dense = bool(buf.ndim == 1 and np.isfinite(points).all())
+    cloud.data = buf.tobytes()
+    return cloud
+
+
+def depth_to_cloud(header, depth, intrin, color=None, depth_scale=0.001, decimate=1,
+                   z_range=None, organized=False, bgr=True):
+    """Deproject an aligned depth frame (and color image) straight into a PointCloud2."""
+    points, valid = deproject_depth(depth, intrin, depth_scale=depth_scale, decimate=decimate,
+                                    z_range=z_range, organized=organized)
+    colors = None
+    if color is not None:
+        colors = np.asarray(color)[::decimate, ::decimate]
+        if not organized:
+            colors = colors[valid]
+    return create_cloud(header, points, colors, bgr=bgr)
+
+
+def to_points(array):
+    """(..., 3) array to a list of geometry_msgs/Point for Marker.points.
+
+    Marker.points has to hold message objects, so this is the one place the
+    per-point objects are made, from a single tolist() of the array.
+    """
+    from geometry_msgs.msg import Point
+
+    return [Point(x, y, z) for x, y, z in np.asarray(array, dtype=np.float64).reshape(-1, 3).tolist()]
@@ -0,0 +1,123 @@
+"""Overlapping video segments and the stitching of their results.
+
+A long video is cut into segments by frame index that overlap by a few
+frames, each segment is processed on its own (scripts/demo_segments.py),
+and the per-segment coco records are merged into one stream. Track ids
+(--pose_track or PoseFlow) of consecutive segments are matched in their
+overlap with the Hungarian algorithm on pose similarity; every frame of
+the overlap is taken from one segment, split at the middle.
+"""
+import json
+import os
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from .stream_writer import assemble_json, read_jsonl
+
+
+def split_segments(num_frames, num_segments, overlap):
+    """(start, end) frame ranges of num_segments segments, consecutive ones share `overlap` frames."""
+    num_segments = max(min(num_segments, num_frames), 1)
+    length = -(-num_frames // num_segments)
+    segments = []
+    for k in range(num_segments):
+        start = max(k * length - overlap, 0)
+        end = min((k + 1) * length, num_frames)
+        if start < end:
+            segments.append((start, end))
+    return segments
+
+
+def frame_index(image_id):
+    return int(os.path.splitext(os.path.basename(str(image_id)))[0])
+
+
+def pose_similarity(rec_a, rec_b, sigma=0.1, thresh=0.3):
+    """Object keypoint similarity of two coco records, over the joints both see above thresh."""
+    kpts_a = np.asarray(rec_a['keypoints']).reshape(-1, 3)
+    kpts_b = np.asarray(rec_b['keypoints']).reshape(-1, 3)
+    valid = (kpts_a[:, 2] > thresh) & (kpts_b[:, 2] > thresh)
+    if not valid.any():
+        return 0.
+    if 'box' in rec_a:
+        area = max(rec_a['box'][2] * rec_a['box'][3], 1.)
+    else:
+        span = kpts_a[valid, :2].max(axis=0) - kpts_a[valid, :2].min(axis=0)
+        area = max(span[0] * span[1], 1.)
+    dist = ((kpts_a[valid, :2] - kpts_b[valid, :2]) ** 2).sum(axis=1)
+    return float(np.exp(-dist / (2 * area * (2 * sigma) ** 2)).mean())
+
+
+def _tracks(records_by_frame, frames):
+    tracks = {}
+    for frame in frames:
+        for rec in records_by_frame.get(frame, []):
+            if isinstance(rec.get('idx'), int):
+                tracks.setdefault(rec['idx'], {})[frame] = rec
+    return tracks
+
+
+def match_tracks(prev_by_frame, next_by_frame, overlap_frames, min_sim=0.5):
+    """{next segment id: previous segment id} of the tracks that are the same person in the overlap."""
+    prev_tracks = _tracks(prev_by_frame, overlap_frames)
+    next_tracks = _tracks(next_by_frame, overlap_frames)
+    if not prev_tracks or not next_tracks:
+        return {}
+    prev_ids, next_ids = list(prev_tracks), list(next_tracks)
+    sim = np.zeros((len(prev_ids), len(next_ids)))
+    for i, a in enumerate(prev_ids):
+        for j, b in enumerate(next_ids):
+            common = set(prev_tracks[a]) & set(next_tracks[b])
+            if common:
+                sim[i, j] = np.mean([pose_similarity(prev_tracks[a][f], next_tracks[b][f]) for f in common])
+    rows, cols = linear_sum_assignment(-sim)
+    return {next_ids[j]: prev_ids[i] for i, j in zip(rows, cols) if sim[i, j] >= min_sim}
+
+
+def stitch_segments(segment_paths, segments, outputpath, min_sim=0.5):
+    """Merge the alphapose-results.jsonl of the segments into one result stream with global track ids.
+
+    segment_paths: jsonl file of each segment, in order
+    segments: their (start, end) frame ranges, from split_segments
+    Writes outputpath/alphapose-results.jsonl and the assembled json.
+    """
+    by_frame = []
+    for path in segment_paths:
+        records = {}
+        for rec in read_jsonl(path):
+            records.setdefault(frame_index(rec['image_id']), []).append(rec)
+        by_frame.append(records)
+
+    # every overlap frame comes from one segment, split at the middle
+    cuts = [start for start, _ in segments[1:]]
+    cuts = [(cut + end) // 2 for cut, (_, end) in zip(cuts, segments[:-1])]
+    keep = list(zip([segments[0][0]] + cuts, cuts + [segments[-1][1]]))
+
+    # {local id: local id in the previous segment} of the tracks continued across each overlap
+    matches = [{}] + [match_tracks(by_frame[k - 1], by_frame[k], range(segments[k][0], segments[k - 1][1]), min_sim)
+                      for k in range(1, len(by_frame))]
+
+    # global ids are given to the tracks that are written only
+    next_id = 1
+    id_maps = []
+    jsonl_path = os.path.join(outputpath, 'alphapose-results.jsonl')
+    with open(jsonl_path, 'w') as jsonl_file:
+        for k, (records, (start, end)) in enumerate(zip(by_frame, keep)):
+            id_map = {}
+            for frame in sorted(f for f in records if start <= f < end):
+                for rec in records[frame]:
+                    if isinstance(rec.get('idx'), int):
+                        local = rec['idx']
+                        if local not in id_map:
+                            prev = matches[k].get(local)
+                            if k > 0 and prev in id_maps[k - 1]:
+                                id_map[local] = id_maps[k - 1][prev]
+                            else:
+                                id_map[local] = next_id
+                                next_id += 1
+                        rec['idx'] = id_map[local]
+                    jsonl_file.write(json.dumps(rec) + '\n')
+            id_maps.append(id_map)
+    assemble_json(jsonl_path, outputpath)
+    return next_id - 1
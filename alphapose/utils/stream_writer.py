@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+from threading import Thread
+from queue import Queue
+
+import numpy as np
+import torch
+
+''' Constant Configuration '''
+CMU_INDEX = [0, 17, 6, 8, 10, 5, 7, 9, 12, 14, 16, 11, 13, 15, 2, 1, 4, 3]
+VERSION = "AlphaPose v0.3"
+
+
+def to_numpy(x):
+    if isinstance(x, torch.Tensor):
+        return x.detach().cpu().numpy()
+    return np.asarray(x)
+
+
+def to_float(x):
+    return float(to_numpy(x).reshape(-1)[0])
+
+
+def to_list(x):
+    if isinstance(x, (list, tuple)):
+        return [to_float(v) for v in x]
+    return to_numpy(x).tolist()
+
+
+def frame_to_records(im_res, form=None, for_eval=False):
+    '''
+    Convert the result dict of one frame to its json records
+    im_res: {'imgname': str, 'result': [{'keypoints', 'kp_score', 'proposal_score', ...}]}
+    return: list of coco person records, or one cmu/openpose image dict
+    '''
+    im_name = im_res['imgname']
+    if for_eval:
+        image_id = int(os.path.basename(im_name).split('.')[0].split('_')[-1])
+    else:
+        image_id = os.path.basename(im_name)
+
+    records = []
+    if len(im_res['result']) == 0:
+        return records
+    for human in im_res['result']:
+        kp_preds = to_numpy(human['keypoints']).reshape(-1, 2)
+        kp_scores = to_numpy(human['kp_score']).reshape(-1, 1)
+        kpts = np.concatenate((kp_preds, kp_scores), axis=1).astype(np.float64)
+        if form in ('cmu', 'open'):
+            # neck is the midpoint of the shoulders, as in write_json
+            kpts = np.concatenate((kpts, (kpts[5:6] + kpts[6:7]) / 2), axis=0)
+            records.append(kpts[CMU_INDEX].ravel().tolist())
+            continue
+
+        result = {
+            'image_id': image_id,
+            'category_id': 1,
+            'keypoints': kpts.ravel().tolist(),
+            'score': to_float(human['proposal_score'])
+        }
+        if 'box' in human.keys():
+            result['box'] = to_list(human['box'])
+        if 'idx' in human.keys():
+            idx = to_numpy(human['idx'])
+            result['idx'] = idx.tolist() if idx.ndim else idx.item()
+        if 'pred_xyz_jts' in human.keys():
+            result['pred_xyz_jts'] = to_numpy(human['pred_xyz_jts']).tolist()
+        records.append(result)
+
+    if form == 'cmu':
+        return {'image_id': image_id, 'version': VERSION, 'bodies': [{'joints': r} for r in records]}
+    elif form == 'open':
+        return {'image_id': image_id, 'version': VERSION, 'people': [{'pose_keypoints_2d': r} for r in records]}
+    return records
+
+
+class StreamWriter():
+    '''
+    Serialize results frame by frame to JSON Lines from a background thread.
+    Coco results are written one person record per line, cmu/openpose results
+    one image per line. Memory is bounded by queueSize frames.
+    '''
+    def __init__(self, outputpath, form=None, for_eval=False,
+                 outputfile='alphapose-results.jsonl', flush_every=32, queueSize=256):
+        self.outputpath = outputpath
+        self.form = form
+        self.for_eval = for_eval
+        self.path = os.path.join(outputpath, outputfile)
+        self.flush_every = flush_every
+        self.queue = Queue(maxsize=queueSize)
+        self.worker = None
+        # exception of the writer thread, raised again by write and close
+        self.error = None
+
+    def start(self):
+        self.worker = Thread(target=self.update, args=())
+        self.worker.daemon = True
+        self.worker.start()
+        return self
+
+    def write(self, im_res):
+        self._check_error()
+        # convert here so that no tensors are kept alive in the queue
+        records = frame_to_records(im_res, form=self.form, for_eval=self.for_eval)
+        if len(records) > 0:
+            self.queue.put(records)
+
+    def _check_error(self):
+        if self.error is not None:
+            raise RuntimeError('Writing {} failed'.format(self.path)) from self.error
+
+    def update(self):
+        try:
+            self._write_lines()
+        except Exception as e:
+            self.error = e
+            # keep draining so that write and close do not block on the queue
+            while self.queue.get() is not None:
+                pass
+
+    def _write_lines(self):
+        with open(self.path, 'w') as jsonl_file:
+            lines = []
+            while True:
+                records = self.queue.get()
+                if records is None:
+                    break
+                if isinstance(records, dict):
+                    records = [records]
+                lines.extend(json.dumps(r) for r in records)
+                if lines and (len(lines) >= self.flush_every or self.queue.empty()):
+                    jsonl_file.write('\n'.join(lines) + '\n')
+                    jsonl_file.flush()
+                    lines = []
+            if lines:
+                jsonl_file.write('\n'.join(lines) + '\n')
+
+    def close(self, outputfile='alphapose-results.json', sep_json=True):
+        '''
+        Drain the queue and assemble the classic single-file json
+        outputfile: name of the assembled file, None to keep only the jsonl
+        '''
+        self.queue.put(None)
+        self.worker.join()
+        self._check_error()
+        if outputfile is not None:
+            assemble_json(self.path, self.outputpath, form=self.form,
+                          outputfile=outputfile, sep_json=sep_json)
+
+
+def read_jsonl(path):
+    with open(path, 'r') as jsonl_file:
+        for line in jsonl_file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def assemble_json(jsonl_path, outputpath, form=None, outputfile='alphapose-results.json', sep_json=True):
+    '''
+    Build the output of write_json from a streamed jsonl file
+    jsonl_path: file written by StreamWriter
+    outputpath: output directory
+    '''
+    if form in ('cmu', 'open'):
+        json_results_cmu = {}
+        key = 'bodies' if form == 'cmu' else 'people'
+        for image in read_jsonl(jsonl_path):
+            image_id = image.pop('image_id')
+            if image_id in json_results_cmu:
+                json_results_cmu[image_id][key].extend(image[key])
+            else:
+                json_results_cmu[image_id] = image
+        with open(os.path.join(outputpath, outputfile), 'w') as json_file:
+            json_file.write(json.dumps(json_results_cmu))
+        if sep_json:
+            if not os.path.exists(os.path.join(outputpath, 'sep-json')):
+                os.mkdir(os.path.join(outputpath, 'sep-json'))
+            for name in json_results_cmu.keys():
+                with open(os.path.join(outputpath, 'sep-json', str(name).split('.')[0] + '.json'), 'w') as json_file:
+                    json_file.write(json.dumps(json_results_cmu[name]))
+    else:
+        # stream records through without holding them all as python objects
+        with open(jsonl_path, 'r') as jsonl_file, open(os.path.join(outputpath, outputfile), 'w') as json_file:
+            json_file.write('[')
+            first = True
+            for line in jsonl_file:
+                line = line.strip()
+                if not line:
+                    continue
+                if not first:
+                    json_file.write(', ')
+                json_file.write(line)
+                first = False
+            json_file.write(']')
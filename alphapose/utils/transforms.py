@@ -516,13 +516,38 @@ def flip_heatmap(heatmap, joint_pairs, shift=False):
             out[idx] = out[inv_idx]
 
     if shift:
+        # overlapping in-place copy, the source must be cloned
         if out.dim() == 3:
-            out[:, :, 1:] = out[:, :, 0:-1]
+            out[:, :, 1:] = out[:, :, 0:-1].clone()
         else:
-            out[:, :, :, 1:] = out[:, :, :, 0:-1]
+            out[:, :, :, 1:] = out[:, :, :, 0:-1].clone()
     return out
 
 
+def flip_index(num_joints, joint_pairs):
+    """Channel order of a flipped heatmap, joint j of the output is channel idx[j] of the input."""
+    idx = list(range(num_joints))
+    for dim0, dim1 in joint_pairs:
+        if dim0 < num_joints and dim1 < num_joints:
+            idx[dim0], idx[dim1] = dim1, dim0
+    return torch.LongTensor(idx)
+
+
+def flip_heatmap_average(heatmap, heatmap_flip, joint_idx):
+    """(heatmap + flip_heatmap(heatmap_flip, joint_pairs, shift=True)) / 2 without the per-pair loop.
+
+    joint_idx comes from flip_index, on the device of the heatmaps. The
+    joint swap is one gather, the flip and the one column shift are
+    accumulated into the output: column w takes flipped column W - w,
+    column 0 the last one.
+    """
+    hm_flip = heatmap_flip.index_select(1, joint_idx)
+    out = heatmap.clone()
+    out[..., 1:] += hm_flip[..., 1:].flip(-1)
+    out[..., 0] += hm_flip[..., -1]
+    return out.mul_(0.5)
+
+
 def flip_joints_3d(joints_3d, width, joint_pairs):
     """Flip 3d joints.
     Parameters
@@ -962,3 +987,35 @@ def get_func_heatmap_to_coord(cfg):
             return [heatmap_to_coord_simple, heatmap_to_coord_simple_regress]
     else:
         raise NotImplementedError
+
+
+def heatmap_to_pose(hm_data, cropped_boxes, heatmap_to_coord, hm_size, norm_type):
+    """Keypoints (n, kp, 2) and their scores (n, kp, 1) of the heatmaps of n people.
+
+    heatmap_to_coord: decoder of get_func_heatmap_to_coord, with a Combined
+    loss the face and hand joints are decoded by regression.
+    """
+    assert hm_data.dim() == 4
+
+    num_joints = hm_data.size()[1]
+    face_hand_num = 42 if num_joints == 68 else 110
+    if num_joints in (136, 26, 133, 68, 21):
+        eval_joints = [*range(0, num_joints)]
+    else:
+        eval_joints = [*range(0, 17)]
+    pose_coords = []
+    pose_scores = []
+    for i in range(hm_data.shape[0]):
+        bbox = cropped_boxes[i].tolist()
+        if isinstance(heatmap_to_coord, list):
+            pose_coords_body_foot, pose_scores_body_foot = heatmap_to_coord[0](
+                hm_data[i][eval_joints[:-face_hand_num]], bbox, hm_shape=hm_size, norm_type=norm_type)
+            pose_coords_face_hand, pose_scores_face_hand = heatmap_to_coord[1](
+                hm_data[i][eval_joints[-face_hand_num:]], bbox, hm_shape=hm_size, norm_type=norm_type)
+            pose_coord = np.concatenate((pose_coords_body_foot, pose_coords_face_hand), axis=0)
+            pose_score = np.concatenate((pose_scores_body_foot, pose_scores_face_hand), axis=0)
+        else:
+            pose_coord, pose_score = heatmap_to_coord(hm_data[i][eval_joints], bbox, hm_shape=hm_size, norm_type=norm_type)
+        pose_coords.append(torch.from_numpy(pose_coord).unsqueeze(0))
+        pose_scores.append(torch.from_numpy(pose_score).unsqueeze(0))
+    return torch.cat(pose_coords), torch.cat(pose_scores)
@@ -9,6 +9,7 @@ import torch
 import torch.multiprocessing as mp
 
 from alphapose.utils.presets import SimpleTransform, SimpleTransform3DSMPL
+from alphapose.utils.operator_gate import build_selector, gate_detections
 
 
 class WebCamDetectionLoader():
@@ -28,6 +29,7 @@ class WebCamDetectionLoader():
         stream.release()
 
         self.detector = detector
+        self.operator_selector = build_selector(opt)
 
         self._input_size = cfg.DATA_PRESET.IMAGE_SIZE
         self._output_size = cfg.DATA_PRESET.HEATMAP_SIZE
@@ -173,11 +175,16 @@ class WebCamDetectionLoader():
                 ids = torch.zeros(scores.shape)
 
         boxes_k = boxes[dets[:, 0] == 0]
+        scores_k, ids_k = scores[dets[:, 0] == 0], ids[dets[:, 0] == 0]
+        if self.operator_selector is not None and boxes_k.shape[0] > 0:
+            # bystanders are dropped before cropping and pose estimation
+            boxes_k, scores_k, ids_k = gate_detections(
+                self.operator_selector, boxes_k, scores_k, ids_k, keep_ids=self.opt.tracking)
         if isinstance(boxes_k, int) or boxes_k.shape[0] == 0:
             return (orig_img, im_name, None, None, None, None, None)
         inps = torch.zeros(boxes_k.size(0), 3, *self._input_size)
         cropped_boxes = torch.zeros(boxes_k.size(0), 4)
-        return (orig_img, im_name, boxes_k, scores[dets[:, 0] == 0], ids[dets[:, 0] == 0], inps, cropped_boxes)
+        return (orig_img, im_name, boxes_k, scores_k, ids_k, inps, cropped_boxes)
 
     def image_postprocess(self, inputs):
         with torch.no_grad():
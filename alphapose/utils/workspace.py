@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""Workspace scene of object primitives for line-of-sight queries.
+
+Objects (boxes, spheres, cylinders, triangle meshes and point clusters) live
+in their own frame and are placed with a 4x4 pose. The scene keeps every
+object's world AABB in flat slot arrays, so insert, move and remove only
+touch one slot, and a batch of rays is culled against all objects with one
+vectorized slab test before the exact per-shape tests run on the survivors.
+
+The exact tests of a shape, intersect(o, d, t_min), give per ray the entry
+and exit distance of the part of the shape the ray meets at or after t_min
+and whether it meets any.
+"""
+import itertools
+
+import numpy as np
+
+EPS = 1e-9
+
+
+def make_pose(pose=None):
+    """4x4 pose from None (identity), a (3,) translation, a 3x4 or a 4x4 matrix."""
+    out = np.eye(4)
+    if pose is None:
+        return out
+    pose = np.asarray(pose, dtype=np.float64)
+    if pose.shape == (3,):
+        out[:3, 3] = pose
+    else:
+        out[:pose.shape[0], :] = pose[:, :4]
+    return out
+
+
+def _slab(origins, directions, box_min, box_max):
+    # origins, directions (R, 3); box_min, box_max (B, 3) -> t_near, t_far (R, B)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv = 1. / directions[:, None, :]
+        t1 = (box_min[None] - origins[:, None, :]) * inv
+        t2 = (box_max[None] - origins[:, None, :]) * inv
+    parallel = directions[:, None, :] == 0
+    inside = (origins[:, None, :] >= box_min[None]) & (origins[:, None, :] <= box_max[None])
+    t_lo = np.where(parallel, np.where(inside, -np.inf, np.inf), np.minimum(t1, t2))
+    t_hi = np.where(parallel, np.where(inside, np.inf, -np.inf), np.maximum(t1, t2))
+    return t_lo.max(axis=-1), t_hi.min(axis=-1)
+
+
+class Box():
+    """Box centered at the origin of its frame."""
+    def __init__(self, size):
+        self.half = np.asarray(size, dtype=np.float64) / 2
+
+    def bounds(self):
+        return -self.half, self.half
+
+    def intersect(self, o, d, t_min=0.):
+        t_near, t_far = _slab(o, d, -self.half[None], self.half[None])
+        t_near, t_far = t_near[:, 0], t_far[:, 0]
+        return t_near, t_far, t_far >= np.maximum(t_near, t_min)
+
+
+class Sphere():
+    def __init__(self, radius):
+        self.radius = float(radius)
+
+    def bounds(self):
+        r = np.full(3, self.radius)
+        return -r, r
+
+    def intersect(self, o, d, t_min=0.):
+        return _spheres(o, d, np.zeros((1, 3)), np.array([self.radius]), t_min)
+
+
+class Cylinder():
+    """Cylinder along the z axis of its frame, centered at the origin."""
+    def __init__(self, radius, height):
+        self.radius = float(radius)
+        self.half_height = float(height) / 2
+
+    def bounds(self):
+        ext = np.array([self.radius, self.radius, self.half_height])
+        return -ext, ext
+
+    def intersect(self, o, d, t_min=0.):
+        # side: |o_xy + t d_xy| = r
+        a = d[:, 0] ** 2 + d[:, 1] ** 2
+        b = o[:, 0] * d[:, 0] + o[:, 1] * d[:, 1]
+        c = o[:, 0] ** 2 + o[:, 1] ** 2 - self.radius ** 2
+        disc = b * b - a * c
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sq = np.sqrt(np.maximum(disc, 0.))
+            side_in = np.where(a > EPS, (-b - sq) / a, np.where(c <= 0, -np.inf, np.inf))
+            side_out = np.where(a > EPS, (-b + sq) / a, np.where(c <= 0, np.inf, -np.inf))
+            side_ok = (disc >= 0) | (a <= EPS)
+            # caps: |o_z + t d_z| <= h
+            cap_lo = (-self.half_height - o[:, 2]) / d[:, 2]
+            cap_hi = (self.half_height - o[:, 2]) / d[:, 2]
+        flat = np.abs(d[:, 2]) < EPS
+        inside_z = np.abs(o[:, 2]) <= self.half_height
+        z_in = np.where(flat, np.where(inside_z, -np.inf, np.inf), np.minimum(cap_lo, cap_hi))
+        z_out = np.where(flat, np.where(inside_z, np.inf, -np.inf), np.maximum(cap_lo, cap_hi))
+        t_near = np.maximum(side_in, z_in)
+        t_far = np.minimum(side_out, z_out)
+        return t_near, t_far, side_ok & (t_far >= np.maximum(t_near, t_min))
+
+
+class Mesh():
+    """Triangle mesh, vertices (V, 3) and faces (F, 3) in the object frame.
+
+    A closed mesh (every edge shared by two faces) is a solid, inside and
+    outside follow from the parity of the face crossings. An open mesh is a
+    surface, it is hit where the ray crosses it.
+    """
+    def __init__(self, vertices, faces):
+        self.vertices = np.asarray(vertices, dtype=np.float64)
+        faces = np.asarray(faces, dtype=np.int64)
+        tri = self.vertices[faces]
+        self.v0 = tri[:, 0]
+        self.e1 = tri[:, 1] - tri[:, 0]
+        self.e2 = tri[:, 2] - tri[:, 0]
+        edges = np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+        _, counts = np.unique(edges, axis=0, return_counts=True)
+        self.closed = bool(len(faces)) and bool((counts == 2).all())
+
+    def bounds(self):
+        return self.vertices.min(axis=0), self.vertices.max(axis=0)
+
+    def intersect(self, o, d, t_min=0.):
+        # Moller-Trumbore over (rays, faces), every crossing of the line
+        p = np.cross(d[:, None, :], self.e2[None])
+        det = (self.e1[None] * p).sum(-1)
+        ok = np.abs(det) > EPS
+        inv = 1. / np.where(ok, det, 1.)
+        s = o[:, None, :] - self.v0[None]
+        u = (s * p).sum(-1) * inv
+        q = np.cross(s, self.e1[None])
+        v = (d[:, None, :] * q).sum(-1) * inv
+        t = (self.e2[None] * q).sum(-1) * inv
+        ok &= (u >= 0) & (v >= 0) & (u + v <= 1)
+        ahead = np.sort(np.where(ok & (t >= t_min), t, np.inf), axis=1)
+        first = ahead[:, 0]
+        if not self.closed:
+            return first, first, np.isfinite(first)
+        # a crossing through an edge or vertex hits every face around it once
+        with np.errstate(invalid='ignore'):
+            ahead[:, 1:][np.diff(ahead, axis=1) <= 1e-7] = np.inf
+        ahead = np.sort(ahead, axis=1)
+        # an odd number of crossings ahead of t_min means the ray is inside at t_min
+        inside = np.isfinite(ahead).sum(axis=1) % 2 == 1
+        second = ahead[:, 1] if ahead.shape[1] > 1 else np.full(len(o), np.inf)
+        last_before = np.where(ok & (t < t_min), t, -np.inf).max(axis=1)
+        t_near = np.where(inside, last_before, first)
+        t_far = np.where(inside, first, second)
+        return t_near, t_far, np.isfinite(first)
+
+
+class PointCluster():
+    """Point cluster, e.g. a segmented depth blob, each point a ball of the given radius."""
+    def __init__(self, points, radius=0.01):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        self.radii = np.full(len(self.points), float(radius))
+
+    def bounds(self):
+        r = self.radii.max() if len(self.radii) else 0.
+        return self.points.min(axis=0) - r, self.points.max(axis=0) + r
+
+    def intersect(self, o, d, t_min=0.):
+        return _spheres(o, d, self.points, self.radii, t_min)
+
+
+def _spheres(o, d, centers, radii, t_min=0.):
+    # the ball of a union entered first at or after t_min, rays inside a ball enter at t <= t_min
+    oc = centers[None] - o[:, None, :]
+    dd = (d * d).sum(-1)[:, None]
+    proj = (oc * d[:, None, :]).sum(-1) / dd
+    dist2 = (oc * oc).sum(-1) - proj * proj * dd
+    disc = radii[None] ** 2 - dist2
+    t_in = proj - np.sqrt(np.maximum(disc, 0.) / dd)
+    t_out = proj + np.sqrt(np.maximum(disc, 0.) / dd)
+    ok = (disc >= 0) & (t_out >= t_min)
+    first = np.where(ok, np.maximum(t_in, t_min), np.inf).argmin(axis=1)
+    rows = np.arange(len(o))
+    return t_in[rows, first], t_out[rows, first], ok[rows, first]
+
+
+class WorkspaceScene():
+    """Dynamic set of posed primitives answering batched ray queries.
+
+    Object ids are returned by insert (or given by the caller) and stay
+    valid until remove. Slots of removed objects are reused.
+    """
+    def __init__(self, capacity=64):
+        self._aabb_min = np.full((capacity, 3), np.inf)
+        self._aabb_max = np.full((capacity, 3), -np.inf)
+        self._slot_ids = np.full(capacity, -1, dtype=np.int64)
+        self._free = list(range(capacity - 1, -1, -1))
+        self._objects = {}
+        self._ids = itertools.count()
+
+    def __len__(self):
+        return len(self._objects)
+
+    def __contains__(self, obj_id):
+        return obj_id in self._objects
+
+    def insert(self, shape, pose=None, obj_id=None):
+        if obj_id is None:
+            obj_id = next(self._ids)
+            while obj_id in self._objects:
+                obj_id = next(self._ids)
+        elif obj_id in self._objects:
+            raise KeyError('object id {} already in the scene'.format(obj_id))
+        if not self._free:
+            self._grow()
+        slot = self._free.pop()
+        self._slot_ids[slot] = obj_id
+        self._objects[obj_id] = {'shape': shape, 'slot': slot}
+        self.move(obj_id, pose)
+        return obj_id
+
+    def move(self, obj_id, pose):
+        obj = self._objects[obj_id]
+        pose = make_pose(pose)
+        obj['pose'] = pose
+        obj['inv_rot'] = pose[:3, :3].T
+        lo, hi = obj['shape'].bounds()
+        corners = np.array(list(itertools.product(*zip(lo, hi))))
+        corners = corners @ pose[:3, :3].T + pose[:3, 3]
+        self._aabb_min[obj['slot']] = corners.min(axis=0)
+        self._aabb_max[obj['slot']] = corners.max(axis=0)
+
+    def remove(self, obj_id):
+        slot = self._objects.pop(obj_id)['slot']
+        self._aabb_min[slot] = np.inf
+        self._aabb_max[slot] = -np.inf
+        self._slot_ids[slot] = -1
+        self._free.append(slot)
+
+    def pose(self, obj_id):
+        return self._objects[obj_id]['pose'].copy()
+
+    def _grow(self):
+        n = len(self._slot_ids)
+        self._aabb_min = np.concatenate((self._aabb_min, np.full((n, 3), np.inf)))
+        self._aabb_max = np.concatenate((self._aabb_max, np.full((n, 3), -np.inf)))
+        self._slot_ids = np.concatenate((self._slot_ids, np.full(n, -1, dtype=np.int64)))
+        self._free.extend(range(2 * n - 1, n - 1, -1))
+
+    def _local_hits(self, obj_id, origins, directions, t_min=0.):
+        # entry, exit and hit of the rays, the pose is rigid so distances carry over
+        obj = self._objects[obj_id]
+        pose, inv_rot = obj['pose'], obj['inv_rot']
+        o = (origins - pose[:3, 3]) @ inv_rot.T
+        d = directions @ inv_rot.T
+        return obj['shape'].intersect(o, d, t_min)
+
+    def raycast(self, origins, directions, t_min=0., t_max=np.inf):
+        """Nearest object hit by each ray.
+
+        Parameters
+        ----------
+        origins, directions: (R, 3) rays in the scene frame. Distances are
+            in units of the direction length, so pass unit directions to
+            get metric distances.
+        t_min, t_max: search range along the ray
+
+        Returns
+        -------
+        ids (R,), -1 where nothing is hit, and hit distances t (R,), inf
+        where nothing is hit. An object the ray is inside of at t_min is
+        hit at t_min, one it has left before t_min is not hit.
+        """
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        ids = np.full(len(origins), -1, dtype=np.int64)
+        best = np.full(len(origins), np.inf)
+        if not self._objects:
+            return ids, best
+
+        t_near, t_far = _slab(origins, directions, self._aabb_min, self._aabb_max)
+        cand = (t_far >= np.maximum(t_near, t_min)) & (t_near <= t_max) & (self._slot_ids >= 0)
+        for slot in np.flatnonzero(cand.any(axis=0)):
+            rays = np.flatnonzero(cand[:, slot])
+            # objects whose box starts behind the best hit so far cannot win
+            rays = rays[t_near[rays, slot] < best[rays]]
+            if len(rays) == 0:
+                continue
+            obj_id = int(self._slot_ids[slot])
+            t_in, t_out, hit = self._local_hits(obj_id, origins[rays], directions[rays], t_min)
+            hit &= t_out >= t_min
+            # entered before t_min and left after it
+            t = np.where(t_in < t_min, t_min, t_in)
+            hit &= (t <= t_max) & (t < best[rays])
+            best[rays[hit]] = t[hit]
+            ids[rays[hit]] = obj_id
+        return ids, best
+
+    def cone_query(self, origins, directions, angle, t_max=np.inf):
+        """All objects within an angular tolerance of each ray.
+
+        An object matches when its bounding sphere comes within `angle`
+        radians of the ray as seen from the ray origin, so noisy pointing
+        still selects thin or small objects.
+
+        Returns
+        -------
+        per ray, a list of (id, distance to the object center, angular
+        offset) sorted by angular offset.
+        """
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        if not self._objects:
+            return [[] for _ in range(len(origins))]
+        slots = np.flatnonzero(self._slot_ids >= 0)
+        centers = (self._aabb_min[slots] + self._aabb_max[slots]) / 2
+        radii = np.linalg.norm(self._aabb_max[slots] - centers, axis=-1)
+
+        unit = directions / np.maximum(np.linalg.norm(directions, axis=-1, keepdims=True), EPS)
+        oc = centers[None] - origins[:, None, :]
+        dist = np.linalg.norm(oc, axis=-1)
+        cos = (oc * unit[:, None, :]).sum(-1) / np.maximum(dist, EPS)
+        offset = np.arccos(np.clip(cos, -1., 1.))
+        # angular radius of the bounding sphere, a ray starting inside it always matches
+        half = np.arcsin(np.clip(radii[None] / np.maximum(dist, EPS), 0., 1.))
+        offset = np.maximum(offset - half, 0.)
+        match = (offset <= angle) & (dist - radii[None] <= t_max)
+
+        res = []
+        for r in range(len(origins)):
+            cols = np.flatnonzero(match[r])
+            cols = cols[np.argsort(offset[r, cols], kind='stable')]
+            res.append([(int(self._slot_ids[slots[c]]), float(dist[r, c]), float(offset[r, c])) for c in cols])
+        return res
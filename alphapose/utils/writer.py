@@ -8,9 +8,14 @@ import numpy as np
 import torch
 import torch.multiprocessing as mp
 
-from alphapose.utils.transforms import get_func_heatmap_to_coord
-from alphapose.utils.pPose_nms import pose_nms, write_json
+from alphapose.utils.config import update_config
+from alphapose.utils.transforms import get_func_heatmap_to_coord, heatmap_to_pose
+from alphapose.utils.pPose_nms import pose_nms
+from alphapose.utils.stream_writer import StreamWriter
+from alphapose.utils.kpt_archive import ArchiveWriter
 from alphapose.utils.js_pub import talker
+from alphapose.utils.operator_gate import pick_operator
+from alphapose.utils.pose_cascade import CascadeHeatmaps
 
 DEFAULT_VIDEO_SAVE_OPT = {
     'savepath': 'examples/res/1.mp4',
@@ -29,10 +34,18 @@ class DataWriter():
         self.cfg = cfg
         self.opt = opt
         self.video_save_opt = video_save_opt
+        # operator whose keypoints are published, see publish_kp
+        self.operator_id = None
 
         self.eval_joints = EVAL_JOINTS
         self.save_video = save_video
         self.heatmap_to_coord = get_func_heatmap_to_coord(cfg)
+        if getattr(opt, 'cascade_cfg', ''):
+            # decoder of the light model of a PoseCascade, see cascade_to_pose
+            light_cfg = update_config(opt.cascade_cfg)
+            self.light_heatmap_to_coord = get_func_heatmap_to_coord(light_cfg)
+            self.light_hm_size = light_cfg.DATA_PRESET.HEATMAP_SIZE
+            self.light_norm_type = light_cfg.LOSS.get('NORM_TYPE', None)
         # initialize the queue used to store frames read from
         # the video file
         if opt.sp:
@@ -81,8 +94,10 @@ class DataWriter():
         return self
 
     def update(self):
-        # print('update')
-        final_result = []
+        # results are streamed to disk as they come, see StreamWriter
+        json_writer = StreamWriter(self.opt.outputpath, form=self.opt.format, for_eval=self.opt.eval).start()
+        if self.opt.archive:
+            archive_writer = ArchiveWriter(os.path.join(self.opt.outputpath, 'alphapose-results.kpts'))
         norm_type = self.cfg.LOSS.get('NORM_TYPE', None)
         hm_size = self.cfg.DATA_PRESET.HEATMAP_SIZE
         if self.save_video:
@@ -105,49 +120,25 @@ class DataWriter():
                 # if the thread indicator variable is set (img is None), stop the thread
                 if self.save_video:
                     stream.release()
-                write_json(final_result, self.opt.outputpath, form=self.opt.format, for_eval=self.opt.eval)
-                print('Called update')
-                print(final_result)
+                json_writer.close()
+                if self.opt.archive:
+                    archive_writer.close()
                 print("Results have been written to json.")
                 return
             # image channel RGB->BGR
             orig_img = np.array(orig_img, dtype=np.uint8)[:, :, ::-1]
             if boxes is None or len(boxes) == 0:
+                if self.opt.archive:
+                    archive_writer.write({'imgname': im_name, 'result': []})
                 if self.opt.save_img or self.save_video or self.opt.vis:
                     self.write_image(orig_img, im_name, stream=stream if self.save_video else None)
             else:
                 # location prediction (n, kp, 2) | score prediction (n, kp, 1)
-                assert hm_data.dim() == 4
-
-                face_hand_num = 110
-                if hm_data.size()[1] == 136:
-                    self.eval_joints = [*range(0,136)]
-                elif hm_data.size()[1] == 26:
-                    self.eval_joints = [*range(0,26)]
-                elif hm_data.size()[1] == 133:
-                    self.eval_joints = [*range(0,133)]
-                elif hm_data.size()[1] == 68:
-                    face_hand_num = 42
-                    self.eval_joints = [*range(0,68)]
-                elif hm_data.size()[1] == 21:
-                    self.eval_joints = [*range(0,21)]
-                pose_coords = []
-                pose_scores = []
-                for i in range(hm_data.shape[0]):
-                    bbox = cropped_boxes[i].tolist()
-                    if isinstance(self.heatmap_to_coord, list):
-                        pose_coords_body_foot, pose_scores_body_foot = self.heatmap_to_coord[0](
-                            hm_data[i][self.eval_joints[:-face_hand_num]], bbox, hm_shape=hm_size, norm_type=norm_type)
-                        pose_coords_face_hand, pose_scores_face_hand = self.heatmap_to_coord[1](
-                            hm_data[i][self.eval_joints[-face_hand_num:]], bbox, hm_shape=hm_size, norm_type=norm_type)
-                        pose_coord = np.concatenate((pose_coords_body_foot, pose_coords_face_hand), axis=0)
-                        pose_score = np.concatenate((pose_scores_body_foot, pose_scores_face_hand), axis=0)
-                    else:
-                        pose_coord, pose_score = self.heatmap_to_coord(hm_data[i][self.eval_joints], bbox, hm_shape=hm_size, norm_type=norm_type)
-                    pose_coords.append(torch.from_numpy(pose_coord).unsqueeze(0))
-                    pose_scores.append(torch.from_numpy(pose_score).unsqueeze(0))
-                preds_img = torch.cat(pose_coords)
-                preds_scores = torch.cat(pose_scores)
+                if isinstance(hm_data, CascadeHeatmaps):
+                    preds_img, preds_scores = self.cascade_to_pose(hm_data, cropped_boxes, hm_size, norm_type)
+                else:
+                    preds_img, preds_scores = heatmap_to_pose(
+                        hm_data, cropped_boxes, self.heatmap_to_coord, hm_size, norm_type)
                 if not self.opt.pose_track:
                     boxes, scores, ids, preds_img, preds_scores, pick_ids = \
                         pose_nms(boxes, scores, ids, preds_img, preds_scores, self.opt.min_box_area, use_heatmap_loss=self.use_heatmap_loss)
@@ -175,16 +166,18 @@ class DataWriter():
                     for i in range(len(poseflow_result)):
                         result['result'][i]['idx'] = poseflow_result[i]['idx']
 
-                final_result.append(result)
+                json_writer.write(result)
+                if self.opt.archive:
+                    archive_writer.write(result)
                 
-                publish_kp(result)
+                self.operator_id = publish_kp(result, self.operator_id)
                 
                 
                 
                 
                 
                 if self.opt.save_img or self.save_video or self.opt.vis:
-                    if hm_data.size()[1] == 49:
+                    if not isinstance(hm_data, CascadeHeatmaps) and hm_data.size()[1] == 49:
                         from alphapose.utils.vis import vis_frame_dense as vis_frame
                     elif self.opt.vis_fast:
                         from alphapose.utils.vis import vis_frame_fast as vis_frame
@@ -193,6 +186,26 @@ class DataWriter():
                     img = vis_frame(orig_img, result, self.opt, self.vis_thres)
                     self.write_image(img, im_name, stream=stream if self.save_video else None)
 
+    def cascade_to_pose(self, hm_data, cropped_boxes, hm_size, norm_type):
+        """Keypoints of a PoseCascade forward in the joint layout of the heavy model.
+
+        The light model fills the first joints of the people it kept, the
+        other joints get a zero score.
+        """
+        light_img, light_scores = heatmap_to_pose(
+            hm_data.light, cropped_boxes, self.light_heatmap_to_coord, self.light_hm_size, self.light_norm_type)
+        num_joints = self.cfg.DATA_PRESET.NUM_JOINTS
+        preds_img = light_img.new_zeros(len(light_img), num_joints, 2)
+        preds_scores = light_scores.new_zeros(len(light_img), num_joints, 1)
+        preds_img[:, :light_img.size(1)] = light_img
+        preds_scores[:, :light_scores.size(1)] = light_scores
+        if hm_data.refined.any():
+            heavy_img, heavy_scores = heatmap_to_pose(
+                hm_data.heavy, cropped_boxes[hm_data.refined], self.heatmap_to_coord, hm_size, norm_type)
+            preds_img[hm_data.refined] = heavy_img.to(preds_img.dtype)
+            preds_scores[hm_data.refined] = heavy_scores.to(preds_scores.dtype)
+        return preds_img, preds_scores
+
     def write_image(self, img, im_name, stream=None):
         # print('called write image')
         if self.opt.vis:
@@ -261,9 +274,13 @@ class DataWriter():
             print("Unknow video format {}, will use .mp4 instead of it".format(ext))
             return cv2.VideoWriter_fourcc(*'mp4v'), '.mp4'
 
-def publish_kp(result):        
-        kp = result['result'][0]['keypoints']
-        kp_score = result['result'][0]['kp_score']
+def publish_kp(result, operator_id=None):
+        # keep publishing the same operator while they are in view
+        human, operator_id = pick_operator(result['result'], operator_id)
+        if human is None:
+            return operator_id
+        kp = human['keypoints']
+        kp_score = human['kp_score']
         # print('\n'+str(len(kp))+'----------------------------'+str(len(kp_score))+'\n')
         # print(kp.shape)
         EB_L = kp[7,:] # left elbow
@@ -273,4 +290,5 @@ def publish_kp(result):
         # print(type(EB_L))
         msg = (torch.cat([EB_L ,EB_R,WR_L,WR_R],dim=0))
         talker(msg)
-        # print(msg.shape)
\ No newline at end of file
+        # print(msg.shape)
+        return operator_id
\ No newline at end of file
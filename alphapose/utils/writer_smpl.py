@@ -8,7 +8,8 @@ import numpy as np
 import torch
 import torch.multiprocessing as mp
 
-from alphapose.utils.pPose_nms import pose_nms, write_json
+from alphapose.utils.pPose_nms import pose_nms
+from alphapose.utils.stream_writer import StreamWriter
 
 DEFAULT_VIDEO_SAVE_OPT = {
     'savepath': 'examples/res/1.mp4',
@@ -67,7 +68,7 @@ class DataWriterSMPL():
         return self
 
     def update(self):
-        final_result = []
+        json_writer = StreamWriter(self.opt.outputpath, form=self.opt.format, for_eval=self.opt.eval).start()
         norm_type = self.cfg.LOSS.get('NORM_TYPE', None)
         hm_size = self.cfg.DATA_PRESET.HEATMAP_SIZE
         if self.save_video:
@@ -95,7 +96,7 @@ class DataWriterSMPL():
                 # if the thread indicator variable is set (img is None), stop the thread
                 if self.save_video:
                     stream.release()
-                write_json(final_result, self.opt.outputpath, form=self.opt.format, for_eval=self.opt.eval)
+                json_writer.close()
                 print("Results have been written to json.")
                 return
             # image channel RGB->BGR
@@ -147,7 +148,7 @@ class DataWriterSMPL():
                     for i in range(len(poseflow_result)):
                         result['result'][i]['idx'] = poseflow_result[i]['idx']
 
-                final_result.append(result)
+                json_writer.write(result)
                 if self.opt.save_img or self.save_video or self.opt.vis:
                     from alphapose.utils.vis import vis_frame_smpl
                     img = vis_frame_smpl(orig_img, result, smpl_output, self.opt, self.vis_thres)
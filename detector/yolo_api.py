@@ -39,11 +39,21 @@ class YOLODetector(BaseDetector):
         self.nms_thres = cfg.get('NMS_THRES', 0.6)
         self.confidence = 0.3 if (False if not hasattr(opt, 'tracking') else opt.tracking) else cfg.get('CONFIDENCE', 0.05)
         self.num_classes = cfg.get('NUM_CLASSES', 80)
+        self.onnx = cfg.get('ONNX', '')
         self.model = None
 
     def load_model(self):
         args = self.detector_opt
 
+        if self.onnx:
+            from alphapose.models.onnx_backend import OnnxModel
+            print(f'Loading YOLO ONNX model {self.onnx}..')
+            # exported by scripts/export_onnx.py with the box decoding, at a fixed input size
+            self.model = OnnxModel(self.onnx)
+            if self.model.input_shape[2] != self.inp_dim:
+                raise ValueError(f'{self.onnx} was exported for INP_DIM {self.model.input_shape[2]}, not {self.inp_dim}')
+            return
+
         print('Loading YOLO model..')
         self.model = Darknet(self.model_cfg)
         self.model.load_weights(self.model_weights)
@@ -59,6 +69,22 @@ class YOLODetector(BaseDetector):
             self.model.cuda()
         self.model.eval()
 
+        if self.detector_cfg.get('OPTIMIZE', False) and args and len(args.gpus) <= 1:
+            from alphapose.models.optimize import optimize_for_inference
+            # the input size changes at runtime (set_inp_dim), so no torchscript
+            example = (torch.rand(1, 3, self.inp_dim, self.inp_dim, device=args.device), args)
+            self.model = optimize_for_inference(self.model, example, script=False, name='yolo')
+
+    def set_inp_dim(self, inp_dim):
+        """Change the network input size, a multiple of 32"""
+        if self.onnx:
+            # the onnx graph has a fixed input size
+            return
+        self.inp_dim = inp_dim
+        if self.model:
+            model = self.model.module if isinstance(self.model, torch.nn.DataParallel) else self.model
+            model.net_info['height'] = inp_dim
+
     def image_preprocess(self, img_source):
         """
         Pre-process the img before fed to the object detection network
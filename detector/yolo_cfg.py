@@ -7,3 +7,7 @@ cfg.INP_DIM =  608
 cfg.NMS_THRES =  0.6
 cfg.CONFIDENCE = 0.1
 cfg.NUM_CLASSES = 80
+# fold batchnorm and use channels-last convs at load, see alphapose/models/optimize.py
+cfg.OPTIMIZE = False
+# yolo graph written by scripts/export_onnx.py, run with ONNX Runtime on cpu instead of torch
+cfg.ONNX = ''
@@ -33,12 +33,25 @@ class YOLOXDetector(BaseDetector):
         self.nms_thres = cfg.get("NMS_THRES", 0.6)
         self.inp_dim = cfg.get("INP_DIM", 640)
         self.img_size = [self.inp_dim, self.inp_dim]
+        self.onnx = cfg.get("ONNX", "")
 
         self.model = None
 
     def load_model(self):
         args = self.detector_opt
 
+        if self.onnx:
+            from alphapose.models.onnx_backend import OnnxModel
+
+            print(f"Loading {self.model_name.upper().replace('_', '-')} ONNX model {self.onnx}..")
+            # exported by scripts/export_onnx.py with the box decoding, at a fixed input size
+            self.model = OnnxModel(self.onnx)
+            if self.model.input_shape[2] != self.inp_dim:
+                raise ValueError(
+                    f"{self.onnx} was exported for INP_DIM {self.model.input_shape[2]}, not {self.inp_dim}"
+                )
+            return
+
         # Load model
         print(f"Loading {self.model_name.upper().replace('_', '-')} model..")
         self.model = self.exp.get_model()
@@ -57,6 +70,14 @@ class YOLOXDetector(BaseDetector):
             self.model.cuda()
         self.model.eval()
 
+    def set_inp_dim(self, inp_dim):
+        """Change the network input size, a multiple of 32"""
+        if self.onnx:
+            # the onnx graph has a fixed input size
+            return
+        self.inp_dim = inp_dim
+        self.img_size = [self.inp_dim, self.inp_dim]
+
     def image_preprocess(self, img_source):
         """
         Pre-process the img before fed to the object detection network
@@ -6,3 +6,5 @@ cfg.MODEL_WEIGHTS = "detector/yolox/data/yolox_x.pth"
 cfg.INP_DIM = 640
 cfg.CONF_THRES = 0.1
 cfg.NMS_THRES = 0.6
+# yolox graph written by scripts/export_onnx.py, run with ONNX Runtime on cpu instead of torch
+cfg.ONNX = ""
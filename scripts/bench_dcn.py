@@ -0,0 +1,72 @@
+"""Microbenchmark of the deformable convolution against a plain conv of the same shape.
+
+Times the DCN layers of the FastPose ResNet-50 (stages 2-4 at a 256x192 input)
+on the chosen device, offset conv included, next to nn.Conv2d, so the cost of
+serving DCN checkpoints on cpu is known ahead of time.
+"""
+import argparse
+import time
+
+import torch
+import torch.nn as nn
+
+from alphapose.models.layers.dcn import DCN
+
+"""----------------------------- Benchmark options -----------------------------"""
+parser = argparse.ArgumentParser(description='Deformable conv microbenchmark')
+parser.add_argument('--batch', type=int, nargs='*', default=[1, 8],
+                    help='batch sizes to time')
+parser.add_argument('--modulated', default=False, action='store_true',
+                    help='time the modulated (DCNv2) variant')
+parser.add_argument('--device', type=str, default='cpu',
+                    help='torch device')
+parser.add_argument('--threads', type=int, default=0,
+                    help='torch cpu threads, 0 keeps the default')
+parser.add_argument('--iters', type=int, default=20,
+                    help='timed iterations per layer')
+args = parser.parse_args()
+
+# (name, channels, height, width) of the 3x3 conv of every dcn stage
+LAYERS = [
+    ('layer2', 128, 32, 24),
+    ('layer3', 256, 16, 12),
+    ('layer4', 512, 8, 6),
+]
+
+
+def timeit(layer, x, iters):
+    with torch.no_grad():
+        for _ in range(3):
+            layer(x)
+        if x.is_cuda:
+            torch.cuda.synchronize()
+        start = time.time()
+        for _ in range(iters):
+            layer(x)
+        if x.is_cuda:
+            torch.cuda.synchronize()
+    return (time.time() - start) / iters * 1000
+
+
+def main():
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    device = torch.device(args.device)
+    dcn_cfg = {'MODULATED': args.modulated, 'DEFORM_GROUP': 1}
+    print(f'device {device}, {torch.get_num_threads()} threads, modulated={args.modulated}')
+    print('%-8s %6s %12s %10s %10s %7s' % ('layer', 'batch', 'shape', 'conv ms', 'dcn ms', 'ratio'))
+    for name, channels, height, width in LAYERS:
+        conv = nn.Conv2d(channels, channels, 3, padding=1, bias=False).to(device).eval()
+        dcn = DCN(channels, channels, dcn_cfg, kernel_size=3, padding=1).to(device).eval()
+        # random offsets, zero offsets would let the sampling hit only integer positions
+        nn.init.normal_(dcn.conv_offset.weight, std=0.01)
+        for batch in args.batch:
+            x = torch.randn(batch, channels, height, width, device=device)
+            t_conv = timeit(conv, x, args.iters)
+            t_dcn = timeit(dcn, x, args.iters)
+            print('%-8s %6d %12s %10.2f %10.2f %6.1fx' % (
+                name, batch, f'{channels}x{height}x{width}', t_conv, t_dcn, t_dcn / t_conv))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Cpu throughput of the pose model over pose workers x threads per worker.
+
+Runs batches of random crops through PoseWorkerPool for every combination
+that fits the cores of the process, next to the single-process model with
+the default threading, and prints the best --pose_workers/--pose_threads
+for scripts/demo_inference.py on this host.
+"""
+import argparse
+import os
+import time
+
+import torch
+
+from alphapose.models import builder
+from alphapose.utils.config import update_config
+from alphapose.utils.pose_workers import PoseWorkerPool
+
+"""----------------------------- Benchmark options -----------------------------"""
+parser = argparse.ArgumentParser(description='Pose worker throughput benchmark')
+parser.add_argument('--cfg', type=str, default='configs/coco/resnet/256x192_res50_lr1e-3_1x.yaml',
+                    help='experiment configure file name')
+parser.add_argument('--checkpoint', type=str, default='',
+                    help='pose checkpoint, random weights if empty')
+parser.add_argument('--workers', type=int, nargs='*', default=[],
+                    help='numbers of workers to try, default powers of two up to the cores')
+parser.add_argument('--threads', type=int, nargs='*', default=[],
+                    help='threads per worker to try, default powers of two up to the cores')
+parser.add_argument('--batch', type=int, default=32,
+                    help='crops per call, as the --posebatch of the demo')
+parser.add_argument('--iters', type=int, default=10,
+                    help='timed calls per setting')
+args = parser.parse_args()
+cfg = update_config(args.cfg)
+
+
+def powers_of_two(limit):
+    n, out = 1, []
+    while n <= limit:
+        out.append(n)
+        n *= 2
+    return out
+
+
+def throughput(model, x, iters):
+    with torch.no_grad():
+        model(x)
+        start = time.time()
+        for _ in range(iters):
+            model(x)
+    return iters * len(x) / (time.time() - start)
+
+
+def main():
+    num_cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    x = torch.randn(args.batch, 3, *cfg.DATA_PRESET.IMAGE_SIZE)
+    print(f'{num_cores} cores, batch {args.batch}, {cfg.MODEL.TYPE}')
+    print('%8s %8s %12s' % ('workers', 'threads', 'crops/s'))
+
+    if args.checkpoint:
+        model = builder.build_sppe(cfg.MODEL, preset_cfg=cfg.DATA_PRESET, checkpoint=args.checkpoint)
+    else:
+        model = builder.build_sppe(cfg.MODEL, preset_cfg=cfg.DATA_PRESET, IMAGENET_INIT=False)
+    model.eval()
+    best = (throughput(model, x, args.iters), 0, torch.get_num_threads())
+    print('%8s %8d %12.1f' % ('-', best[2], best[0]))
+    del model
+
+    for num_workers in args.workers or powers_of_two(num_cores):
+        for num_threads in args.threads or powers_of_two(num_cores // num_workers):
+            if num_workers * num_threads > num_cores:
+                continue
+            pool = PoseWorkerPool(cfg, args.checkpoint, num_workers, num_threads).start()
+            try:
+                rate = throughput(pool, x, args.iters)
+            finally:
+                pool.stop()
+            print('%8d %8d %12.1f' % (num_workers, num_threads, rate))
+            best = max(best, (rate, num_workers, num_threads))
+
+    if best[1]:
+        print(f'Best: --pose_workers {best[1]} --pose_threads {best[2]} ({best[0]:.1f} crops/s)')
+    else:
+        print(f'Best: a single process with {best[2]} threads ({best[0]:.1f} crops/s)')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""Solve the camera -> robot base transform from recorded samples."""
+import argparse
+
+import numpy as np
+
+from alphapose.utils.calibration import calibrate
+
+"""----------------------------- Calibration options -----------------------------"""
+parser = argparse.ArgumentParser(description='Camera to robot calibration')
+parser.add_argument('--samples', type=str, required=True,
+                    help='npz with camera_points/robot_points (N, 3), or robot_poses/target_poses (M, 4, 4)')
+parser.add_argument('--output', type=str, default='calibration/cam_to_world.json',
+                    help='calibration json, pass it to scripts/demo_api.py with --calib')
+parser.add_argument('--eye_in_hand', default=False, action='store_true',
+                    help='camera mounted on the gripper instead of a static camera')
+args = parser.parse_args()
+
+
+if __name__ == '__main__':
+    extrinsics = calibrate(args.samples, eye_in_hand=args.eye_in_hand)
+    np.set_printoptions(precision=4, suppress=True)
+    print(extrinsics.matrix)
+    print({k: v for k, v in extrinsics.info.items() if k != 'time'})
+    extrinsics.save(args.output)
+    print('Saved to', args.output)
@@ -21,11 +21,15 @@ import numpy as np
 from alphapose.utils.transforms import get_func_heatmap_to_coord
 from alphapose.utils.pPose_nms import pose_nms
 from alphapose.utils.presets import SimpleTransform, SimpleTransform3DSMPL
-from alphapose.utils.transforms import flip, flip_heatmap
+from alphapose.utils.flip_test import FlipTest
 from alphapose.models import builder
+from alphapose.models.optimize import optimize_from_cfg
 from alphapose.utils.config import update_config
 from detector.apis import get_detector
 from alphapose.utils.vis import getTime
+from alphapose.utils.calibration import load_extrinsics
+from alphapose.utils.operator_gate import build_selector, gate_detections, pick_operator
+from alphapose.utils.depth_roi import build_depth_roi
 # from scripts.twoD2threeD import get_3d_camera_coordinate, get_aligned_images
 
 """----------------------------- Demo options -----------------------------"""
@@ -56,10 +60,26 @@ parser.add_argument('--gpus', type=str, dest='gpus', default="0",
                     help='choose which cuda device to use by index and input comma to use multi gpus, e.g. 0,1,2,3. (input -1 for cpu only)')
 parser.add_argument('--flip', default=False, action='store_true',
                     help='enable flip testing')
+parser.add_argument('--flip_thresh', type=float, default=0,
+                    help='flip test only the people with a mean keypoint score below this, 0 flips everyone')
 parser.add_argument('--debug', default=False, action='store_true',
                     help='print detail information')
 parser.add_argument('--vis_fast', dest='vis_fast',
                     help='use fast rendering', action='store_true', default=False)
+parser.add_argument('--hand_cfg', type=str, default=None,
+                    help='single_hand config, refine raised or pointing hands with a second stage')
+parser.add_argument('--hand_checkpoint', type=str, default=None,
+                    help='single_hand checkpoint file name')
+parser.add_argument('--operators', type=int, default=0,
+                    help='only estimate and publish the pose of the top-k operators, 0 to pose everyone')
+parser.add_argument('--zone', type=float, nargs=4, default=None,
+                    help='workspace zone x1 y1 x2 y2 in pixels that operators are expected in')
+parser.add_argument('--robot_position', type=float, nargs=3, default=None,
+                    help='robot base x y z in camera coordinates (meters) to rank operators by distance to, default camera depth')
+parser.add_argument('--depth_roi', type=float, nargs=2, default=None,
+                    help='near far distance in meters, only detect people on the part of the frame within this depth band')
+parser.add_argument('--calib', type=str, default=None,
+                    help='camera to world calibration json written by scripts/calibrate.py, the fixed mounting transform is used if not given')
 """----------------------------- Tracking options -----------------------------"""
 parser.add_argument('--pose_flow', dest='pose_flow',
                     help='track humans in video with PoseFlow', action='store_true', default=False)
@@ -79,6 +99,9 @@ class DetectionLoader():
         self.opt = opt
         self.device = opt.device
         self.detector = detector
+        self.operator_selector = build_selector(opt)
+        self.depth_roi = build_depth_roi(opt)
+        self.depth = None
 
         self._input_size = cfg.DATA_PRESET.IMAGE_SIZE
         self._output_size = cfg.DATA_PRESET.HEATMAP_SIZE
@@ -118,7 +141,11 @@ class DetectionLoader():
         self.det = (None, None, None, None, None, None, None)
         self.pose = (None, None, None, None, None, None, None)
 
-    def process(self, im_name, image):
+    def process(self, im_name, image, depth=None, intrin=None):
+        # aligned depth frame and its intrinsics, used to rank operators by distance
+        self.depth = depth
+        if intrin is not None and self.operator_selector is not None and self.operator_selector.intrin is None:
+            self.operator_selector.set_intrinsics(intrin)
         # start to pre process images for object detection
         self.image_preprocess(im_name, image)
         # start to detect human in images
@@ -128,13 +155,17 @@ class DetectionLoader():
         return self
 
     def image_preprocess(self, im_name, image):
-        # expected image shape like (1,3,h,w) or (3,h,w)
-        img = self.detector.image_preprocess(image)
-        if isinstance(img, np.ndarray):
-            img = torch.from_numpy(img)
-        # add one dimension at the front for batch if image shape (3,h,w)
-        if img.dim() == 3:
-            img = img.unsqueeze(0)
+        if self.depth_roi is not None and self.depth is not None:
+            # the workspace crop is prepared in image_detection
+            img = None
+        else:
+            # expected image shape like (1,3,h,w) or (3,h,w)
+            img = self.detector.image_preprocess(image)
+            if isinstance(img, np.ndarray):
+                img = torch.from_numpy(img)
+            # add one dimension at the front for batch if image shape (3,h,w)
+            if img.dim() == 3:
+                img = img.unsqueeze(0)
         orig_img = image # scipy.misc.imread(im_name_k, mode='RGB') is depreciated
         im_dim = orig_img.shape[1], orig_img.shape[0]
 
@@ -148,12 +179,16 @@ class DetectionLoader():
 
     def image_detection(self):
         imgs, orig_imgs, im_names, im_dim_list = self.image
-        if imgs is None:
+        if orig_imgs is None:
             self.det = (None, None, None, None, None, None, None)
             return
 
         with torch.no_grad():
-            dets = self.detector.images_detection(imgs, im_dim_list)
+            if imgs is None:
+                # only the occupied part of the workspace goes through the detector
+                dets = self.depth_roi.detect(self.detector, orig_imgs, self.depth)
+            else:
+                dets = self.detector.images_detection(imgs, im_dim_list)
             if isinstance(dets, int) or dets.shape[0] == 0:
                 self.det = (orig_imgs, im_names, None, None, None, None, None)
                 return
@@ -165,13 +200,17 @@ class DetectionLoader():
             ids = torch.zeros(scores.shape)
 
         boxes = boxes[dets[:, 0] == 0]
+        scores, ids = scores[dets[:, 0] == 0], ids[dets[:, 0] == 0]
+        if self.operator_selector is not None and boxes.shape[0] > 0:
+            # bystanders are dropped before cropping and pose estimation
+            boxes, scores, ids = gate_detections(self.operator_selector, boxes, scores, ids, depth=self.depth)
         if isinstance(boxes, int) or boxes.shape[0] == 0:
             self.det = (orig_imgs, im_names, None, None, None, None, None)
             return
         inps = torch.zeros(boxes.size(0), 3, *self._input_size)
         cropped_boxes = torch.zeros(boxes.size(0), 4)
 
-        self.det = (orig_imgs, im_names, boxes, scores[dets[:, 0] == 0], ids[dets[:, 0] == 0], inps, cropped_boxes)
+        self.det = (orig_imgs, im_names, boxes, scores, ids, inps, cropped_boxes)
 
     def image_postprocess(self):
         with torch.no_grad():
@@ -301,18 +340,27 @@ class SingleImageAlphaPose():
         self.cfg = cfg
 
         # Load pose model
-        self.pose_model = builder.build_sppe(cfg.MODEL, preset_cfg=cfg.DATA_PRESET)
-
         print(f'Loading pose model from {args.checkpoint}...')
-        self.pose_model.load_state_dict(torch.load(args.checkpoint, map_location=args.device))
+        self.pose_model = builder.build_sppe(cfg.MODEL, preset_cfg=cfg.DATA_PRESET,
+                                             checkpoint=args.checkpoint, device=args.device)
+        self.pose_model = optimize_from_cfg(self.pose_model, cfg.MODEL.get('OPTIMIZE', False),
+                                            (torch.randn(1, 3, *cfg.DATA_PRESET.IMAGE_SIZE, device=args.device),),
+                                            name='pose model')
         self.pose_dataset = builder.retrieve_dataset(cfg.DATASET.TRAIN)
+        self.flip_test = FlipTest(self.pose_model, self.pose_dataset.joint_pairs, args.flip_thresh) if args.flip else None
 
         self.pose_model.to(args.device)
         self.pose_model.eval()
         
         self.det_loader = DetectionLoader(get_detector(self.args), self.cfg, self.args)
 
-    def process(self, im_name, image):
+        # Load fingertip refinement stage
+        self.hand_refiner = None
+        if args.hand_cfg:
+            from alphapose.utils.hand_refine import HandRefiner
+            self.hand_refiner = HandRefiner(update_config(args.hand_cfg), args.hand_checkpoint, args.device)
+
+    def process(self, im_name, image, depth=None, intrin=None):
         # Init data writer
         self.writer = DataWriter(self.cfg, self.args)
 
@@ -325,7 +373,7 @@ class SingleImageAlphaPose():
         try:
             start_time = getTime()
             with torch.no_grad():
-                (inps, orig_img, im_name, boxes, scores, ids, cropped_boxes) = self.det_loader.process(im_name, image).read()
+                (inps, orig_img, im_name, boxes, scores, ids, cropped_boxes) = self.det_loader.process(im_name, image, depth, intrin).read()
                 if orig_img is None:
                     raise Exception("no image is given")
                 if boxes is None or boxes.nelement() == 0:
@@ -346,18 +394,21 @@ class SingleImageAlphaPose():
                         runtime_profile['dt'].append(det_time)
                     # Pose Estimation
                     inps = inps.to(self.args.device)
-                    if self.args.flip:
-                        inps = torch.cat((inps, flip(inps)))
-                    hm = self.pose_model(inps)
-                    if self.args.flip:
-                        hm_flip = flip_heatmap(hm[int(len(hm) / 2):], self.pose_dataset.joint_pairs, shift=True)
-                        hm = (hm[0:int(len(hm) / 2)] + hm_flip) / 2
+                    if self.flip_test is not None:
+                        hm = self.flip_test(inps)
+                    else:
+                        hm = self.pose_model(inps)
                     if self.args.profile:
                         ckpt_time, pose_time = getTime(ckpt_time)
                         runtime_profile['pt'].append(pose_time)
                     hm = hm.cpu()
                     self.writer.save(boxes, scores, ids, hm, cropped_boxes, orig_img, im_name)
                     pose = self.writer.start()
+                    if self.hand_refiner is not None:
+                        pose = self.hand_refiner.refine(orig_img, pose)
+                    if self.det_loader.operator_selector is not None:
+                        # raised arms of this frame rank the operators of the next one
+                        self.det_loader.operator_selector.update_pose(pose)
                     if self.args.profile:
                         ckpt_time, post_time = getTime(ckpt_time)
                         runtime_profile['pn'].append(post_time)
@@ -463,54 +514,6 @@ def get_3d_camera_coordinate(points, aligned_depth_frame, depth_intrin):
         # camera_coordinates.append(rs.rs2_deproject_pixel_to_point(depth_intrin, point, aligned_depth_frame.get_distance(0,0)))
     return camera_coordinates
 
-def transform_coordinate(coord, transform_matrix):
-    """
-    将3x1坐标向量应用4x4变换矩阵，返回转换后的3x1坐标向量
-    :param coord: 3x1坐标向量
-    :param transform_matrix: 4x4变换矩阵
-    :return: 转换后的3x1坐标向量
-    """
-    # 将3x1坐标向量扩展为4x1齐次坐标
-    coord_homogeneous = np.vstack((coord, 1))
-
-    # 应用变换矩阵
-    transformed_coord_homogeneous = np.dot(transform_matrix, coord_homogeneous)
-
-    # 将齐次坐标还原为3x1坐标向量
-    transformed_coord = transformed_coord_homogeneous[:3] / transformed_coord_homogeneous[3]
-
-    return transformed_coord
-
-def transform_coordinates(coords, transform_matrix):
-    """
-    将二维坐标数组应用4x4变换矩阵，返回转换后的坐标数组
-    :param coords: n*2的坐标数组
-    :param transform_matrix: 4x4变换矩阵
-    :return: 转换后的坐标数组
-    """
-    # 将二维坐标数组扩展为n*3的齐次坐标数组
-    coords_homogeneous = np.hstack((coords, np.ones((len(coords), 1))))
-
-    # 应用变换矩阵
-    transformed_coords_homogeneous = np.dot(transform_matrix, coords_homogeneous.T).T
-
-    # 将齐次坐标还原为二维坐标
-    transformed_coords = transformed_coords_homogeneous[:, :-1] / transformed_coords_homogeneous[:, -1].reshape(-1, 1)
-
-    return transformed_coords
-
-def generate_transform_matrix(coords_after, translation):
-    """
-    根据变换后坐标系的单位向量在原坐标系下的表示和平移向量，生成4x4的变换矩阵
-    :param coords_after: 变换后坐标系单位向量在原坐标系下的表示，3x3的旋转矩阵
-    :param translation: 平移向量，4x1的列向量，其中第4个元素为1
-    :return: 4x4的变换矩阵
-    """
-    # 构造变换矩阵
-    transform_matrix = np.vstack((np.hstack((coords_after, translation[:3])), np.array([0, 0, 0, 1])))
-
-    return transform_matrix
-    
 def js():
     pipeline = rs.pipeline()
     config = rs.config()
@@ -519,12 +522,7 @@ def js():
     pipeline.start(config)
     align_to = rs.stream.color      
     align = rs.align(align_to)
-    x_u = [1,0,0]
-    y_u = [0,0,1]
-    z_u = [0,-1,0]
-    trans = [[0],[0],[1.32],[1]]
-    
-    transform_matrix = generate_transform_matrix([x_u,y_u,z_u],trans)
+    cam_to_world = load_extrinsics(args.calib)
     
     
     
@@ -533,23 +531,25 @@ def js():
     rospy.init_node('ljs')
     coord_pub = rospy.Publisher('/coords', Float32MultiArray, queue_size=10)
     rate = rospy.Rate(10)
+    operator_id = None
     
 
     try:
         while True:
             
-            depth_intrin, img_color, _, aligned_depth_frame = get_aligned_images(align, pipeline)        # 获取对齐图像与相机参数
+            depth_intrin, img_color, img_depth, aligned_depth_frame = get_aligned_images(align, pipeline)        # 获取对齐图像与相机参数
             depth_pixel = [320, 240]        
             
 
             color_img = np.asanyarray(img_color)
             image = cv2.cvtColor(color_img, cv2.COLOR_BGR2RGB)
-            pose = demo.process(im_name, image)
+            pose = demo.process(im_name, image, depth=img_depth, intrin=depth_intrin)
             cv2.imshow('color', image)
             # print(pose)
-            if pose is not None:
+            if pose is not None and len(pose['result']) > 0:
                 res = pose['result']
-                keypoint = res[0] # choose the first people recognized, may changing if multiple detected
+                # follow the same operator across frames, see --operators
+                keypoint, operator_id = pick_operator(res, operator_id)
                 # print(len(res)) # number of people recognized
                 keypoint = keypoint['keypoints']
                 # print(type(keypoint)) # tensor
@@ -561,7 +561,7 @@ def js():
                 kp = get_needed_points(keypoint)
                 # print(kp)
                 camera_coordinates = get_3d_camera_coordinate(kp, aligned_depth_frame, depth_intrin)
-                world_coordinates = transform_coordinates(camera_coordinates, transform_matrix)
+                world_coordinates = cam_to_world.apply(camera_coordinates)
                 # print(world_coordinates)
                 coord_msg = Float32MultiArray()
                 coord_msg.data = world_coordinates.flatten().tolist()
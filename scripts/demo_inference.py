@@ -15,10 +15,14 @@ from trackers.tracker_api import Tracker
 from trackers.tracker_cfg import cfg as tcfg
 from trackers import track
 from alphapose.models import builder
+from alphapose.models.optimize import optimize_from_cfg
 from alphapose.utils.config import update_config
 from alphapose.utils.detector import DetectionLoader
 from alphapose.utils.file_detector import FileDetectionLoader
-from alphapose.utils.transforms import flip, flip_heatmap
+from alphapose.utils.flip_test import FlipTest
+from alphapose.utils.pose_batcher import PoseBatcher
+from alphapose.utils.pose_cascade import build_cascade
+from alphapose.utils.pose_workers import PoseWorkerPool
 from alphapose.utils.vis import getTime
 from alphapose.utils.webcam_detector import WebCamDetectionLoader
 from alphapose.utils.writer import DataWriter
@@ -53,12 +57,21 @@ parser.add_argument('--profile', default=False, action='store_true',
                     help='add speed profiling at screen output')
 parser.add_argument('--format', type=str,
                     help='save in the format of cmu or coco or openpose, option: coco/cmu/open')
+parser.add_argument('--archive', default=False, action='store_true',
+                    help='also save results as a columnar keypoint archive (alphapose-results.kpts)')
 parser.add_argument('--min_box_area', type=int, default=0,
                     help='min box area to filter out')
+parser.add_argument('--operators', type=int, default=0,
+                    help='only estimate and publish the pose of the top-k operators, 0 to pose everyone')
+parser.add_argument('--zone', type=float, nargs=4, default=None,
+                    help='workspace zone x1 y1 x2 y2 in pixels that operators are expected in')
 parser.add_argument('--detbatch', type=int, default=5,
                     help='detection batch size PER GPU')
 parser.add_argument('--posebatch', type=int, default=64,
                     help='pose estimation maximum batch size PER GPU')
+parser.add_argument('--posedeadline', type=float, default=-1,
+                    help='seconds a frame may wait for the pose batch to fill with the crops of the next frames, '
+                         '0 poses every frame on its own, default 0 for webcam and no limit otherwise')
 parser.add_argument('--eval', dest='eval', default=False, action='store_true',
                     help='save the result json as coco format, using image index(int) instead of image name(str)')
 parser.add_argument('--gpus', type=str, dest='gpus', default="0",
@@ -67,11 +80,28 @@ parser.add_argument('--qsize', type=int, dest='qsize', default=1024,
                     help='the length of result buffer, where reducing it will lower requirement of cpu memory')
 parser.add_argument('--flip', default=False, action='store_true',
                     help='enable flip testing')
+parser.add_argument('--flip_thresh', type=float, default=0,
+                    help='flip test only the people with a mean keypoint score below this, 0 flips everyone')
+parser.add_argument('--pose_workers', type=int, default=0,
+                    help='cpu only: run the pose model in this many processes pinned to disjoint cores, '
+                         'see scripts/bench_pose_workers.py for the best setting of the host')
+parser.add_argument('--pose_threads', type=int, default=0,
+                    help='torch threads of every pose worker, 0 splits the cores evenly')
+parser.add_argument('--cascade_cfg', type=str, default='',
+                    help='light pose model run first on every person, only the uncertain ones go through --cfg')
+parser.add_argument('--cascade_checkpoint', type=str, default='',
+                    help='light pose model checkpoint')
+parser.add_argument('--cascade_thresh', type=float, default=0.5,
+                    help='mean keypoint score of the light model on --cascade_joints below which the heavy model runs')
+parser.add_argument('--cascade_joints', type=int, nargs='*', default=[5, 6, 7, 8, 9, 10],
+                    help='joints whose light model score decides, default shoulders, elbows and wrists')
 parser.add_argument('--debug', default=False, action='store_true',
                     help='print detail information')
 """----------------------------- Video options -----------------------------"""
 parser.add_argument('--video', dest='video',
                     help='video-name', default="")
+parser.add_argument('--video_range', type=int, nargs=2, default=None,
+                    help='only process frames START to END (exclusive) of the video, see scripts/demo_segments.py')
 parser.add_argument('--webcam', dest='webcam', type=int,
                     help='webcam number', default=-1)
 parser.add_argument('--save_video', dest='save_video',
@@ -95,6 +125,10 @@ args.device = torch.device("cuda:" + str(args.gpus[0]) if args.gpus[0] >= 0 else
 args.detbatch = args.detbatch * len(args.gpus)
 args.posebatch = args.posebatch * len(args.gpus)
 args.tracking = args.pose_track or args.pose_flow or args.detector=='tracker'
+if args.pose_workers > 0 and args.gpus[0] >= 0:
+    raise ValueError('--pose_workers is a cpu mode, use --gpus -1')
+if args.cascade_cfg and args.pose_track:
+    raise ValueError('--cascade_cfg does not work with --pose_track, the tracker needs the heatmaps of one model')
 
 if not args.sp:
     torch.multiprocessing.set_start_method('forkserver', force=True)
@@ -178,18 +212,21 @@ if __name__ == "__main__":
         det_worker = det_loader.start()
 
     # Load pose model
-    pose_model = builder.build_sppe(cfg.MODEL, preset_cfg=cfg.DATA_PRESET)
-
     print('Loading pose model from %s...' % (args.checkpoint,))
-    pose_model.load_state_dict(torch.load(args.checkpoint, map_location=args.device))
+    if args.pose_workers > 0:
+        pose_model = PoseWorkerPool(cfg, args.checkpoint, args.pose_workers, args.pose_threads).start()
+    else:
+        pose_model = builder.build_sppe(cfg.MODEL, preset_cfg=cfg.DATA_PRESET, checkpoint=args.checkpoint, device=args.device)
+        pose_model = optimize_from_cfg(pose_model, cfg.MODEL.get('OPTIMIZE', False),
+                                       (torch.randn(1, 3, *cfg.DATA_PRESET.IMAGE_SIZE, device=args.device),), name='pose model')
+        if len(args.gpus) > 1:
+            pose_model = torch.nn.DataParallel(pose_model, device_ids=args.gpus).to(args.device)
+        else:
+            pose_model.to(args.device)
+        pose_model.eval()
     pose_dataset = builder.retrieve_dataset(cfg.DATASET.TRAIN)
     if args.pose_track:
         tracker = Tracker(tcfg, args)
-    if len(args.gpus) > 1:
-        pose_model = torch.nn.DataParallel(pose_model, device_ids=args.gpus).to(args.device)
-    else:
-        pose_model.to(args.device)
-    pose_model.eval()
 
     runtime_profile = {
         'dt': [],
@@ -221,61 +258,58 @@ if __name__ == "__main__":
         im_names_desc = tqdm(range(data_len), dynamic_ncols=True)
 
     batchSize = args.posebatch
+    flip_test = FlipTest(pose_model, pose_dataset.joint_pairs, args.flip_thresh) if args.flip else None
     if args.flip:
-        batchSize = int(batchSize / 2)
+        batchSize = int(batchSize / flip_test.batch_factor)
+    # webcam frames are posed as they come, offline input fills whole batches
+    deadline = args.posedeadline if args.posedeadline >= 0 else (0 if mode == 'webcam' else None)
+    cascade = build_cascade(cfg, args, pose_model)
+    if cascade is not None:
+        # flip testing happens inside the cascade
+        batcher = PoseBatcher(cascade, batchSize, args.device, deadline=deadline)
+    else:
+        batcher = PoseBatcher(pose_model, batchSize, args.device, deadline=deadline, flip_test=flip_test)
+
+    def save_poses(done):
+        for (inps, orig_img, im_name, boxes, scores, ids, cropped_boxes), hm in done:
+            if hm is None:
+                writer.save(None, None, None, None, None, orig_img, im_name)
+                continue
+            if args.pose_track:
+                boxes,scores,ids,hm,cropped_boxes = track(tracker,args,orig_img,inps.to(args.device),boxes,hm,cropped_boxes,im_name,scores)
+            hm = hm.cpu()
+            writer.save(boxes, scores, ids, hm, cropped_boxes, orig_img, im_name)
+
     try:
         for i in im_names_desc:
             start_time = getTime()
             with torch.no_grad():
-                (inps, orig_img, im_name, boxes, scores, ids, cropped_boxes) = det_loader.read()
-                if orig_img is None:
+                frame = det_loader.read()
+                if frame[1] is None:
                     break
-                if boxes is None or boxes.nelement() == 0:
-                    writer.save(None, None, None, None, None, orig_img, im_name)
-                    continue
                 if args.profile:
                     ckpt_time, det_time = getTime(start_time)
                     runtime_profile['dt'].append(det_time)
-                # Pose Estimation
-                inps = inps.to(args.device)
-                datalen = inps.size(0)
-                leftover = 0
-                if (datalen) % batchSize:
-                    leftover = 1
-                num_batches = datalen // batchSize + leftover
-                hm = []
-                for j in range(num_batches):
-                    inps_j = inps[j * batchSize:min((j + 1) * batchSize, datalen)]
-                    if args.flip:
-                        inps_j = torch.cat((inps_j, flip(inps_j)))
-                    hm_j = pose_model(inps_j)
-                    if args.flip:
-                        hm_j_flip = flip_heatmap(hm_j[int(len(hm_j) / 2):], pose_dataset.joint_pairs, shift=True)
-                        hm_j = (hm_j[0:int(len(hm_j) / 2)] + hm_j_flip) / 2
-                    hm.append(hm_j)
-                hm = torch.cat(hm)
-                if args.profile:
+                # Pose Estimation, once the crops of the held frames fill a batch
+                done = batcher.add(frame)
+                if args.profile and done:
                     ckpt_time, pose_time = getTime(ckpt_time)
                     runtime_profile['pt'].append(pose_time)
-                if args.pose_track:
-                    boxes,scores,ids,hm,cropped_boxes = track(tracker,args,orig_img,inps,boxes,hm,cropped_boxes,im_name,scores)
-                hm = hm.cpu()
-                writer.save(boxes, scores, ids, hm, cropped_boxes, orig_img, im_name)
-                # writer.results()
-                # print('called saved')
-                # print(writer.results)
-                if args.profile:
+                save_poses(done)
+                if args.profile and done:
                     ckpt_time, post_time = getTime(ckpt_time)
                     runtime_profile['pn'].append(post_time)
-                # print(hm.shape)
-                # print(hm[0,:,0,0])
 
-            if args.profile:
+            if args.profile and runtime_profile['pt']:
                 # TQDM
                 im_names_desc.set_description(
                     'det time: {dt:.4f} | pose time: {pt:.4f} | post processing: {pn:.4f}'.format(
                         dt=np.mean(runtime_profile['dt']), pt=np.mean(runtime_profile['pt']), pn=np.mean(runtime_profile['pn']))
                 )
+        with torch.no_grad():
+            save_poses(batcher.flush())
+        if cascade is not None and cascade.num_light:
+            print(f'Cascade: {cascade.num_heavy} of {cascade.num_light} people went through the heavy model')
         print_finish_info()
         while(writer.running()):
             time.sleep(1)
@@ -302,4 +336,6 @@ if __name__ == "__main__":
             writer.terminate()
             writer.clear_queues()
             det_loader.clear_queues()
-
+    finally:
+        if args.pose_workers > 0:
+            pose_model.stop()
@@ -0,0 +1,88 @@
+"""Process a long video as parallel overlapping segments.
+
+The video is cut into --segments ranges of frames that overlap by
+--overlap frames. Every segment runs scripts/demo_inference.py in its own
+process, with its own decoder, detector and pose model, pinned to its own
+share of the cores. The per-segment results are then stitched into one
+alphapose-results.json: track ids (--pose_track / --pose_flow) are matched
+across every overlap with the Hungarian algorithm on pose similarity.
+
+Options not listed here are passed on to demo_inference.py, e.g.
+
+    python scripts/demo_segments.py --video long.mp4 --segments 4 --outdir out/ \\
+        --cfg ... --checkpoint ... --pose_track --gpus -1
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import cv2
+
+from alphapose.utils.pose_workers import partition_cores
+from alphapose.utils.segments import split_segments, stitch_segments
+
+"""----------------------------- Segment options -----------------------------"""
+parser = argparse.ArgumentParser(description='AlphaPose parallel video segments')
+parser.add_argument('--video', type=str, required=True,
+                    help='video-name')
+parser.add_argument('--outdir', dest='outputpath', default='examples/res/',
+                    help='output-directory')
+parser.add_argument('--segments', type=int, default=os.cpu_count(),
+                    help='number of segments processed in parallel')
+parser.add_argument('--overlap', type=int, default=30,
+                    help='frames shared by consecutive segments to match the track ids in')
+parser.add_argument('--min_sim', type=float, default=0.5,
+                    help='min mean pose similarity in the overlap for two tracks to be the same person')
+parser.add_argument('--no_pin', dest='pin', default=True, action='store_false',
+                    help='do not pin the segment processes to disjoint cores')
+args, demo_args = parser.parse_known_args()
+
+
+def main():
+    if '--format' in demo_args:
+        raise ValueError('Segments are stitched from coco records, --format is not supported')
+    stream = cv2.VideoCapture(args.video)
+    assert stream.isOpened(), 'Cannot capture source'
+    num_frames = int(stream.get(cv2.CAP_PROP_FRAME_COUNT))
+    stream.release()
+
+    segments = split_segments(num_frames, args.segments, args.overlap)
+    num_cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    num_threads = max(num_cores // len(segments), 1)
+    cores = partition_cores(len(segments), num_threads)
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, OMP_NUM_THREADS=str(num_threads), MKL_NUM_THREADS=str(num_threads),
+               PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+
+    start_time = time.time()
+    procs, logs, segment_dirs = [], [], []
+    for k, (start, end) in enumerate(segments):
+        segment_dir = os.path.join(args.outputpath, f'segment_{k}')
+        os.makedirs(segment_dir, exist_ok=True)
+        segment_dirs.append(segment_dir)
+        cmd = [sys.executable, os.path.join(root, 'scripts', 'demo_inference.py'), '--video', args.video,
+               '--video_range', str(start), str(end), '--outdir', segment_dir] + demo_args
+        pin = (lambda c=cores[k]: os.sched_setaffinity(0, c)) if args.pin and hasattr(os, 'sched_setaffinity') else None
+        print(f'Segment {k}: frames {start}-{end}')
+        logs.append(open(os.path.join(segment_dir, 'log.txt'), 'w'))
+        procs.append(subprocess.Popen(cmd, env=env, preexec_fn=pin, stdout=logs[-1], stderr=subprocess.STDOUT))
+
+    failed = []
+    for k, (p, log) in enumerate(zip(procs, logs)):
+        if p.wait() != 0:
+            failed.append(k)
+        log.close()
+    if failed:
+        raise RuntimeError('Segments {} failed, see log.txt in their folders'.format(failed))
+    print(f'Processed {num_frames} frames in {len(segments)} segments in {time.time() - start_time:.1f} s')
+
+    num_tracks = stitch_segments([os.path.join(d, 'alphapose-results.jsonl') for d in segment_dirs],
+                                 segments, args.outputpath, min_sim=args.min_sim)
+    print(f'Stitched results of {num_tracks} tracks written to {args.outputpath}')
+
+
+if __name__ == "__main__":
+    main()
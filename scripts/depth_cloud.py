@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import argparse
+
+import numpy as np
+import pyrealsense2 as rs
+import rospy
+from sensor_msgs.msg import PointCloud2
+
+from alphapose.utils.ros_cloud import depth_to_cloud
+
+"""----------------------------- Publish the RealSense workspace cloud -----------------------------"""
+parser = argparse.ArgumentParser(description='Aligned RealSense depth to PointCloud2')
+parser.add_argument('--topic', type=str, default='/workspace_cloud')
+parser.add_argument('--frame', type=str, default='camera_color_optical_frame')
+parser.add_argument('--decimate', type=int, default=2, help='keep every n-th pixel')
+parser.add_argument('--near', type=float, default=0.2, help='nearest depth to keep, in meters')
+parser.add_argument('--far', type=float, default=3.0, help='farthest depth to keep, in meters')
+parser.add_argument('--organized', default=False, action='store_true', help='publish an organized cloud')
+parser.add_argument('--no-color', dest='color', default=True, action='store_false')
+args, _ = parser.parse_known_args()
+
+
+def main():
+    rospy.init_node('workspace_cloud_publisher')
+    pub = rospy.Publisher(args.topic, PointCloud2, queue_size=2)
+
+    pipeline = rs.pipeline()
+    config = rs.config()
+    config.enable_stream(rs.stream.depth, 640, 480, rs.format.z16, 30)
+    config.enable_stream(rs.stream.color, 640, 480, rs.format.bgr8, 30)
+    profile = pipeline.start(config)
+    depth_scale = profile.get_device().first_depth_sensor().get_depth_scale()
+    align = rs.align(rs.stream.color)
+
+    try:
+        while not rospy.is_shutdown():
+            frames = align.process(pipeline.wait_for_frames())
+            depth_frame = frames.get_depth_frame()
+            color_frame = frames.get_color_frame()
+            if not depth_frame or not color_frame:
+                continue
+            intrin = depth_frame.profile.as_video_stream_profile().intrinsics
+            depth = np.asanyarray(depth_frame.get_data())
+            color = np.asanyarray(color_frame.get_data()) if args.color else None
+
+            header = rospy.Header(frame_id=args.frame, stamp=rospy.Time.now())
+            pub.publish(depth_to_cloud(header, depth, intrin, color, depth_scale=depth_scale,
+                                       decimate=args.decimate, z_range=(args.near, args.far),
+                                       organized=args.organized))
+    finally:
+        pipeline.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Export the pose model and the person detectors to ONNX.
+
+The graphs have a dynamic batch axis and the input size of the config.
+Detector graphs include the box decoding, NMS stays in the detector API.
+Run them on cpu with ONNX Runtime:
+
+    pose:      --checkpoint <model>.onnx on any entry point
+    detectors: cfg.ONNX in detector/yolo_cfg.py or detector/yolox_cfg.py
+
+With onnxruntime installed every exported graph is checked against the
+torch model and timed next to it.
+"""
+import argparse
+import os
+import time
+
+import torch
+import torch.nn as nn
+
+from alphapose.models import builder
+from alphapose.models.onnx_backend import export_onnx
+from alphapose.utils.config import update_config
+from detector.apis import get_detector
+
+"""----------------------------- Export options -----------------------------"""
+parser = argparse.ArgumentParser(description='AlphaPose ONNX export')
+parser.add_argument('--cfg', type=str, default='',
+                    help='experiment configure file name, exports the pose model if given')
+parser.add_argument('--checkpoint', type=str, default='',
+                    help='pose checkpoint file name')
+parser.add_argument('--detectors', type=str, nargs='*', default=[],
+                    help='detectors to export, option: yolo/yolox-x/yolox-l/...')
+parser.add_argument('--outdir', type=str, default='',
+                    help='output folder, default next to each checkpoint')
+parser.add_argument('--opset', type=int, default=16,
+                    help='onnx opset, GridSample of the dcn models needs 16')
+parser.add_argument('--no-check', dest='check', default=True, action='store_false',
+                    help='skip the onnxruntime parity check')
+args = parser.parse_args()
+if args.cfg and not args.checkpoint:
+    parser.error('--cfg needs the --checkpoint to export')
+
+args.gpus = [-1]
+args.device = torch.device('cpu')
+args.tracking = False
+
+
+class DarknetExport(nn.Module):
+    """Darknet forward without the args argument."""
+
+    def __init__(self, darknet, opt):
+        super(DarknetExport, self).__init__()
+        self.darknet = darknet
+        self.opt = opt
+
+    def forward(self, x):
+        return self.darknet(x, self.opt)
+
+
+def onnx_path(weights):
+    path = os.path.splitext(weights)[0] + '.onnx'
+    if args.outdir:
+        os.makedirs(args.outdir, exist_ok=True)
+        path = os.path.join(args.outdir, os.path.basename(path))
+    return path
+
+
+def latency(m, x, iters=5):
+    with torch.no_grad():
+        m(x)
+        start = time.time()
+        for _ in range(iters):
+            m(x)
+    return (time.time() - start) / iters * 1000
+
+
+def check(model, path, input_size):
+    try:
+        from alphapose.models.onnx_backend import OnnxModel
+        session = OnnxModel(path)
+    except ImportError:
+        print('onnxruntime not installed, no parity check')
+        return
+    # a different batch size than the export one, to check the dynamic axis
+    x = torch.rand(2, 3, *input_size)
+    with torch.no_grad():
+        ref, out = model(x), session(x)
+    err = (ref - out).abs().max().item() / max(ref.abs().max().item(), 1.)
+    print(f'{path}: max rel err {err:.2e}, batch 2 cpu latency torch {latency(model, x):.1f} ms, '
+          f'onnxruntime {latency(session, x):.1f} ms')
+
+
+def export(model, path, input_size):
+    model = model.cpu().eval()
+    export_onnx(model, torch.rand(1, 3, *input_size), path, opset=args.opset)
+    print(f'Saved {path}')
+    if args.check:
+        check(model, path, input_size)
+
+
+def main():
+    if args.cfg:
+        cfg = update_config(args.cfg)
+        pose_model = builder.build_sppe(cfg.MODEL, preset_cfg=cfg.DATA_PRESET, checkpoint=args.checkpoint)
+        export(pose_model, onnx_path(args.checkpoint), cfg.DATA_PRESET.IMAGE_SIZE)
+
+    for name in args.detectors:
+        args.detector = name
+        detector = get_detector(args)
+        # export the torch model even when the cfg already points to an onnx graph
+        detector.onnx = ''
+        detector.load_model()
+        if name == 'yolo':
+            export(DarknetExport(detector.model, args), onnx_path(detector.model_weights),
+                   (detector.inp_dim, detector.inp_dim))
+        else:
+            export(detector.model, onnx_path(detector.model_weights), (detector.inp_dim, detector.inp_dim))
+
+
+if __name__ == "__main__":
+    main()
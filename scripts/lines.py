@@ -1,17 +1,15 @@
 #!/usr/bin/env python
 
 import rospy
+import numpy as np
 from visualization_msgs.msg import Marker
 from std_msgs.msg import Float32MultiArray
-from geometry_msgs.msg import Point
+
+from alphapose.utils.ros_cloud import to_points
 
 def point_pairs_cb(msg):
-    # Convert received message to list of tuples representing point pairs
-    point_pairs = []
-    for i in range(0, len(msg.data), 6):
-        point1 = (msg.data[i], msg.data[i+1], msg.data[i+2])
-        point2 = (msg.data[i+3], msg.data[i+4], msg.data[i+5])
-        point_pairs.append((point1, point2))
+    # Received message holds point pairs (x1, y1, z1, x2, y2, z2) back to back
+    point_pairs = np.asarray(msg.data, dtype=np.float64).reshape(-1, 3)
 
     # Create Marker message for line strip
     line_strip_msg = Marker()
@@ -28,10 +26,7 @@ def point_pairs_cb(msg):
     line_strip_msg.color.a = 1.0 # Line alpha (opacity)
 
     # Update the points of the line strip
-    points = []
-    for point_pair in point_pairs:
-        points.extend([Point(x=p[0], y=p[1], z=p[2]) for p in point_pair])
-    line_strip_msg.points = points
+    line_strip_msg.points = to_points(point_pairs)
 
     # Publish the line strip to marker topic
     line_strip_msg.header.stamp = rospy.Time.now()
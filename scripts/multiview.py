@@ -0,0 +1,109 @@
+"""Multi-camera 3D keypoints: batched pose on all views, cross-view association and fusion."""
+import argparse
+
+import numpy as np
+import torch
+
+from alphapose.utils.calibration import load_extrinsics
+from alphapose.utils.config import update_config
+from alphapose.utils.multiview import (CameraModel, MultiCameraCapture, Recorder, ReplayCapture,
+                                       associate, fuse)
+from alphapose.utils.stream_writer import to_numpy
+from detector.apis import get_detector
+
+"""----------------------------- Multi-view options -----------------------------"""
+parser = argparse.ArgumentParser(description='AlphaPose Multi-Camera Fusion')
+parser.add_argument('--cfg', type=str, default='configs/halpe_coco_wholebody_136/resnet/256x192_res50_lr1e-3_2x-dcn-combined.yaml',
+                    help='experiment configure file name')
+parser.add_argument('--checkpoint', type=str, default='pretrained_models/multi_domain_fast50_dcn_combined_256x192.pth',
+                    help='checkpoint file name')
+parser.add_argument('--detector', dest='detector',
+                    help='detector name', default="yolo")
+parser.add_argument('--serials', type=str, nargs='*', default=[],
+                    help='RealSense serial numbers, one per view')
+parser.add_argument('--calib', type=str, nargs='*', default=[],
+                    help='camera to world calibration json per view, in the order of --serials')
+parser.add_argument('--replay', type=str, default='',
+                    help='replay a recording instead of opening cameras')
+parser.add_argument('--record', type=str, default='',
+                    help='record the matched views to this directory')
+parser.add_argument('--method', type=str, default='triangulate',
+                    help='fusion method, option: triangulate/depth')
+parser.add_argument('--max_skew', type=float, default=20.,
+                    help='max timestamp difference in ms between views of one set')
+parser.add_argument('--posebatch', type=int, default=64,
+                    help='max number of person crops per pose forward')
+parser.add_argument('--min_box_area', type=int, default=0,
+                    help='min box area to filter out')
+parser.add_argument('--gpus', type=str, dest='gpus', default="0",
+                    help='choose which cuda device to use by index (input -1 for cpu only)')
+parser.add_argument('--flip', default=False, action='store_true',
+                    help='enable flip testing')
+parser.add_argument('--flip_thresh', type=float, default=0,
+                    help='flip test only the people with a mean keypoint score below this, 0 flips everyone')
+parser.add_argument('--ros', default=False, action='store_true',
+                    help='publish fused keypoints on /fused_coords')
+args = parser.parse_args()
+cfg = update_config(args.cfg)
+
+args.gpus = [int(args.gpus[0])] if torch.cuda.device_count() >= 1 else [-1]
+args.device = torch.device("cuda:" + str(args.gpus[0]) if args.gpus[0] >= 0 else "cpu")
+args.tracking = False
+
+
+def main():
+    from alphapose.utils.pose_server import PoseService
+
+    if args.replay:
+        capture = ReplayCapture(args.replay)
+        cameras = capture.cameras
+    else:
+        assert len(args.calib) == len(args.serials), 'one --calib file per camera is needed'
+        capture = MultiCameraCapture(args.serials, max_skew=args.max_skew)
+        cameras = [CameraModel(intrin, load_extrinsics(calib), depth_scale=scale)
+                   for intrin, calib, scale in zip(capture.intrinsics, args.calib, capture.depth_scales)]
+    recorder = Recorder(args.record, cameras) if args.record else None
+
+    pub = None
+    if args.ros:
+        import rospy
+        from std_msgs.msg import Float32MultiArray
+        rospy.init_node('multiview')
+        pub = rospy.Publisher('/fused_coords', Float32MultiArray, queue_size=10)
+
+    service = PoseService(cfg, args, get_detector(args))
+    frame = 0
+    try:
+        while True:
+            views = capture.read()
+            if views is None:
+                break
+            if recorder is not None:
+                recorder.write(views)
+            images = [color for color, _, _ in views]
+            depths = [depth for _, depth, _ in views]
+            # all views in one detector and pose forward
+            results = service.process(images, ['view%d_%06d' % (v, frame) for v in range(len(views))])
+            poses = []
+            for res in results:
+                if len(res['result']):
+                    poses.append((np.stack([to_numpy(h['keypoints']) for h in res['result']]),
+                                  np.stack([to_numpy(h['kp_score']).reshape(-1) for h in res['result']])))
+                else:
+                    poses.append((np.zeros((0, 0, 2)), np.zeros((0, 0))))
+            if any(len(k) for k, _ in poses):
+                clusters = associate(cameras, poses, depths)
+                world, conf = fuse(cameras, poses, clusters, depths, method=args.method)
+                print('frame %d: %d people from %d views' % (frame, len(clusters), len(views)))
+                if pub is not None:
+                    from std_msgs.msg import Float32MultiArray
+                    msg = Float32MultiArray()
+                    msg.data = np.nan_to_num(world).astype(np.float32).ravel().tolist()
+                    pub.publish(msg)
+            frame += 1
+    finally:
+        capture.release()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Serve AlphaPose to several local clients with dynamic micro-batching."""
+import argparse
+import asyncio
+import os
+
+import torch
+
+from alphapose.utils.config import update_config
+from alphapose.utils.pose_server import PoseServer, PoseService
+from detector.apis import get_detector
+
+"""----------------------------- Server options -----------------------------"""
+parser = argparse.ArgumentParser(description='AlphaPose Inference Server')
+parser.add_argument('--cfg', type=str, default='configs/halpe_coco_wholebody_136/resnet/256x192_res50_lr1e-3_2x-dcn-combined.yaml',
+                    help='experiment configure file name')
+parser.add_argument('--checkpoint', type=str, default='pretrained_models/multi_domain_fast50_dcn_combined_256x192.pth',
+                    help='checkpoint file name')
+parser.add_argument('--detector', dest='detector',
+                    help='detector name', default="yolo")
+parser.add_argument('--socket', type=str, default='/tmp/alphapose.sock',
+                    help='unix socket to listen on, pass an empty string to use --port instead')
+parser.add_argument('--port', type=int, default=8765,
+                    help='localhost tcp port, used when --socket is empty')
+parser.add_argument('--max_batch', type=int, default=8,
+                    help='max number of frames run in one detector/pose forward')
+parser.add_argument('--max_delay', type=float, default=0.005,
+                    help='max time in seconds a frame waits for others to join its batch')
+parser.add_argument('--posebatch', type=int, default=64,
+                    help='max number of person crops per pose forward')
+parser.add_argument('--format', type=str,
+                    help='result format, option: coco/cmu/open')
+parser.add_argument('--min_box_area', type=int, default=0,
+                    help='min box area to filter out')
+parser.add_argument('--gpus', type=str, dest='gpus', default="0",
+                    help='choose which cuda device to use by index (input -1 for cpu only)')
+parser.add_argument('--flip', default=False, action='store_true',
+                    help='enable flip testing')
+parser.add_argument('--flip_thresh', type=float, default=0,
+                    help='flip test only the people with a mean keypoint score below this, 0 flips everyone')
+args = parser.parse_args()
+cfg = update_config(args.cfg)
+
+args.gpus = [int(args.gpus[0])] if torch.cuda.device_count() >= 1 else [-1]
+args.device = torch.device("cuda:" + str(args.gpus[0]) if args.gpus[0] >= 0 else "cpu")
+args.tracking = False
+
+
+if __name__ == "__main__":
+    service = PoseService(cfg, args, get_detector(args))
+    server = PoseServer(service, max_batch=args.max_batch, max_delay=args.max_delay, form=args.format)
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        print(f'Serving on {args.socket}')
+        asyncio.run(server.serve(path=args.socket))
+    else:
+        print(f'Serving on 127.0.0.1:{args.port}')
+        asyncio.run(server.serve(port=args.port))
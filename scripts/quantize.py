@@ -0,0 +1,255 @@
+"""Post-training int8 quantization of a pose checkpoint.
+
+Calibrates on crops of recorded frames (image folder or video, people found
+by the detector) or on ground truth crops of the validation set, writes a
+checkpoint that loads through the usual --checkpoint option, and reports
+the per-joint accuracy of the float and the int8 model on validation crops.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+import torch
+from tqdm import tqdm
+
+from alphapose.models import builder
+from alphapose.models.quantize import quantize_model, save_quantized
+from alphapose.utils.config import update_config
+from alphapose.utils.metrics import calc_accuracy, calc_dist, dist_acc, evaluate_mAP
+from alphapose.utils.transforms import get_func_heatmap_to_coord, get_max_pred_batch
+
+"""----------------------------- Quantization options -----------------------------"""
+parser = argparse.ArgumentParser(description='AlphaPose int8 Quantization')
+parser.add_argument('--cfg', type=str, required=True,
+                    help='experiment configure file name')
+parser.add_argument('--checkpoint', type=str, required=True,
+                    help='float checkpoint file name')
+parser.add_argument('--outfile', type=str, default='',
+                    help='int8 checkpoint, default <checkpoint>_int8.pth')
+parser.add_argument('--calib', type=str, default='',
+                    help='image folder or video of recorded sessions to calibrate on, the validation set is used if empty')
+parser.add_argument('--num_calib', type=int, default=300,
+                    help='number of calibration crops')
+parser.add_argument('--num_eval', type=int, default=500,
+                    help='number of validation crops for the per-joint accuracy, 0 to skip')
+parser.add_argument('--map', default=False, action='store_true',
+                    help='also compare the ground truth box mAP on the whole validation set')
+parser.add_argument('--backend', type=str, default='x86',
+                    help='quantized engine, option: x86/fbgemm/qnnpack')
+parser.add_argument('--detector', dest='detector',
+                    help='detector name', default="yolo")
+parser.add_argument('--batch', type=int, default=32,
+                    help='batch size')
+parser.add_argument('--num_workers', type=int, default=4,
+                    help='validation dataloader number of workers')
+args = parser.parse_args()
+cfg = update_config(args.cfg)
+
+# int8 kernels are cpu only
+args.gpus = [-1]
+args.device = torch.device('cpu')
+args.tracking = False
+
+
+def val_loader(batch_size):
+    dataset = builder.build_dataset(cfg.DATASET.VAL, preset_cfg=cfg.DATA_PRESET, train=False)
+    loader = torch.utils.data.DataLoader(
+        dataset, batch_size=batch_size, shuffle=False, num_workers=args.num_workers, drop_last=False)
+    return dataset, loader
+
+
+def val_crops(num):
+    _, loader = val_loader(args.batch)
+    count = 0
+    for inps, _, _, _, _ in loader:
+        yield inps[:num - count]
+        count += len(inps)
+        if count >= num:
+            break
+
+
+def read_frames(source):
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if os.path.splitext(name)[1].lower() in ('.jpg', '.jpeg', '.png', '.bmp'):
+                yield cv2.cvtColor(cv2.imread(os.path.join(source, name)), cv2.COLOR_BGR2RGB)
+    else:
+        stream = cv2.VideoCapture(source)
+        while True:
+            grabbed, frame = stream.read()
+            if not grabbed:
+                break
+            yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        stream.release()
+
+
+def recorded_crops(source, num):
+    from alphapose.utils.presets import SimpleTransform
+    from detector.apis import get_detector
+
+    detector = get_detector(args)
+    transformation = SimpleTransform(
+        builder.retrieve_dataset(cfg.DATASET.TRAIN), scale_factor=0,
+        input_size=cfg.DATA_PRESET.IMAGE_SIZE, output_size=cfg.DATA_PRESET.HEATMAP_SIZE,
+        rot=0, sigma=cfg.DATA_PRESET.SIGMA, train=False, add_dpg=False, gpu_device=args.device)
+    batch, count = [], 0
+    with torch.no_grad():
+        for frame in read_frames(source):
+            img = detector.image_preprocess(frame)
+            if isinstance(img, np.ndarray):
+                img = torch.from_numpy(img)
+            if img.dim() == 3:
+                img = img.unsqueeze(0)
+            dets = detector.images_detection(img, torch.FloatTensor([[frame.shape[1], frame.shape[0]]]).repeat(1, 2))
+            if isinstance(dets, int) or dets.shape[0] == 0:
+                continue
+            for box in dets[:, 1:5]:
+                batch.append(transformation.test_transform(frame, box)[0])
+                count += 1
+                if len(batch) == args.batch or count == num:
+                    yield torch.stack(batch)
+                    batch = []
+                if count == num:
+                    return
+    if batch:
+        yield torch.stack(batch)
+
+
+def heatmap_labels(labels):
+    # Combined loss: only the body joints are supervised with heatmaps
+    return labels[0] if isinstance(labels, list) else labels
+
+
+def per_joint_accuracy(float_model, int8_model, num):
+    """Per-joint accuracy of both models against the heatmap labels, and their agreement."""
+    _, loader = val_loader(args.batch)
+    dists_float, dists_int8, dists_agree = [], [], []
+    acc_float, acc_int8, count = 0., 0., 0
+    with torch.no_grad():
+        for inps, labels, _, _, _ in tqdm(loader, dynamic_ncols=True):
+            inps = inps[:num - count]
+            labels = heatmap_labels(labels)[:num - count]
+            out_float = float_model(inps)
+            out_int8 = int8_model(inps)
+            k = labels.shape[1]
+            acc_float += calc_accuracy(out_float[:, :k], labels) * len(inps)
+            acc_int8 += calc_accuracy(out_int8[:, :k], labels) * len(inps)
+
+            pred_float, _ = get_max_pred_batch(out_float.numpy())
+            pred_int8, _ = get_max_pred_batch(out_int8.numpy())
+            gt, _ = get_max_pred_batch(labels.numpy())
+            hm_h, hm_w = out_float.shape[2:]
+            norm = np.ones((len(inps), 2)) * np.array([hm_w, hm_h]) / 10
+            dists_float.append(calc_dist(pred_float[:, :k], gt, norm))
+            dists_int8.append(calc_dist(pred_int8[:, :k], gt, norm))
+            # distance of the int8 peaks to the float ones, (K, N) like calc_dist
+            dists_agree.append(np.linalg.norm((pred_int8 - pred_float) / norm[:, None], axis=-1).T)
+            count += len(inps)
+            if count >= num:
+                break
+    dists_float = np.concatenate(dists_float, axis=1)
+    dists_int8 = np.concatenate(dists_int8, axis=1)
+    dists_agree = np.concatenate(dists_agree, axis=1)
+
+    print(f'\nAccuracy on {count} validation crops: float {acc_float / count:.4f}, int8 {acc_int8 / count:.4f}')
+    print('%-6s %8s %8s %8s %8s' % ('joint', 'float', 'int8', 'delta', 'agree'))
+    for j in range(dists_agree.shape[0]):
+        agree = dist_acc(dists_agree[j])
+        if j < dists_float.shape[0] and dist_acc(dists_float[j]) >= 0:
+            a, b = dist_acc(dists_float[j]), dist_acc(dists_int8[j])
+            print('%-6d %8.4f %8.4f %+8.4f %8.4f' % (j, a, b, b - a, agree))
+        else:
+            print('%-6d %8s %8s %8s %8.4f' % (j, '-', '-', '-', agree))
+
+
+def gt_box_map(m, name):
+    """mAP with ground truth boxes, as validate_gt in scripts/train.py."""
+    dataset, loader = val_loader(args.batch)
+    heatmap_to_coord = get_func_heatmap_to_coord(cfg)
+    norm_type = cfg.LOSS.get('NORM_TYPE', None)
+    hm_size = cfg.DATA_PRESET.HEATMAP_SIZE
+    combined_loss = (cfg.LOSS.get('TYPE') == 'Combined')
+    halpe = (cfg.DATA_PRESET.NUM_JOINTS == 133) or (cfg.DATA_PRESET.NUM_JOINTS == 136)
+    eval_joints = dataset.EVAL_JOINTS
+
+    kpt_json = []
+    with torch.no_grad():
+        for inps, _, _, img_ids, bboxes in tqdm(loader, dynamic_ncols=True):
+            output = m(inps)
+            pred = output[:, eval_joints, :, :]
+            face_hand_num = 42 if output.size()[1] == 68 else 110
+            for i in range(output.shape[0]):
+                bbox = bboxes[i].tolist()
+                if combined_loss:
+                    pose_coords_body_foot, pose_scores_body_foot = heatmap_to_coord[0](
+                        pred[i][eval_joints[:-face_hand_num]], bbox, hm_shape=hm_size, norm_type=norm_type)
+                    pose_coords_face_hand, pose_scores_face_hand = heatmap_to_coord[1](
+                        pred[i][eval_joints[-face_hand_num:]], bbox, hm_shape=hm_size, norm_type=norm_type)
+                    pose_coords = np.concatenate((pose_coords_body_foot, pose_coords_face_hand), axis=0)
+                    pose_scores = np.concatenate((pose_scores_body_foot, pose_scores_face_hand), axis=0)
+                else:
+                    pose_coords, pose_scores = heatmap_to_coord(
+                        pred[i][eval_joints], bbox, hm_shape=hm_size, norm_type=norm_type)
+                keypoints = np.concatenate((pose_coords, pose_scores), axis=1)
+                kpt_json.append({
+                    'bbox': bbox,
+                    'image_id': int(img_ids[i]),
+                    'score': float(np.mean(pose_scores) + 1.25 * np.max(pose_scores)),
+                    'category_id': 1,
+                    'keypoints': keypoints.reshape(-1).tolist()
+                })
+
+    res_file = f'./exp/json/quantize_{name}_gt_kpt.json'
+    os.makedirs(os.path.dirname(res_file), exist_ok=True)
+    with open(res_file, 'w') as fid:
+        json.dump(kpt_json, fid)
+    sysout = sys.stdout
+    res = evaluate_mAP(res_file, ann_type='keypoints', ann_file=os.path.join(cfg.DATASET.VAL.ROOT, cfg.DATASET.VAL.ANN), halpe=halpe)
+    sys.stdout = sysout
+    return res
+
+
+def latency(m, batch=8, iters=10):
+    x = torch.randn(batch, 3, *cfg.DATA_PRESET.IMAGE_SIZE)
+    with torch.no_grad():
+        m(x)
+        start = time.time()
+        for _ in range(iters):
+            m(x)
+    return (time.time() - start) / iters * 1000
+
+
+def main():
+    print(f'Loading pose model from {args.checkpoint}...')
+    float_model = builder.build_sppe(cfg.MODEL, preset_cfg=cfg.DATA_PRESET, checkpoint=args.checkpoint).eval()
+
+    if args.calib:
+        calib = recorded_crops(args.calib, args.num_calib)
+    else:
+        calib = val_crops(args.num_calib)
+    int8_model = quantize_model(float_model, calib, cfg.DATA_PRESET.IMAGE_SIZE, backend=args.backend)
+
+    outfile = args.outfile or os.path.splitext(args.checkpoint)[0] + '_int8.pth'
+    save_quantized(int8_model, outfile, cfg.DATA_PRESET.IMAGE_SIZE, backend=args.backend)
+    print(f'Saved int8 model to {outfile}')
+
+    t_float, t_int8 = latency(float_model), latency(int8_model)
+    print(f'cpu latency, batch 8: float {t_float:.1f} ms, int8 {t_int8:.1f} ms ({t_float / t_int8:.2f}x)')
+
+    if args.num_eval > 0:
+        per_joint_accuracy(float_model, int8_model, args.num_eval)
+    if args.map:
+        float_map, int8_map = gt_box_map(float_model, 'float'), gt_box_map(int8_model, 'int8')
+        if isinstance(float_map, dict):
+            for key in float_map:
+                print(f'{key} mAP: float {float_map[key]:.4f}, int8 {int8_map[key]:.4f}')
+        else:
+            print(f'mAP: float {float_map:.4f}, int8 {int8_map:.4f} ({int8_map - float_map:+.4f})')
+
+
+if __name__ == "__main__":
+    main()
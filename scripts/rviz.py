@@ -1,21 +1,19 @@
 #!/usr/bin/env python
 
 import rospy
+import numpy as np
 from std_msgs.msg import Float32MultiArray
 from sensor_msgs.msg import PointCloud2
-from sensor_msgs import point_cloud2
+
+from alphapose.utils.ros_cloud import create_cloud
 
 def callback(data):
-    # Convert Float32MultiArray to list of tuples
-    n_points = len(data.data) // 3
-    points = [tuple(data.data[i:i+3]) for i in range(0, len(data.data), 3)]
+    # Float32MultiArray holds x, y, z of every point back to back
+    points = np.asarray(data.data, dtype=np.float32).reshape(-1, 3)
 
     # Set up PointCloud2 message
     header = rospy.Header(frame_id='map')
-    fields = [point_cloud2.PointField(name='x', offset=0, datatype=7, count=1),
-              point_cloud2.PointField(name='y', offset=4, datatype=7, count=1),
-              point_cloud2.PointField(name='z', offset=8, datatype=7, count=1)]
-    cloud = point_cloud2.create_cloud(header, fields, points)
+    cloud = create_cloud(header, points)
 
     # Publish PointCloud2 message
     pub.publish(cloud)
@@ -8,6 +8,7 @@ from tqdm import tqdm
 import sys
 
 from alphapose.models import builder
+from alphapose.models.optimize import optimize_from_cfg
 from alphapose.utils.config import update_config
 from alphapose.utils.metrics import evaluate_mAP
 from alphapose.utils.transforms import (flip, flip_heatmap,
@@ -252,10 +253,10 @@ def validate_gt(m, cfg, heatmap_to_coord, batch_size=20, num_workers=20):
 
 
 if __name__ == "__main__":
-    m = builder.build_sppe(cfg.MODEL, preset_cfg=cfg.DATA_PRESET)
-
     print(f'Loading model from {opt.checkpoint}...')
-    m.load_state_dict(torch.load(opt.checkpoint))
+    m = builder.build_sppe(cfg.MODEL, preset_cfg=cfg.DATA_PRESET, checkpoint=opt.checkpoint, device=opt.device)
+    m = optimize_from_cfg(m, cfg.MODEL.get('OPTIMIZE', False),
+                          (torch.randn(1, 3, *cfg.DATA_PRESET.IMAGE_SIZE, device=opt.device),), name='pose model')
 
     m = torch.nn.DataParallel(m, device_ids=gpus).cuda()
     heatmap_to_coord = get_func_heatmap_to_coord(cfg)
@@ -14,6 +14,7 @@ from collections import deque
 import itertools
 import os.path as osp
 import time
+import cv2
 import torch
 import torch.nn.functional as F
 import torch.nn as nn
@@ -29,6 +30,9 @@ from ReidModels.osnet import *
 from ReidModels.osnet_ain import osnet_ain_x1_0
 from ReidModels.resnet_fc import resnet50_fc512
 
+REID_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+REID_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
 class STrack(BaseTrack):
     shared_kalman = KalmanFilter()
 
@@ -44,7 +48,10 @@ class STrack(BaseTrack):
         self.tracklet_len = 0
 
         self.smooth_feat = None
-        self.update_features(temp_feat)
+        self.curr_feat = None
+        self.feat_frame = 0
+        if temp_feat is not None:
+            self.update_features(temp_feat)
         self.features = deque([], maxlen=buffer_size)
         self.alpha = 0.9 
         self.pose = pose
@@ -93,6 +100,7 @@ class STrack(BaseTrack):
         #self.is_activated = True
         self.frame_id = frame_id
         self.start_frame = frame_id
+        self.feat_frame = frame_id
 
     def re_activate(self, new_track, frame_id, new_id=False):
         self.mean, self.covariance = self.kalman_filter.update(
@@ -100,6 +108,7 @@ class STrack(BaseTrack):
         )
 
         self.update_features(new_track.curr_feat)
+        self.feat_frame = frame_id
         self.tracklet_len = 0
         self.state = TrackState.Tracked
         self.is_activated = True
@@ -134,6 +143,7 @@ class STrack(BaseTrack):
         self.score = new_track.score
         if update_feature:
             self.update_features(new_track.curr_feat)
+            self.feat_frame = frame_id
 
     @property
     #@jit(nopython=True)
@@ -203,6 +213,7 @@ class Tracker(object):
             m = osnet_ain_x1_0(num_classes=1,pretrained=False)
         
         self.model = nn.DataParallel(m,device_ids=args.gpus).to(args.device).eval()
+        self.device = args.device
         
         load_pretrained_weights(self.model,self.opt.loadmodel)
         self.tracked_stracks = []  # type: list[STrack]
@@ -227,8 +238,13 @@ class Tracker(object):
         ''' Step 1: Network forward, get human identity embedding''' 
         assert len(inps)==len(bboxs),'Unmatched Length Between Inps and Bboxs'
         assert len(inps)==len(pose),'Unmatched Length Between Inps and Heatmaps'  
-        with torch.no_grad():
-            feats = self.model(inps).cpu().numpy()
+        adaptive = self.opt.reid_mode == 'adaptive'
+        if adaptive:
+            # embeddings are computed lazily in Step 2, only where they are needed
+            feats = [None] * len(bboxs)
+        else:
+            with torch.no_grad():
+                feats = self.model(inps).cpu().numpy()
         bboxs = np.asarray(bboxs)
         if len(bboxs)>0:
             detections = [STrack(STrack.tlbr_to_tlwh(tlbrs[:]), 0.9, f,p,c,file_name,ps,30) for
@@ -247,6 +263,11 @@ class Tracker(object):
         ###joint track with bbox-iou
         strack_pool = joint_stracks(tracked_stracks, self.lost_stracks)
         STrack.multi_predict(strack_pool)
+
+        ''' Step 2: Motion and IoU association first, ReID only for the ambiguous rest'''
+        if adaptive:
+            strack_pool, detections = self.associate_unambiguous(img0, strack_pool, detections, activated_starcks)
+
         dists_emb = embedding_distance(strack_pool, detections)
         dists_emb = fuse_motion(self.kalman_filter, dists_emb, strack_pool, detections)
         matches, u_track, u_detection = linear_assignment(dists_emb, thresh=0.7)
@@ -327,6 +348,82 @@ class Tracker(object):
             logger.debug('Removed: {}'.format([track.track_id for track in removed_stracks]))
         return output_stracks
 
+    def associate_unambiguous(self, img0, strack_pool, detections, activated_starcks):
+        """
+        Match detections that motion and IoU alone assign unambiguously and
+        compute ReID embeddings only where they are needed
+        :type strack_pool: list[STrack]
+        :type detections: list[STrack]
+        :type activated_starcks: list[STrack]
+        :return: remaining tracks and detections for the embedding association
+        """
+        pairs = []
+        if len(strack_pool) > 0 and len(detections) > 0:
+            thresh = self.opt.ambiguity_iou
+            overlap_td = 1 - iou_distance(strack_pool, detections)
+            overlap_td = gate_cost_matrix(self.kalman_filter, overlap_td, strack_pool, detections)
+            overlap_td[~np.isfinite(overlap_td)] = 0
+            tracked = np.array([t.state == TrackState.Tracked for t in strack_pool])
+            cand = (overlap_td > thresh) & tracked[:, None]
+            # people crossing each other need identity cues even if one track fits
+            overlap_dd = 1 - iou_distance(detections, detections)
+            np.fill_diagonal(overlap_dd, 0)
+            crowded = (overlap_dd > thresh).any(axis=1)
+            rows = cand.argmax(axis=0)
+            unique = (cand.sum(axis=0) == 1) & (cand.sum(axis=1)[rows] == 1) & ~crowded
+            for idet in np.flatnonzero(unique):
+                itracked = rows[idet]
+                if overlap_td[itracked, idet] >= self.opt.iou_thres:
+                    pairs.append((itracked, idet))
+
+        matched_t = set(itracked for itracked, _ in pairs)
+        matched_d = set(idet for _, idet in pairs)
+        # ambiguous, re-entering and new detections, plus stale tracks due for a refresh
+        to_embed = [d for idet, d in enumerate(detections) if idet not in matched_d]
+        to_embed += [detections[idet] for itracked, idet in pairs
+                     if self.frame_id - strack_pool[itracked].feat_frame >= self.opt.reid_interval]
+        self.embed(img0, to_embed)
+
+        for itracked, idet in pairs:
+            track = strack_pool[itracked]
+            det = detections[idet]
+            track.update(det, self.frame_id, update_feature=det.curr_feat is not None)
+            activated_starcks.append(track)
+
+        strack_pool = [t for i, t in enumerate(strack_pool) if i not in matched_t]
+        detections = [d for i, d in enumerate(detections) if i not in matched_d]
+        return strack_pool, detections
+
+    def embed(self, img0, detections):
+        """
+        Run the ReID network on one batch of crops at its native resolution
+        :type detections: list[STrack]
+        """
+        if len(detections) == 0:
+            return
+        crops = self.reid_crops(img0, [det.tlbr for det in detections])
+        with torch.no_grad():
+            feats = self.model(crops).cpu().numpy()
+        for det, f in zip(detections, feats):
+            det.update_features(f)
+
+    def reid_crops(self, img0, tlbrs):
+        """
+        Crop and resize boxes of an RGB image to the ReID input size
+        :type img0: np.ndarray
+        :type tlbrs: list[tlbr]
+        :rtype torch.Tensor
+        """
+        h, w = self.opt.reid_size
+        height, width = img0.shape[:2]
+        batch = np.empty((len(tlbrs), h, w, 3), dtype=np.float32)
+        for i, tlbr in enumerate(tlbrs):
+            x1, y1 = np.clip(np.floor(tlbr[:2]), 0, [width - 1, height - 1]).astype(int)
+            x2, y2 = np.clip(np.ceil(tlbr[2:]), [x1 + 1, y1 + 1], [width, height]).astype(int)
+            batch[i] = cv2.resize(img0[y1:y2, x1:x2], (w, h), interpolation=cv2.INTER_LINEAR)
+        batch = (batch / 255. - REID_MEAN) / REID_STD
+        return torch.from_numpy(batch).permute(0, 3, 1, 2).contiguous().to(self.device)
+
 def joint_stracks(tlista, tlistb):
     exists = {}
     res = []
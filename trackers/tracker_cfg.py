@@ -8,3 +8,7 @@ cfg.track_buffer = 240
 cfg.conf_thres = 0.5
 cfg.nms_thres = 0.4
 cfg.iou_thres = 0.5
+cfg.reid_mode = "adaptive" # "adaptive" or "always"
+cfg.reid_interval = 10 # frames before an unambiguous track refreshes its embedding
+cfg.reid_size = (256, 128) # native (height, width) of the ReID models
+cfg.ambiguity_iou = 0.3